@@ -5,6 +5,7 @@ class MultiAgentState(TypedDict):
     chat_history: List[dict]
     generated_prompt: str
     sql_query: str
+    executed_sql: str
     retrieved_data: List[dict]
     formatted_context: str
     answer: str
@@ -12,4 +13,9 @@ class MultiAgentState(TypedDict):
     parent_student_id: str
     access_denied: bool
     user_type: str
-    chart_data: dict
\ No newline at end of file
+    chart_data: dict
+    speculation: str
+    conversation_id: str
+    result_transform: dict
+    answered_from: str
+    sql_reused: bool
\ No newline at end of file
@@ -1,15 +1,12 @@
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain.chat_models import init_chat_model
 from utils.chart_generator import detect_chart_request, generate_chart_data
 from utils.suggestion_generator import generate_smart_suggestions
+from utils.llm_client import invoke_llm
 from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize LLM
-llm = init_chat_model(Config.LLM_MODEL, model_provider=Config.LLM_PROVIDER)
-
 def answer_generator_agent(state):
     """Agent 3: Generate answer based on retrieved data, user question, and chat history"""
     question = state["question"]
@@ -19,9 +16,9 @@ def answer_generator_agent(state):
     parent_student_id = state.get("parent_student_id", None)
     access_denied = state.get("access_denied", False)
     
-    logger.info(f"=== ANSWER GENERATOR AGENT ===")
-    logger.info(f"Processing {len(retrieved_data)} records with chat history of {len(chat_history)} messages")
-    logger.info(f"Access denied: {access_denied}")
+    logger.info("=== ANSWER GENERATOR AGENT ===")
+    logger.info("Processing %d records with chat history of %d messages", len(retrieved_data), len(chat_history))
+    logger.info("Access denied: %s", access_denied)
     
     # Check for access denied
     if access_denied or (retrieved_data and len(retrieved_data) > 0 and retrieved_data[0].get("error") == "ACCESS_DENIED"):
@@ -123,7 +120,7 @@ def answer_generator_agent(state):
             HumanMessage(content=answer_prompt)
         ]
         
-        response = llm.invoke(messages)
+        response = invoke_llm(messages, agent="answer_generator")
         answer = response.content.strip()
         
         # Generate chart data if requested
@@ -143,7 +140,7 @@ def answer_generator_agent(state):
         }
         
     except Exception as e:
-        logger.error(f"Error in Answer Generator Agent: {e}")
+        logger.error("Error in Answer Generator Agent: %s", e)
         return {
             "answer": f"I retrieved {len(retrieved_data)} records but encountered an issue processing them. Please try a more specific question.",
             "suggested_questions": "1. Ask about a specific student\n2. Try a more focused query\n3. Check system status"
@@ -1,79 +1,175 @@
-from database.db_connection import get_db_connection
+from database.db_connection import pooled_db_connection
+from database.query_cache import query_result_cache
+from database.snapshot import snapshot_store
+from utils.sql_example_index import sql_example_index
+from utils.sql_canonicalizer import parse_sql, SQLParseError, SQLRewriteError
+from utils.logging_setup import payload_logging_enabled
+from utils.llm_client import is_synthetic_request
+from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _query_backend():
+    return "duckdb" if Config.QUERY_BACKEND == "duckdb" and snapshot_store.is_available() else "postgres"
+
+def result_cache_key(parsed_query, backend=None):
+    """Result cache key for ``parsed_query`` on ``backend`` (the current one by default).
+
+    The backends name unaliased columns differently (DuckDB returns
+    STRING_AGG as listagg), so their rows are cached separately.
+    """
+    return f"{backend or _query_backend()}:{parsed_query.cache_key}"
+
+def execute_query(parsed_query):
+    """(rows, backend) for ``parsed_query`` from the local snapshot when enabled, else from Postgres"""
+    if _query_backend() == "duckdb":
+        try:
+            return snapshot_store.execute(parsed_query.sql_for("duckdb")), "duckdb"
+        except Exception as e:
+            logger.warning("Snapshot query failed, falling back to Postgres: %s", e)
+    
+    with pooled_db_connection() as conn, conn.cursor() as cur:
+        cur.execute(parsed_query.sql)
+        return [dict(row) for row in cur.fetchall()], "postgres"
+
+def apply_parent_restrictions(parsed_query, parent_student_id):
+    """Restrict ``parsed_query`` to the parent's child; returns (query, denial message or None)"""
+    restricted_to_child = parsed_query.restricts_to_student(parent_student_id)
+    
+    # If query selects individual names/roll_nos (directly or aggregated) but doesn't restrict to their child
+    if parsed_query.selects_student_identifiers and not restricted_to_child:
+        logger.warning("Blocking parent query that accesses individual student data")
+        if payload_logging_enabled(logger):
+            logger.debug("Blocked SQL: %s", parsed_query.sql)
+        return parsed_query, "You cannot access individual student details. You can only view your child's information or general class statistics."
+    
+    # Ensure parent-specific queries are properly restricted
+    if not restricted_to_child and (not parsed_query.has_aggregates or parsed_query.groups_by_student):
+        logger.info("Adding parent restriction to query")
+        try:
+            parsed_query = parsed_query.with_student_restriction(parent_student_id)
+        except SQLRewriteError as e:
+            logger.warning("Blocking parent query that cannot be restricted: %s", e)
+            return parsed_query, f"You can only access information about your child (ID: {parent_student_id}) or general class statistics without individual student details."
+        if payload_logging_enabled(logger):
+            logger.debug("Modified SQL for parent access: %s", parsed_query.sql)
+    elif not restricted_to_child and not parsed_query.subqueries_restrict_to_student(parent_student_id):
+        # Class statistics must not look up other students through a subquery
+        logger.warning("Blocking parent query with an unrestricted subquery")
+        return parsed_query, "You cannot access individual student details. You can only view your child's information or general class statistics."
+    
+    return parsed_query, None
+
+def prepare_stored_query(sql, user_type, parent_student_id):
+    """Parse SQL stored with a turn, applying parent restrictions again so it never widens access"""
+    parsed_query = parse_sql(sql)
+    if user_type == "parent" and parent_student_id:
+        parsed_query, denied_message = apply_parent_restrictions(parsed_query, parent_student_id)
+        if denied_message:
+            raise PermissionError(denied_message)
+    return parsed_query
+
+def fetch_result_page(sql, user_type, parent_student_id, offset, page_size):
+    """One page of a previously executed query's rows; returns (rows, has_more).
+
+    Pages inside the first MAX_QUERY_ROWS rows are sliced from the cached
+    turn result when it is still cached; anything else is read with
+    LIMIT/OFFSET (one extra row tells whether another page exists), and
+    those pages are cached too.
+    """
+    parsed_query = prepare_stored_query(sql, user_type, parent_student_id)
+    
+    turn_rows = query_result_cache.get(result_cache_key(parsed_query.with_limit(Config.MAX_QUERY_ROWS)))
+    if turn_rows is not None and (len(turn_rows) < Config.MAX_QUERY_ROWS or offset + page_size < len(turn_rows)):
+        logger.info("Result page %d+%d served from the cached turn result", offset, page_size)
+        return turn_rows[offset:offset + page_size], offset + page_size < len(turn_rows)
+    
+    page_query = parsed_query.with_page(offset, page_size + 1)
+    rows = query_result_cache.get(result_cache_key(page_query))
+    if rows is None:
+        rows, backend = execute_query(page_query)
+        query_result_cache.set(result_cache_key(page_query, backend), rows)
+    return rows[:page_size], len(rows) > page_size
+
+def record_verified_example(state, sql_query, retrieved_data):
+    """Keep SQL that ran and returned rows as a few-shot example; parent SQL is tied to one child.
+
+    SQL reused from the index is not recorded again: it was stored for
+    another question and must not become an example for this one.
+    """
+    if state.get("sql_reused"):
+        return
+    if retrieved_data and state.get("user_type", "faculty") != "parent" and not is_synthetic_request():
+        sql_example_index.add(state.get("generated_prompt") or state["question"], sql_query)
+
 def data_executor_agent(state):
     """Agent 2: Execute SQL query and retrieve data"""
     sql_query = state["sql_query"]
     user_type = state.get("user_type", "faculty")
     parent_student_id = state.get("parent_student_id", None)
     
-    logger.info(f"=== DATA EXECUTOR AGENT ===")
-    logger.info(f"Executing SQL: {sql_query}")
+    logger.info("=== DATA EXECUTOR AGENT ===")
+    if payload_logging_enabled(logger):
+        logger.debug("Executing SQL: %s", sql_query)
     
     # Check for access denied query
     if "ACCESS_DENIED" in sql_query:
-        logger.warning(f"Access denied for parent user: {parent_student_id}")
+        logger.warning("Access denied for parent user: %s", parent_student_id)
         return {
             "retrieved_data": [{"error": "ACCESS_DENIED", "message": f"You can only access information about your child (ID: {parent_student_id}) or general class statistics without individual student details."}],
             "access_denied": True
         }
     
     try:
-        conn = get_db_connection()
-        with conn.cursor() as cur:
-            # Additional security check for parent users
-            if user_type == "parent" and parent_student_id:
-                # Check if query contains individual student data for other students
-                sql_lower = sql_query.lower()
-                
-                # If query selects individual names/roll_nos but doesn't restrict to their child
-                if ("s.name" in sql_lower or "s.roll_no" in sql_lower) and parent_student_id not in sql_query:
-                    # Check if it's not an aggregated query
-                    if not any(agg in sql_lower for agg in ["avg(", "count(", "sum(", "max(", "min(", "group by"]):
-                        logger.warning(f"Blocking parent query that accesses individual student data: {sql_query}")
-                        return {
-                            "retrieved_data": [{"error": "ACCESS_DENIED", "message": "You cannot access individual student details. You can only view your child's information or general class statistics."}],
-                            "access_denied": True
-                        }
-                
-                # Ensure parent-specific queries are properly restricted
-                if parent_student_id not in sql_query and not any(agg in sql_lower for agg in ["avg(", "count(", "sum(", "max(", "min("]):
-                    logger.info(f"Adding parent restriction to query")
-                    if "WHERE" in sql_query.upper():
-                        sql_query = sql_query + f" AND s.roll_no = '{parent_student_id}'"
-                    else:
-                        sql_query = sql_query + f" WHERE s.roll_no = '{parent_student_id}'"
-                    logger.info(f"Modified SQL for parent access: {sql_query}")
-            
-            cur.execute(sql_query)
-            results = cur.fetchall()
-            
-            # Convert to list of dictionaries
-            retrieved_data = [dict(row) for row in results]
-            
-            # Print fetched records for debugging
-            logger.info(f"=== FETCHED RECORDS FROM NEON DB ===")
-            logger.info(f"Total records retrieved: {len(retrieved_data)}")
+        parsed_query = parse_sql(sql_query)
+    except SQLParseError as e:
+        logger.error("Rejected unparsable SQL: %s", e)
+        return {"retrieved_data": [], "access_denied": False}
+    
+    # Additional security check for parent users
+    if user_type == "parent" and parent_student_id:
+        parsed_query, denied_message = apply_parent_restrictions(parsed_query, parent_student_id)
+        if denied_message:
+            return {
+                "retrieved_data": [{"error": "ACCESS_DENIED", "message": denied_message}],
+                "access_denied": True
+            }
+    
+    # Stored with the turn so further pages can be fetched without generating SQL again
+    executed_sql = parsed_query.sql
+    parsed_query = parsed_query.with_limit(Config.MAX_QUERY_ROWS)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Tables referenced: %s, columns: %s", sorted(parsed_query.tables), sorted(parsed_query.columns))
+    
+    cached_data = query_result_cache.get(result_cache_key(parsed_query))
+    if cached_data is not None:
+        logger.info("Query result cache hit: %d records", len(cached_data))
+        return {"retrieved_data": cached_data, "executed_sql": executed_sql}
+    
+    try:
+        retrieved_data, backend = execute_query(parsed_query)
+        query_result_cache.set(result_cache_key(parsed_query, backend), retrieved_data)
+        
+        # Speculative runs may be discarded; the planner records the ones it uses
+        if not state.get("speculative"):
+            record_verified_example(state, sql_query, retrieved_data)
+        
+        logger.info("Total records retrieved: %d", len(retrieved_data))
+        
+        if retrieved_data:
+            logger.info("Column names: %s", list(retrieved_data[0].keys()))
             
-            if retrieved_data:
-                logger.info("Sample records (first 3):")
+            # Sample rows only when debugging payloads
+            if payload_logging_enabled(logger):
                 for i, record in enumerate(retrieved_data[:3], 1):
-                    logger.info(f"Record {i}: {dict(record)}")
-                
-                # Print column names
-                column_names = list(retrieved_data[0].keys()) if retrieved_data else []
-                logger.info(f"Column names: {column_names}")
-            else:
-                logger.info("No records found in database")
-            
-            return {"retrieved_data": retrieved_data}
-            
+                    logger.debug("Record %d: %s", i, dict(record))
+        else:
+            logger.info("No records found in database")
+        
+        return {"retrieved_data": retrieved_data, "executed_sql": executed_sql}
+        
     except Exception as e:
-        logger.error(f"Error in Data Executor Agent: {e}")
+        logger.error("Error in Data Executor Agent: %s", e)
         # Return empty data on error
-        return {"retrieved_data": [], "access_denied": False}
-    finally:
-        if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+        return {"retrieved_data": [], "access_denied": False}
\ No newline at end of file
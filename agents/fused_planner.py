@@ -0,0 +1,118 @@
+from langchain_core.messages import HumanMessage, SystemMessage
+from database.db_connection import DatabaseSchema
+from agents.prompt_generator import format_conversation_context, plan_answer_without_sql
+from agents.sql_generator import (
+    check_parent_question_access, get_access_control_note, clean_sql_response, FALLBACK_SQL_QUERY
+)
+from utils.llm_client import invoke_llm
+from utils.sql_canonicalizer import parse_sql, SQLParseError
+from utils.logging_setup import payload_logging_enabled
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def parse_fused_response(content):
+    """Extract (rewritten_question, sql) from the model's JSON object"""
+    text = clean_sql_response(content)
+    if text.startswith("json"):
+        text = text[4:].strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("No JSON object in fused planner response")
+
+    payload = json.loads(text[start:end + 1])
+    rewritten_question = str(payload.get("rewritten_question", "")).strip()
+    sql_query = clean_sql_response(str(payload.get("sql", "")))
+    if not sql_query:
+        raise ValueError("Fused planner response has no SQL")
+    return rewritten_question, sql_query
+
+def is_valid_fused_response(response):
+    """Validation hook for model escalation: valid JSON whose SQL parses"""
+    try:
+        _, sql_query = parse_fused_response(response.content)
+        parse_sql(sql_query)
+        return True
+    except (ValueError, SQLParseError):
+        return False
+
+def fused_planner_agent(state):
+    """Agent 0 + 1 in one call: rewrite the question with conversation context and generate its SQL"""
+    question = state["question"]
+    chat_history = state.get("chat_history", [])
+    user_type = state.get("user_type", "faculty")
+    parent_student_id = state.get("parent_student_id", None)
+
+    logger.info("=== FUSED PLANNER AGENT ===")
+    if payload_logging_enabled(logger):
+        logger.debug("Original Question: %s", question)
+
+    denied_query = check_parent_question_access(question, question, user_type, parent_student_id)
+    if denied_query:
+        return {"generated_prompt": question, "sql_query": denied_query}
+
+    planned = plan_answer_without_sql(state)
+    if planned is not None:
+        return planned
+
+    conversation_context = format_conversation_context(chat_history) if chat_history else "(no previous conversation)"
+    schema_context = DatabaseSchema.get_pruned_schema_context(f"{question} {conversation_context}")
+
+    fused_prompt = f"""
+    You plan database lookups for a student management system with semester-level data.
+
+    {schema_context}
+
+    {DatabaseSchema.get_grade_hierarchy_context()}
+
+    {get_access_control_note(user_type, parent_student_id)}
+
+    Recent Conversation Context:
+    {conversation_context}
+
+    Current User Question: "{question}"
+    User Type: {user_type}
+
+    Tasks:
+    1. rewritten_question: if the question is a follow-up, rewrite it as a complete standalone question
+       using the conversation context (e.g. "give me along with names" after a CGPA question becomes
+       "give me student CGPA along with the names of students"); otherwise repeat it unchanged
+    2. sql: one PostgreSQL SELECT query answering the rewritten question
+
+    SQL Rules:
+    - Always use table aliases (s, sc, am) and ILIKE for case-insensitive text matching
+    - Filter semesters with the semester column; for questions spanning semesters query the table once and group or order by semester (no UNION)
+    - Rank grades with am.grade_point (ORDER BY am.grade_point DESC for best grades)
+    - STRICTLY follow access control rules for parent users
+    - For comprehensive queries, limit to 20 records max
+
+    Respond with only a JSON object, no markdown:
+    {{"rewritten_question": "...", "sql": "..."}}
+    """
+
+    try:
+        messages = [
+            SystemMessage(content="You are an expert at rewriting follow-up questions and generating SQL with strict access controls. Respond with a single JSON object only."),
+            HumanMessage(content=fused_prompt)
+        ]
+
+        response = invoke_llm(messages, agent="fused_planner", validate=is_valid_fused_response)
+        rewritten_question, sql_query = parse_fused_response(response.content)
+        generated_prompt = rewritten_question or question
+
+        # Re-check access with the rewritten question, as sql_generator_agent does with the enhanced prompt
+        denied_query = check_parent_question_access(question, generated_prompt, user_type, parent_student_id)
+        if denied_query:
+            return {"generated_prompt": generated_prompt, "sql_query": denied_query}
+
+        if payload_logging_enabled(logger):
+            logger.debug("Rewritten Question: %s", generated_prompt)
+            logger.debug("Generated SQL Query: %s", sql_query)
+        logger.info("Rewritten question: %d characters, SQL: %d characters", len(generated_prompt), len(sql_query))
+
+        return {"generated_prompt": generated_prompt, "sql_query": sql_query}
+
+    except Exception as e:
+        logger.error("Error in Fused Planner Agent: %s", e)
+        return {"generated_prompt": question, "sql_query": FALLBACK_SQL_QUERY}
@@ -0,0 +1,150 @@
+from database.student_profiles import student_profiles
+from agents.sql_generator import check_parent_question_access
+from config import Config
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Questions about the class rather than the child still need SQL over every student
+CLASS_WIDE_PATTERN = re.compile(
+    r"\b(class|classmates|students|all student|every student|everyone|other student|batch|rank|ranking|topper|toppers"
+    r"|compare|compared|comparison|median|percentile|how many)\b"
+)
+SUBJECT_PATTERN = re.compile(r"\b(subjects?|attendance|attended|absent|present|classes|grades?|marks|scores?|pass|passed|fail|failed|status|backlogs?|ratings?|papers?|courses?)\b")
+ALL_SEMESTERS_PATTERN = re.compile(r"\b(all|every|each|overall|entire|whole|so far|trend|progress)\b")
+SEMESTER_NUMBER_PATTERN = re.compile(r"\b(?:semester|sem|s)\s*(\d+)\b")
+SEMESTER_ORDINAL_PATTERN = re.compile(r"\b(first|second|third|fourth|fifth|sixth|seventh|eighth|1st|2nd|3rd|4th|5th|6th|7th|8th)\s+(?:semester|sem)\b")
+ORDINALS = {"first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6, "seventh": 7, "eighth": 8}
+# Words too common in subject names ("Engineering Mathematics I") to identify one
+GENERIC_SUBJECT_WORDS = {"and", "the", "for", "with", "introduction", "fundamentals", "basics", "principles", "engineering", "laboratory", "practical", "lab"}
+# The object of "in"/"for" that is not a subject: "doing in semester 2", "marks for all subjects"
+TOPIC_PATTERN = re.compile(r"\b(?:in|for)\s+(?:the\s+|his\s+|her\s+|their\s+|my\s+)?([a-z][a-z]+)")
+NON_SUBJECT_WORDS = {
+    "semester", "sem", "sems", "semesters", "all", "each", "every", "this", "that", "last", "latest", "current", "previous",
+    "total", "overall", "general", "studies", "academics", "college", "school", "exams", "exam", "year", "term",
+    "first", "second", "third", "fourth", "fifth", "sixth", "seventh", "eighth"
+}
+
+def requested_semesters(text):
+    semesters = {int(number) for number in SEMESTER_NUMBER_PATTERN.findall(text)}
+    for ordinal in SEMESTER_ORDINAL_PATTERN.findall(text):
+        semesters.add(ORDINALS.get(ordinal) or int(ordinal[:-2]))
+    return semesters
+
+def _words(text):
+    return re.findall(r"[a-z]+", text.lower())
+
+def _subject_words(name):
+    return {word for word in _words(name) if len(word) >= 4 and word not in GENERIC_SUBJECT_WORDS}
+
+def _names_subject(words, subject_words):
+    # "maths" names "mathematics": a word (without a plural s) may abbreviate a subject word
+    stems = {word.rstrip("s") for word in words if len(word.rstrip("s")) >= 4}
+    return any(subject_word.startswith(stem) for stem in stems for subject_word in subject_words)
+
+def mentioned_subjects(profile, question):
+    """Subjects of the profile that ``question`` names; None when it names a subject or topic the profile lacks.
+
+    A subject is named by its full name or one of its distinctive words
+    ("English" for "Communicative English"). Capitalized words and the
+    object of "in"/"for" that match neither a subject, the child's name nor
+    a general term mean the question is about something this document does
+    not hold, so it should take the SQL path.
+    """
+    text = question.lower()
+    names = {subject["subject"] for semester in profile.get("semesters") or [] for subject in semester["subjects"]}
+    question_words = set(_words(text))
+    mentioned = {name for name in names if name.lower() in text or _names_subject(question_words, _subject_words(name))}
+
+    subject_words = set(_words(" ".join(names)))
+    known = subject_words | set(_words(profile.get("name") or "")) | NON_SUBJECT_WORDS
+    known |= {word for word in question_words if SUBJECT_PATTERN.fullmatch(word) or CLASS_WIDE_PATTERN.fullmatch(word)}
+    # The first word is capitalized anyway; acronyms like CGPA are metrics
+    capitalized = {word.lower() for word in re.findall(r"\b[A-Z][a-z]+\b", question)[1:] if len(word) >= 4}
+    topics = {word for word in TOPIC_PATTERN.findall(text) if len(word) >= 4}
+    unknown = {word for word in (capitalized | topics) - known if not _names_subject([word], subject_words)}
+    if unknown:
+        return None
+    return mentioned
+
+def profile_rows(profile, question, subjects=()):
+    """Rows for the answer generator from one student's profile document.
+
+    Questions naming ``subjects`` get those subjects' rows (from every
+    semester unless semesters are named); other subject questions get one
+    row per subject (the latest semester unless semesters are named or all
+    are asked for); anything else gets one summary row per semester.
+    """
+    text = question.lower()
+    semesters = profile.get("semesters") or []
+    requested = requested_semesters(text)
+    about_subjects = bool(subjects) or SUBJECT_PATTERN.search(text) is not None
+
+    if requested:
+        selected = [semester for semester in semesters if semester["semester"] in requested]
+    elif about_subjects and not subjects and not ALL_SEMESTERS_PATTERN.search(text):
+        selected = semesters[-1:]
+    else:
+        selected = semesters
+
+    student = {"roll_no": profile["roll_no"], "name": profile["name"]}
+    if about_subjects:
+        return [
+            {**student, "semester": semester["semester"], **subject}
+            for semester in selected
+            for subject in semester["subjects"]
+            if not subjects or subject["subject"] in subjects
+        ]
+    return [
+        {
+            **student,
+            "semester": semester["semester"],
+            "cgpa": semester["cgpa"],
+            "average_attendance": semester["average_attendance"],
+            "total_grade_points": semester["total_grade_points"],
+            "subject_count": len(semester["subjects"])
+        }
+        for semester in selected
+    ]
+
+def plan_profile_answer(state):
+    """Answer a parent's question about their own child from one profile lookup; None when it needs SQL.
+
+    The document is fetched by the session's student id, so the rows can
+    only ever be the child's. Class-wide questions and ones the access check
+    would refuse take the normal path.
+    """
+    parent_student_id = state.get("parent_student_id")
+    if not Config.PROFILE_ANSWERS_ENABLED or state.get("user_type") != "parent" or not parent_student_id:
+        return None
+
+    question = state["question"]
+    if CLASS_WIDE_PATTERN.search(question.lower()):
+        return None
+    if check_parent_question_access(question, question, "parent", parent_student_id):
+        return None
+
+    try:
+        profile = student_profiles.get(parent_student_id)
+    except Exception as e:
+        logger.warning("Profile lookup failed, generating SQL instead: %s", e)
+        return None
+    if profile is None:
+        return None
+
+    subjects = mentioned_subjects(profile, question)
+    if subjects is None:
+        logger.info("Question names a subject or topic not in the profile of %s; generating SQL", parent_student_id)
+        return None
+
+    rows = profile_rows(profile, question, subjects)
+    logger.info("Parent question answered from the profile of %s: %d rows", parent_student_id, len(rows))
+    return {
+        "generated_prompt": question,
+        "sql_query": "",
+        "executed_sql": "",
+        "retrieved_data": rows,
+        "access_denied": False,
+        "answered_from": "profile"
+    }
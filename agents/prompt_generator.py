@@ -1,12 +1,93 @@
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain.chat_models import init_chat_model
+from agents.data_executor import fetch_result_page
+from agents.profile_lookup import plan_profile_answer
+from database.query_cache import conversation_results, conversation_result_key
+from utils.llm_client import invoke_llm
+from utils.logging_setup import payload_logging_enabled
+from utils.result_transforms import detect_result_transform, apply_transform, transform_sql, describe_transform
+from utils.sql_canonicalizer import parse_sql
 from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize LLM
-llm = init_chat_model(Config.LLM_MODEL, model_provider=Config.LLM_PROVIDER)
+def format_conversation_context(chat_history):
+    """Format the last 3 Q&A pairs, truncating bot responses, for prompt context"""
+    conversation_context = ""
+    recent_messages = chat_history[-6:]  # Last 3 Q&A pairs
+    
+    for msg in recent_messages:
+        if msg.get("type") == "user":
+            conversation_context += f"User: {msg.get('content', '')}\n"
+        elif msg.get("type") == "bot":
+            # Only include first 150 chars of bot response for context
+            bot_content = msg.get('content', '')[:150]
+            conversation_context += f"Assistant: {bot_content}...\n"
+    return conversation_context
+
+def find_previous_result(chat_history):
+    """The latest bot message if it is backed by stored rows"""
+    for message in reversed(chat_history):
+        if message.get("type") == "bot":
+            return message if message.get("executed_sql") and message.get("result") else None
+    return None
+
+def load_previous_rows(state, previous):
+    """Rows behind the previous bot message from the conversation store, else re-read with its stored SQL"""
+    conversation_id = state.get("conversation_id")
+    if conversation_id and previous.get("id"):
+        rows = conversation_results.get(conversation_result_key(conversation_id, previous["id"]))
+        if rows is not None:
+            return rows
+    # Another worker answered the previous turn; one query still beats generating SQL again
+    rows, _ = fetch_result_page(previous["executed_sql"], state.get("user_type", "faculty"), state.get("parent_student_id"), 0, Config.MAX_QUERY_ROWS)
+    return rows
+
+def plan_result_reuse(state):
+    """Answer a follow-up by filtering/sorting/projecting the previous rows; None when it needs new SQL.
+
+    Only complete previous results qualify (a truncated one may be missing
+    rows the follow-up asks for). The returned SQL wraps the previous query
+    so paging and export of the new answer see the same rows.
+    """
+    if not Config.RESULT_REUSE_ENABLED:
+        return None
+    previous = find_previous_result(state.get("chat_history", []))
+    if previous is None or previous["result"].get("truncated"):
+        return None
+    
+    columns = previous["result"].get("columns") or []
+    transform = detect_result_transform(state["question"], columns)
+    if transform is None:
+        return None
+    
+    try:
+        # Fails first for results with duplicate column names, which cannot be reshaped by name
+        executed_sql = transform_sql(parse_sql(previous["executed_sql"]), transform, columns).sql
+        rows = load_previous_rows(state, previous)
+    except Exception as e:
+        logger.warning("Previous result unavailable, generating SQL instead: %s", e)
+        return None
+    
+    transformed = apply_transform(rows, transform)
+    logger.info("Follow-up answered from the previous result (%s): %d of %d rows", describe_transform(transform), len(transformed), len(rows))
+    return {
+        "generated_prompt": state["question"],
+        "sql_query": executed_sql,
+        "executed_sql": executed_sql,
+        "retrieved_data": transformed,
+        "access_denied": False,
+        "result_transform": transform,
+        "answered_from": "previous_result"
+    }
+
+def plan_answer_without_sql(state):
+    """Rows for the question from the previous result or the parent's profile document, else None"""
+    return plan_result_reuse(state) or plan_profile_answer(state)
+
+def route_after_prompt(state, next_node):
+    """Skip SQL generation and execution when the rows came from elsewhere"""
+    return "answer_generator" if state.get("answered_from") else next_node
 
 def prompt_generator_agent(state):
     """Agent 0: Generate optimized prompt based on chat history and current question"""
@@ -15,16 +96,26 @@ def prompt_generator_agent(state):
     user_type = state.get("user_type", "faculty")
     parent_student_id = state.get("parent_student_id", None)
     
-    logger.info(f"=== PROMPT GENERATOR AGENT ===")
-    logger.info(f"Original Question: {question}")
-    logger.info(f"Chat History Length: {len(chat_history)}")
-    logger.info(f"User Type: {user_type}")
+    logger.info("=== PROMPT GENERATOR AGENT ===")
+    if payload_logging_enabled(logger):
+        logger.debug("Original Question: %s", question)
+    logger.info("Chat History Length: %d, User Type: %s", len(chat_history), user_type)
     
     # Debug: Log actual chat history content
-    if chat_history:
-        logger.info("Chat History Content:")
+    if chat_history and payload_logging_enabled(logger):
         for i, msg in enumerate(chat_history[-4:]):  # Last 4 messages
-            logger.info(f"  {i+1}. {msg.get('type', 'unknown')}: {msg.get('content', '')[:100]}...")
+            logger.debug("Chat History %d. %s: %s...", i + 1, msg.get('type', 'unknown'), msg.get('content', '')[:100])
+    
+    planned = plan_answer_without_sql(state)
+    if planned is not None:
+        return planned
+    return enhance_prompt(state)
+
+def enhance_prompt(state):
+    """Rewrite the question with conversation context for SQL generation (no planning)"""
+    question = state["question"]
+    chat_history = state.get("chat_history", [])
+    user_type = state.get("user_type", "faculty")
     
     # If no chat history, return the original question
     if not chat_history or len(chat_history) < 2:
@@ -32,18 +123,10 @@ def prompt_generator_agent(state):
         return {"generated_prompt": question}
     
     # Format recent chat history for context analysis
-    conversation_context = ""
-    recent_messages = chat_history[-6:]  # Last 3 Q&A pairs
-    
-    for msg in recent_messages:
-        if msg.get("type") == "user":
-            conversation_context += f"User: {msg.get('content', '')}\n"
-        elif msg.get("type") == "bot":
-            # Only include first 150 chars of bot response for context
-            bot_content = msg.get('content', '')[:150]
-            conversation_context += f"Assistant: {bot_content}...\n"
+    conversation_context = format_conversation_context(chat_history)
     
-    logger.info(f"Conversation Context:\n{conversation_context}")
+    if payload_logging_enabled(logger):
+        logger.debug("Conversation Context:\n%s", conversation_context)
     
     # Analyze conversation and generate enhanced prompt
     prompt_enhancement_request = f"""
@@ -76,13 +159,15 @@ def prompt_generator_agent(state):
             HumanMessage(content=prompt_enhancement_request)
         ]
         
-        response = llm.invoke(messages)
+        response = invoke_llm(messages, agent="prompt_generator")
         generated_prompt = response.content.strip()
         
-        logger.info(f"Generated Prompt: {generated_prompt}")
+        if payload_logging_enabled(logger):
+            logger.debug("Generated Prompt: %s", generated_prompt)
+        logger.info("Generated Prompt: %d characters", len(generated_prompt))
         
         return {"generated_prompt": generated_prompt}
         
     except Exception as e:
-        logger.error(f"Error in Prompt Generator Agent: {e}")
+        logger.error("Error in Prompt Generator Agent: %s", e)
         return {"generated_prompt": question}  # Fallback to original question
\ No newline at end of file
@@ -0,0 +1,127 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextvars import copy_context
+from threading import Lock
+from agents.prompt_generator import prompt_generator_agent, plan_answer_without_sql, enhance_prompt
+from agents.sql_generator import sql_generator_agent
+from agents.data_executor import data_executor_agent, record_verified_example
+from config import Config
+import re
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+_speculation_executor = ThreadPoolExecutor(max_workers=Config.SPECULATIVE_WORKERS, thread_name_prefix="speculative")
+
+class SpeculationStats:
+    """Win rate and time saved by speculative SQL generation"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.wins = 0
+        self.misses = 0
+        self.time_saved_seconds = 0.0
+
+    def record_win(self, saved_seconds):
+        with self._lock:
+            self.wins += 1
+            self.time_saved_seconds += saved_seconds
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            attempts = self.wins + self.misses
+            return {
+                "attempts": attempts,
+                "wins": self.wins,
+                "misses": self.misses,
+                "win_rate": round(self.wins / attempts, 3) if attempts else None,
+                "time_saved_seconds": round(self.time_saved_seconds, 3),
+                "avg_time_saved_per_win_seconds": round(self.time_saved_seconds / self.wins, 3) if self.wins else None
+            }
+
+speculation_stats = SpeculationStats()
+
+def prompts_equivalent(question, generated_prompt):
+    """True when the enhanced prompt asks for the same thing as the raw question"""
+    question_words = set(re.findall(r"[a-z0-9+.]+", question.lower()))
+    prompt_words = set(re.findall(r"[a-z0-9+.]+", generated_prompt.lower()))
+    if question_words == prompt_words:
+        return True
+    if not question_words or not prompt_words:
+        return False
+    similarity = len(question_words & prompt_words) / len(question_words | prompt_words)
+    return similarity >= Config.SPECULATIVE_EQUIVALENCE_THRESHOLD
+
+def _speculate(state):
+    """SQL generation (and optionally execution) on the raw question"""
+    started_at = time.monotonic()
+    speculative_state = {**state, "generated_prompt": state["question"], "speculative": True}
+    result = sql_generator_agent(speculative_state)
+    result["speculation"] = "sql"
+
+    if Config.SPECULATIVE_EXECUTION and "ACCESS_DENIED" not in result["sql_query"]:
+        result.update(data_executor_agent({**speculative_state, **result}))
+        result["speculation"] = "data"
+
+    return result, started_at, time.monotonic()
+
+def speculative_planner_agent(state):
+    """Agent 0 + 1: enhance the prompt while speculatively generating SQL for the raw question"""
+    question = state["question"]
+    chat_history = state.get("chat_history", [])
+
+    # Without history the prompt generator returns the question untouched, so there is nothing to overlap
+    if not chat_history or len(chat_history) < 2:
+        return {**prompt_generator_agent(state), "speculation": ""}
+
+    planned = plan_answer_without_sql(state)
+    if planned is not None:
+        return {**planned, "speculation": "data"}
+
+    logger.info("=== SPECULATIVE PLANNER ===")
+    future = _speculation_executor.submit(copy_context().run, _speculate, dict(state))
+
+    # Planning already ran above, so only the LLM rewrite is left
+    prompt_result = enhance_prompt(state)
+    prompt_done_at = time.monotonic()
+    generated_prompt = prompt_result["generated_prompt"]
+
+    if not prompts_equivalent(question, generated_prompt):
+        # The speculative call finishes in the background and its result is dropped
+        speculation_stats.record_miss()
+        logger.info("Speculation discarded: enhanced prompt differs from the question")
+        return {**prompt_result, "speculation": ""}
+
+    try:
+        speculative_result, started_at, finished_at = future.result(timeout=Config.SPECULATIVE_WAIT_SECONDS)
+    except FutureTimeoutError:
+        speculation_stats.record_miss()
+        logger.warning("Speculative SQL generation did not finish in time; generating SQL normally")
+        return {**prompt_result, "speculation": ""}
+    except Exception as e:
+        speculation_stats.record_miss()
+        logger.error("Speculative SQL generation failed: %s", e)
+        return {**prompt_result, "speculation": ""}
+
+    # Work that overlapped with prompt enhancement is the latency we saved
+    saved_seconds = max(0.0, min(finished_at, prompt_done_at) - started_at)
+    speculation_stats.record_win(saved_seconds)
+    logger.info("Speculation used (%s), saved %.2fs", speculative_result['speculation'], saved_seconds)
+
+    if speculative_result["speculation"] == "data":
+        record_verified_example({**state, **speculative_result, **prompt_result}, speculative_result["sql_query"], speculative_result.get("retrieved_data"))
+
+    return {**prompt_result, **speculative_result}
+
+def route_after_planner(state):
+    """Skip the stages the speculative result already covered"""
+    speculation = state.get("speculation", "")
+    if speculation == "data" or state.get("answered_from"):
+        return "answer_generator"
+    if speculation == "sql":
+        return "data_executor"
+    return "sql_generator"
@@ -1,133 +1,189 @@
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain.chat_models import init_chat_model
 from database.db_connection import DatabaseSchema
-from config import Config
+from utils.llm_client import invoke_llm, estimate_tokens, llm_latency
+from utils.sql_canonicalizer import parse_sql, SQLParseError
+from utils.sql_example_index import sql_example_index, format_examples
+from utils.logging_setup import payload_logging_enabled
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize LLM
-llm = init_chat_model(Config.LLM_MODEL, model_provider=Config.LLM_PROVIDER)
+def clean_sql_response(content):
+    """Strip markdown code fences from an LLM SQL response"""
+    sql_query = content.strip()
+    if sql_query.startswith("```sql"):
+        sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
+    elif sql_query.startswith("```"):
+        sql_query = sql_query.replace("```", "").strip()
+    return sql_query
 
-def sql_generator_agent(state):
-    """Agent 1: Generate SQL query based on user question and chat history"""
-    question = state["question"]
-    generated_prompt = state["generated_prompt"]
-    user_type = state.get("user_type", "faculty")
-    parent_student_id = state.get("parent_student_id", None)
-    
-    logger.info(f"=== SQL GENERATOR AGENT ===")
-    logger.info(f"Generated Prompt: {generated_prompt}")
-    logger.info(f"User Type: {user_type}")
-    logger.info(f"Parent Student ID: {parent_student_id}")
-    
-    # Enhanced security check for parent users
-    if user_type == "parent" and parent_student_id:
-        # Check if question asks for specific student details (other than their child)
-        question_lower = question.lower()
-        prompt_lower = generated_prompt.lower()
-        
-        # Detect if asking about specific students
-        security_keywords = ['roll_no', 'roll no', 'student id', 'name', 'specific student', 'individual']
-        general_keywords = ['average', 'all students', 'class', 'overall', 'total', 'general', 'statistics', 'distribution']
-        
-        # Check if it's asking for specific info
-        asking_specific = any(keyword in question_lower for keyword in security_keywords)
-        asking_general = any(keyword in question_lower for keyword in general_keywords)
-        
-        # If asking for specific info but not general stats, restrict access
-        if asking_specific and not asking_general:
-            # Check if they're asking about their own child
-            if parent_student_id.lower() not in question_lower and parent_student_id.lower() not in prompt_lower:
-                logger.warning(f"Parent {parent_student_id} trying to access other student's specific data: {question}")
-                return {
-                    "sql_query": f"SELECT 'ACCESS_DENIED' as message, 'You can only access information about your child (ID: {parent_student_id}) or general class statistics' as details"
-                }
-    
-    # Access control for parents
-    access_control_note = ""
-    if user_type == "parent" and parent_student_id:
-        access_control_note = f"""
-        IMPORTANT ACCESS CONTROL FOR PARENT USER:
-        - This is a PARENT user with student ID: {parent_student_id}
-        - ALLOWED: General statistics (averages, counts, distributions) without individual student names/IDs
-        - ALLOWED: Information specifically about their child (WHERE s.roll_no = '{parent_student_id}')
-        - DENIED: Specific information about other individual students
-        - For general queries: Use aggregated data like AVG(), COUNT(), but DO NOT include individual student names or roll numbers
-        - For their child's data: Use WHERE s.roll_no = '{parent_student_id}'
-        """
-    
-    sql_prompt = f"""
-    You are a SQL Query Generator Agent for a student management system with separate semester tables.
-    
-    {DatabaseSchema.SCHEMA_CONTEXT}
+def is_valid_sql_response(response):
+    """Validation hook for model escalation: the response must parse as one SELECT"""
+    try:
+        parse_sql(clean_sql_response(response.content))
+        return True
+    except SQLParseError:
+        return False
+
+# Identical for every request so it forms a cacheable prompt prefix; nothing dynamic belongs here
+SQL_SYSTEM_PROMPT = f"""
+    You are an expert SQL query generator with strict access controls for a multi-semester student database.
+    You are a SQL Query Generator Agent for a student management system with semester-level data.
     
     {DatabaseSchema.get_grade_hierarchy_context()}
     
     When querying grades:
-    - For "best/top/highest grades": Use ORDER BY with CASE statement to rank O > A+ > A > B+ > B > C+ > C > D+ > D > F
-    - For "worst/lowest/failing grades": Reverse the order or filter for D+, D, F
-    - For grade comparisons: Use proper grade hierarchy
-    
-    {access_control_note}
-    
-    Current User Question: "{question}"
-    Optimized Prompt: "{generated_prompt}"
-    User Type: {user_type}
+    - For "best/top/highest grades": ORDER BY am.grade_point DESC
+    - For "worst/lowest/failing grades": ORDER BY am.grade_point ASC or filter am.grade_point <= 3
+    - For grade comparisons and averages: Use am.grade_point (e.g. AVG(am.grade_point))
     
     Instructions:
     1. Use the optimized prompt to generate the SQL query
     2. Consider the user's intent and important details from the conversation context
-    3. Generate appropriate PostgreSQL query to retrieve relevant data
-    4. For semester-specific queries, use the appropriate table (attendance_and_marks_s1 or attendance_and_marks_s2)
-    5. For combined semester queries, use UNION or multiple joins as needed
+    3. Generate appropriate PostgreSQL query to retrieve relevant data, using only the tables in the schema provided
+    4. For semester-specific queries, filter attendance_and_marks or semester_cgpa on the semester column
+    5. For combined semester queries, query the unified table once and group or order by semester (no UNION)
     6. Join tables appropriately:
-       - Students + S1: students s LEFT JOIN attendance_and_marks_s1 am_s1 ON s.roll_no = am_s1.roll_no
-       - Students + S2: students s LEFT JOIN attendance_and_marks_s2 am_s2 ON s.roll_no = am_s2.roll_no
-       - Students + Both: Use UNION or multiple LEFT JOINs
+       - Students + subjects: students s JOIN attendance_and_marks am ON s.roll_no = am.roll_no
+       - Students + CGPA per semester: students s JOIN semester_cgpa sc ON s.roll_no = sc.roll_no
     7. Apply proper filters and conditions based on both current question and conversation context
     8. STRICTLY follow access control rules for parent users
-    9. When sorting by grades, use proper grade hierarchy with CASE statements
+    9. When sorting by grades, use the grade_point column
     
     Query Examples:
     - Student CGPA: SELECT s.roll_no, s.name, s.cgpa_s1, s.cgpa_s2 FROM students s
-    - S1 Performance: SELECT s.name, am_s1.subject, am_s1.grade FROM students s JOIN attendance_and_marks_s1 am_s1 ON s.roll_no = am_s1.roll_no
-    - Top Grades: ORDER BY CASE am_s1.grade WHEN 'O' THEN 10 WHEN 'A+' THEN 9 WHEN 'A' THEN 8 WHEN 'B+' THEN 7 WHEN 'B' THEN 6 WHEN 'C+' THEN 5 WHEN 'C' THEN 4 WHEN 'D+' THEN 3 WHEN 'D' THEN 2 ELSE 0 END DESC
-    - Combined Performance: Use UNION or separate queries
+    - CGPA Across Semesters: SELECT s.name, sc.semester, sc.cgpa FROM students s JOIN semester_cgpa sc ON s.roll_no = sc.roll_no ORDER BY s.name, sc.semester
+    - S1 Performance: SELECT s.name, am.subject, am.grade FROM students s JOIN attendance_and_marks am ON s.roll_no = am.roll_no WHERE am.semester = 1
+    - Attendance By Semester: SELECT am.semester, AVG(am.attendance_percentage) AS avg_attendance FROM attendance_and_marks am GROUP BY am.semester ORDER BY am.semester
+    - Top Grades: SELECT s.name, am.subject, am.grade FROM students s JOIN attendance_and_marks am ON s.roll_no = am.roll_no ORDER BY am.grade_point DESC
     
     Important Rules:
-    - Always use table aliases (s, am_s1, am_s2)
+    - Always use table aliases (s, sc, am)
     - Use ILIKE for case-insensitive text matching
     - For parent users asking about general stats: Use aggregated functions but exclude individual identifiers
-    - For parent users asking about their child: Use WHERE s.roll_no = '{parent_student_id if user_type == "parent" else ""}'
+    - For parent users asking about their child: Use WHERE s.roll_no = '<their student ID>' as given in the access control section
     - For comprehensive queries, limit to 20 records max
-    - When semester is not specified, consider both S1 and S2 data
-    - Use proper grade hierarchy in ORDER BY clauses
+    - When semester is not specified, consider all semesters and include the semester column
+    - Use am.grade_point in ORDER BY clauses for grade ranking
     - Return only the SQL query, nothing else
+    """
+
+def build_sql_request(schema_context, access_control_note, question, generated_prompt, user_type, examples_context=""):
+    """Per-request part of the SQL prompt"""
+    return f"""
+    {schema_context}
+    
+    {examples_context}
+    
+    {access_control_note}
+    
+    Current User Question: "{question}"
+    Optimized Prompt: "{generated_prompt}"
+    User Type: {user_type}
     
     Generate the SQL query now:
     """
+
+FALLBACK_SQL_QUERY = "SELECT s.roll_no, s.name, s.cgpa_s1, s.cgpa_s2 FROM students s LIMIT 10"
+
+def check_parent_question_access(question, generated_prompt, user_type, parent_student_id):
+    """Return an ACCESS_DENIED query if a parent asks for another student's details, else None"""
+    if user_type != "parent" or not parent_student_id:
+        return None
+    
+    # Check if question asks for specific student details (other than their child)
+    question_lower = question.lower()
+    prompt_lower = generated_prompt.lower()
+    
+    # Detect if asking about specific students
+    security_keywords = ['roll_no', 'roll no', 'student id', 'name', 'specific student', 'individual']
+    general_keywords = ['average', 'all students', 'class', 'overall', 'total', 'general', 'statistics', 'distribution']
+    
+    # Check if it's asking for specific info
+    asking_specific = any(keyword in question_lower for keyword in security_keywords)
+    asking_general = any(keyword in question_lower for keyword in general_keywords)
+    
+    # If asking for specific info but not general stats, restrict access
+    if asking_specific and not asking_general:
+        # Check if they're asking about their own child
+        if parent_student_id.lower() not in question_lower and parent_student_id.lower() not in prompt_lower:
+            logger.warning("Parent %s trying to access other student's specific data", parent_student_id)
+            return f"SELECT 'ACCESS_DENIED' as message, 'You can only access information about your child (ID: {parent_student_id}) or general class statistics' as details"
+    
+    return None
+
+def get_access_control_note(user_type, parent_student_id):
+    """Prompt section describing what a parent user may query"""
+    if user_type != "parent" or not parent_student_id:
+        return ""
+    return f"""
+        IMPORTANT ACCESS CONTROL FOR PARENT USER:
+        - This is a PARENT user with student ID: {parent_student_id}
+        - ALLOWED: General statistics (averages, counts, distributions) without individual student names/IDs
+        - ALLOWED: Information specifically about their child (WHERE s.roll_no = '{parent_student_id}')
+        - DENIED: Specific information about other individual students
+        - For general queries: Use aggregated data like AVG(), COUNT(), but DO NOT include individual student names or roll numbers
+        - For their child's data: Use WHERE s.roll_no = '{parent_student_id}'
+        """
+
+def sql_generator_agent(state):
+    """Agent 1: Generate SQL query based on user question and chat history"""
+    question = state["question"]
+    generated_prompt = state["generated_prompt"]
+    user_type = state.get("user_type", "faculty")
+    parent_student_id = state.get("parent_student_id", None)
+    
+    logger.info("=== SQL GENERATOR AGENT ===")
+    if payload_logging_enabled(logger):
+        logger.debug("Generated Prompt: %s", generated_prompt)
+    logger.info("User Type: %s, Parent Student ID: %s", user_type, parent_student_id)
+    
+    # Enhanced security check for parent users
+    denied_query = check_parent_question_access(question, generated_prompt, user_type, parent_student_id)
+    if denied_query:
+        return {"sql_query": denied_query}
+    
+    # Access control for parents
+    access_control_note = get_access_control_note(user_type, parent_student_id)
+    
+    # Faculty questions already answered before reuse the verified SQL
+    if user_type != "parent":
+        reused_sql = sql_example_index.find_reusable(generated_prompt)
+        if reused_sql:
+            logger.info("Reusing verified SQL for a matching question")
+            llm_latency.increment("sql_generator", "example_reuses")
+            return {"sql_query": reused_sql, "sql_reused": True}
+    
+    # Dynamic suffix: only the schema this question needs, nearest verified examples, then the question itself
+    schema_context = DatabaseSchema.get_pruned_schema_context(f"{question} {generated_prompt}")
+    examples_context = format_examples(sql_example_index.search(generated_prompt))
+    sql_prompt = build_sql_request(schema_context, access_control_note, question, generated_prompt, user_type, examples_context)
+    
+    full_tokens = estimate_tokens([SystemMessage(content=SQL_SYSTEM_PROMPT), HumanMessage(content=build_sql_request(
+        DatabaseSchema.SCHEMA_CONTEXT, access_control_note, question, generated_prompt, user_type, examples_context
+    ))])
+    sent_tokens = estimate_tokens([SystemMessage(content=SQL_SYSTEM_PROMPT), HumanMessage(content=sql_prompt)])
+    llm_latency.increment("sql_generator", "prompt_tokens_full", full_tokens)
+    llm_latency.increment("sql_generator", "prompt_tokens_sent", sent_tokens)
+    logger.info("SQL prompt ~%d tokens after schema pruning (full schema ~%d, saved %d)", sent_tokens, full_tokens, full_tokens - sent_tokens)
     
     try:
+        # Static prefix first so providers can cache it across requests
         messages = [
-            SystemMessage(content="You are an expert SQL query generator with strict access controls for a multi-semester student database. Return only the SQL query, no explanations."),
+            SystemMessage(content=SQL_SYSTEM_PROMPT),
             HumanMessage(content=sql_prompt)
         ]
         
-        response = llm.invoke(messages)
-        sql_query = response.content.strip()
-        
-        # Clean up the SQL query
-        if sql_query.startswith("```sql"):
-            sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
-        elif sql_query.startswith("```"):
-            sql_query = sql_query.replace("```", "").strip()
+        # Small model first; escalate to the large model if the SQL does not parse
+        response = invoke_llm(messages, agent="sql_generator", validate=is_valid_sql_response)
+        sql_query = clean_sql_response(response.content)
         
-        logger.info(f"Generated SQL Query: {sql_query}")
+        if payload_logging_enabled(logger):
+            logger.debug("Generated SQL Query: %s", sql_query)
+        logger.info("Generated SQL Query: %d characters", len(sql_query))
         
         return {"sql_query": sql_query}
         
     except Exception as e:
-        logger.error(f"Error in SQL Generator Agent: {e}")
-        fallback_query = "SELECT s.roll_no, s.name, s.cgpa_s1, s.cgpa_s2 FROM students s LIMIT 10"
-        return {"sql_query": fallback_query}
\ No newline at end of file
+        logger.error("Error in SQL Generator Agent: %s", e)
+        return {"sql_query": FALLBACK_SQL_QUERY}
\ No newline at end of file
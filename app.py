@@ -1,4 +1,4 @@
-from flask import Flask, redirect, url_for, session, render_template
+from flask import Flask, redirect, url_for, session, render_template, request
 import os
 import warnings
 import logging
@@ -6,10 +6,14 @@ import json
 from config import Config
 from auth import auth_bp
 from routes.chat_routes import chat_bp
+from routes.health_routes import health_bp
+from workflows.warmup import start_warmup
+from utils.http_compression import compress_response
+from utils.logging_setup import configure_logging
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
@@ -20,6 +24,12 @@ app.secret_key = Config.SECRET_KEY
 # Register blueprints
 app.register_blueprint(auth_bp)
 app.register_blueprint(chat_bp)
+app.register_blueprint(health_bp)
+
+# Compile the graph, prime connections and caches; /readyz turns 200 when done.
+# A preloading server runs this in each worker after fork instead (gunicorn.conf.py)
+if Config.WARMUP_ON_STARTUP and os.getenv("WARMUP_IN_POST_FORK") != "true":
+    start_warmup()
 
 @app.route("/")
 def index():
@@ -28,6 +38,10 @@ def index():
     # return redirect(url_for("chat.ai_chat"))
     return render_template("index.html")
 
+@app.after_request
+def compress_large_responses(response):
+    return compress_response(response, request.headers.get("Accept-Encoding"))
+
 @app.template_filter('tojsonfilter')
 def to_json_filter(obj):
     if obj is None:
@@ -35,4 +49,5 @@ def to_json_filter(obj):
     return json.dumps(obj, separators=(',', ':'))
 
 if __name__ == "__main__":
+    # Development server only; production: gunicorn -c gunicorn.conf.py wsgi:app
     app.run(debug=True, use_reloader=False)
\ No newline at end of file
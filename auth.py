@@ -4,11 +4,20 @@ from werkzeug.security import generate_password_hash, check_password_hash
 import json
 import os
 
-client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"))
+# connect=False defers opening sockets to first use, so a preforking server can import this safely
+client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"), connect=False)
 db = client["user_db"]
 users_collection = db["users"]
 students_collection = db["students"]  # Collection for student data
 
+def reset_mongo_client():
+    """Create a fresh client in a forked worker; MongoClient is not fork-safe"""
+    global client, db, users_collection, students_collection
+    client = MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017/"), connect=False)
+    db = client["user_db"]
+    users_collection = db["users"]
+    students_collection = db["students"]
+
 auth_bp = Blueprint("auth", __name__)
 USER_DB = "users.json"
 
@@ -16,13 +16,183 @@ class Config:
     LLM_MODEL = "llama3-70b-8192"
     LLM_PROVIDER = "groq"
     
+    # Model Tiers (cost in USD per million tokens, used for logging)
+    LLM_TIERS = {
+        "small": {
+            "model": os.getenv("LLM_SMALL_MODEL", "llama-3.1-8b-instant"),
+            "input_cost_per_million": 0.05,
+            "output_cost_per_million": 0.08
+        },
+        "large": {
+            "model": os.getenv("LLM_LARGE_MODEL", LLM_MODEL),
+            "input_cost_per_million": 0.59,
+            "output_cost_per_million": 0.79
+        }
+    }
+    # Tiers tried in order; later tiers are only used when the output fails validation
+    LLM_AGENT_TIERS = {
+        "prompt_generator": ["small"],
+        "sql_generator": ["small", "large"],
+        "fused_planner": ["small", "large"],
+        "answer_generator": ["large"],
+        "suggestion_generator": ["small"]
+    }
+    LLM_DEFAULT_TIERS = ["large"]
+    
+    # LLM Cassette (record/replay of LLM calls for offline benchmarks and CI)
+    # "off", "record", "replay" (no network; unrecorded calls fail) or "auto" (replay, else record)
+    LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off")
+    LLM_CASSETTE_DIR = os.getenv("LLM_CASSETTE_DIR", "cassettes")
+    # Replay delay = recorded latency x scale + fixed seconds (0 and 0 replay at full speed)
+    LLM_CASSETTE_LATENCY_SCALE = float(os.getenv("LLM_CASSETTE_LATENCY_SCALE", "0"))
+    LLM_CASSETTE_LATENCY_SECONDS = float(os.getenv("LLM_CASSETTE_LATENCY_SECONDS", "0"))
+    
+    # LLM Rate Limiting (shared scheduler across all agents)
+    LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+    LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "6000"))
+    LLM_MAX_IN_FLIGHT_PER_USER = 2
+    LLM_QUEUE_TIMEOUT_SECONDS = 30
+    LLM_EXPECTED_OUTPUT_TOKENS = 300
+    # Lower value runs first: the interactive answer beats suggestions
+    LLM_AGENT_PRIORITIES = {
+        "answer_generator": 0,
+        "sql_generator": 1,
+        "prompt_generator": 1,
+        "fused_planner": 1,
+        "suggestion_generator": 2,
+        "report_generator": 3
+    }
+    LLM_DEFAULT_PRIORITY = 1
+    
+    # LLM Latency Budget (per chat turn, split across the agents)
+    REQUEST_LATENCY_BUDGET_SECONDS = float(os.getenv("REQUEST_LATENCY_BUDGET_SECONDS", "40"))
+    LLM_AGENT_BUDGET_SHARES = {
+        "prompt_generator": 0.15,
+        "sql_generator": 0.3,
+        "fused_planner": 0.45,
+        "answer_generator": 0.4,
+        "suggestion_generator": 0.15,
+        "report_generator": 0.75
+    }
+    LLM_DEFAULT_BUDGET_SHARE = 0.25
+    LLM_MAX_RETRIES = 2
+    LLM_RETRY_BASE_DELAY_SECONDS = 0.5
+    LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_MIN_SAMPLES = 20
+    LLM_EXECUTOR_WORKERS = 16
+    
+    # Workflow Configuration
+    # "sequential", "speculative" (SQL generated on the raw question during prompt enhancement)
+    # or "fused" (one LLM call returns both the rewritten question and the SQL)
+    WORKFLOW_MODE = os.getenv("WORKFLOW_MODE", "sequential")
+    SPECULATIVE_EXECUTION = os.getenv("SPECULATIVE_EXECUTION", "false").lower() == "true"
+    SPECULATIVE_EQUIVALENCE_THRESHOLD = 0.8
+    SPECULATIVE_WAIT_SECONDS = 15
+    SPECULATIVE_WORKERS = 8
+    
+    # Batch Questions (faculty reporting)
+    BATCH_MAX_QUESTIONS = 50
+    # Shared by all batches so several reports cannot flood the LLM rate limits
+    BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+    
+    # Bulk Parent Reports (workflows/report_pipeline.py)
+    REPORT_OUTPUT_DIR = os.getenv("REPORT_OUTPUT_DIR", "reports")
+    REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "4"))
+    REPORT_PROGRESS_EVERY = 10
+    
     # Chat Configuration
     MAX_CHAT_HISTORY = 10
     MAX_RECORDS_DISPLAY = 10
     MAX_SUGGESTIONS = 3
+    # "Load more" paging of a turn's result rows (/ai-chat/messages/<id>/rows)
+    RESULT_PAGE_SIZE = 20
+    RESULT_PAGE_MAX_SIZE = 100
+    # Full-result CSV/Parquet export streams from a server-side cursor in batches of this many rows
+    EXPORT_BATCH_SIZE = 2000
+    # "rules" uses the template engine in utils/suggestion_templates.py; "llm" asks the model
+    SUGGESTION_MODE = os.getenv("SUGGESTION_MODE", "rules")
+    
+    # Production Server (gunicorn.conf.py)
+    SERVER_BIND = os.getenv("SERVER_BIND", "0.0.0.0:8000")
+    # 0 sizes the pool from the CPU count (2 x cores + 1, capped at SERVER_MAX_WORKERS)
+    SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "0"))
+    SERVER_MAX_WORKERS = int(os.getenv("SERVER_MAX_WORKERS", "8"))
+    SERVER_THREADS = int(os.getenv("SERVER_THREADS", "4"))
+    SERVER_PRELOAD = os.getenv("SERVER_PRELOAD", "true").lower() == "true"
+    # Recycle a worker after this many requests (0 disables)
+    SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "1000"))
+    SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", "100"))
+    
+    # Warm-up and Readiness (/healthz, /readyz)
+    WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+    # Sends a one-token request per model to open provider connections (costs tokens)
+    WARMUP_LLM_PING = os.getenv("WARMUP_LLM_PING", "false").lower() == "true"
+    # /readyz stays 503 until these are ok; other components may be skipped
+    WARMUP_REQUIRED_COMPONENTS = ["graph", "database", "caches", "synthetic_request"]
+    # Failed required components are retried, doubling the delay up to the maximum
+    WARMUP_RETRY_INITIAL_SECONDS = float(os.getenv("WARMUP_RETRY_INITIAL_SECONDS", "5"))
+    WARMUP_RETRY_MAX_SECONDS = float(os.getenv("WARMUP_RETRY_MAX_SECONDS", "300"))
+    # /stats is open to faculty sessions and to these client addresses (e.g. a metrics scraper)
+    STATS_ALLOWED_IPS = [ip.strip() for ip in os.getenv("STATS_ALLOWED_IPS", "127.0.0.1,::1").split(",") if ip.strip()]
+    
+    # Logging (queued; written by a background thread)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+    # Prompts, conversation contexts and sample rows are only logged at DEBUG with this enabled
+    LOG_DEBUG_PAYLOADS = os.getenv("LOG_DEBUG_PAYLOADS", "false").lower() == "true"
+    LOG_COMPONENT_LEVELS = {
+        "httpx": "WARNING",
+        "httpcore": "WARNING"
+    }
+    # Fraction of INFO/DEBUG records kept per logger prefix (warnings and errors are never sampled)
+    LOG_SAMPLE_RATES = {
+        "utils.chart_generator": 0.1,
+        "utils.suggestion_templates": 0.1
+    }
+    
+    # Response Compression (JSON/HTML above the threshold; brotli when installed, else gzip)
+    RESPONSE_COMPRESSION_MIN_BYTES = 1024
+    RESPONSE_GZIP_LEVEL = 6
+    RESPONSE_BROTLI_QUALITY = 5
+    
+    # Chart Downsampling (bounded chart payloads for large result sets)
+    CHART_MAX_BARS = 15
+    CHART_MAX_LINE_POINTS = 30
+    CHART_MAX_SCATTER_POINTS = 300
+    CHART_CGPA_BIN_WIDTH = 0.5
+    CHART_ATTENDANCE_BIN_WIDTH = 5
+    
+    # Query Execution Configuration
+    # "postgres", or "duckdb" to run queries on the local snapshot (Postgres remains the fallback)
+    QUERY_BACKEND = os.getenv("QUERY_BACKEND", "postgres")
+    SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "snapshots/students.duckdb")
+    DB_POOL_MIN_CONNECTIONS = 1
+    DB_POOL_MAX_CONNECTIONS = int(os.getenv("DB_POOL_MAX_CONNECTIONS", "10"))
+    MAX_QUERY_ROWS = 1000
+    QUERY_CACHE_TTL_SECONDS = 300
+    QUERY_CACHE_MAX_ENTRIES = 256
+    # Rows of each conversation's latest answer, kept so follow-ups ("sort these by CGPA") skip SQL
+    RESULT_REUSE_ENABLED = os.getenv("RESULT_REUSE_ENABLED", "true").lower() == "true"
+    CONVERSATION_RESULT_TTL_SECONDS = 1800
+    CONVERSATION_RESULT_MAX_ENTRIES = 512
+    # Parent questions about their own child are answered from the precomputed profile document
+    PROFILE_ANSWERS_ENABLED = os.getenv("PROFILE_ANSWERS_ENABLED", "true").lower() == "true"
+    PROFILE_CACHE_TTL_SECONDS = 600
+    PROFILE_CACHE_MAX_ENTRIES = 2000
+    
+    # Few-shot SQL Examples (validated question -> SQL pairs from production)
+    SQL_EXAMPLE_INDEX_PATH = os.getenv("SQL_EXAMPLE_INDEX_PATH", "sql_examples.json")
+    SQL_EXAMPLE_MAX_ENTRIES = 2000
+    SQL_EXAMPLE_TOP_K = 3
+    # New examples are batched and written to disk in the background this long after the first change
+    SQL_EXAMPLE_SAVE_DELAY_SECONDS = float(os.getenv("SQL_EXAMPLE_SAVE_DELAY_SECONDS", "30"))
 
-# Set environment variables
-os.environ["USER_AGENT"] = Config.USER_AGENT
-os.environ["LANGCHAIN_API_KEY"] = Config.LANGCHAIN_API_KEY
-os.environ["COHERE_API_KEY"] = Config.COHERE_API_KEY
-os.environ["GROQ_API_KEY"] = Config.GROQ_API_KEY
\ No newline at end of file
+# Set environment variables (unset keys are left unset, e.g. for cassette replay without credentials)
+for name, value in {
+    "USER_AGENT": Config.USER_AGENT,
+    "LANGCHAIN_API_KEY": Config.LANGCHAIN_API_KEY,
+    "COHERE_API_KEY": Config.COHERE_API_KEY,
+    "GROQ_API_KEY": Config.GROQ_API_KEY
+}.items():
+    if value is not None:
+        os.environ[name] = value
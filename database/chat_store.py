@@ -0,0 +1,92 @@
+from threading import Lock
+from psycopg2.extras import Json
+from database.db_connection import pooled_db_connection
+from config import Config
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+CREATE_CHAT_MESSAGES_TABLE = """
+    CREATE TABLE IF NOT EXISTS chat_messages (
+        conversation_id TEXT NOT NULL,
+        message_id INTEGER NOT NULL,
+        message JSONB NOT NULL,
+        executed_sql TEXT,
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (conversation_id, message_id)
+    );
+"""
+
+class ChatStore:
+    """Chat history per conversation in the chat_messages table, keyed by (conversation_id, message_id).
+
+    The session cookie only carries the conversation id and the last
+    message id, so its size stays constant however long the conversation
+    gets, and every worker sees the same history. Only the newest
+    ``max_messages`` messages of a conversation are kept.
+    """
+
+    def __init__(self, max_messages=Config.MAX_CHAT_HISTORY):
+        self.max_messages = max_messages
+        self._table_ready = False
+        self._lock = Lock()
+
+    def _ensure_table(self):
+        with self._lock:
+            if self._table_ready:
+                return
+            with pooled_db_connection() as conn, conn.cursor() as cur:
+                cur.execute(CREATE_CHAT_MESSAGES_TABLE)
+                conn.commit()
+            self._table_ready = True
+
+    def append(self, conversation_id, message_id, message, executed_sql=None):
+        """Store ``message`` and drop the conversation's messages beyond the newest ``max_messages``"""
+        self._ensure_table()
+        with pooled_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO chat_messages (conversation_id, message_id, message, executed_sql) VALUES (%s, %s, %s, %s)
+                ON CONFLICT (conversation_id, message_id) DO UPDATE SET message = EXCLUDED.message, executed_sql = EXCLUDED.executed_sql
+            """, (conversation_id, message_id, Json(message, dumps=lambda obj: json.dumps(obj, default=str)), executed_sql))
+            cur.execute(
+                "DELETE FROM chat_messages WHERE conversation_id = %s AND message_id <= %s",
+                (conversation_id, message_id - self.max_messages)
+            )
+            conn.commit()
+
+    def messages(self, conversation_id, after_id=0):
+        """Messages of the conversation with an id above ``after_id``, oldest first"""
+        self._ensure_table()
+        with pooled_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT message, executed_sql FROM chat_messages WHERE conversation_id = %s AND message_id > %s ORDER BY message_id",
+                (conversation_id, after_id)
+            )
+            return [self._message(row) for row in cur.fetchall()]
+
+    def message(self, conversation_id, message_id):
+        """One message of the conversation, or None"""
+        self._ensure_table()
+        with pooled_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                "SELECT message, executed_sql FROM chat_messages WHERE conversation_id = %s AND message_id = %s",
+                (conversation_id, message_id)
+            )
+            row = cur.fetchone()
+        return self._message(row) if row is not None else None
+
+    def clear(self, conversation_id):
+        self._ensure_table()
+        with pooled_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM chat_messages WHERE conversation_id = %s", (conversation_id,))
+            conn.commit()
+
+    def _message(self, row):
+        message = row["message"]
+        if row["executed_sql"]:
+            message["executed_sql"] = row["executed_sql"]
+        return message
+
+# Shared across requests in this process
+chat_store = ChatStore()
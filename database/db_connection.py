@@ -1,10 +1,18 @@
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import ThreadedConnectionPool
+from contextlib import contextmanager
+from threading import Lock, BoundedSemaphore
 from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
+_db_pool = None
+_db_pool_lock = Lock()
+# ThreadedConnectionPool raises when exhausted; callers wait here instead
+_db_pool_slots = BoundedSemaphore(Config.DB_POOL_MAX_CONNECTIONS)
+
 def get_db_connection():
     """Get database connection"""
     try:
@@ -13,54 +21,187 @@ def get_db_connection():
         logger.error(f"Database connection error: {e}")
         raise
 
+def get_db_pool():
+    """Return the process-wide connection pool (created on first use)"""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            try:
+                _db_pool = ThreadedConnectionPool(
+                    Config.DB_POOL_MIN_CONNECTIONS, Config.DB_POOL_MAX_CONNECTIONS,
+                    Config.DATABASE_URL, cursor_factory=RealDictCursor
+                )
+            except Exception as e:
+                logger.error(f"Database connection error: {e}")
+                raise
+        return _db_pool
+
+def reset_db_pool():
+    """Forget a pool inherited across fork; the child opens its own on first use.
+
+    The inherited connections are not closed: their sockets are shared with
+    the parent, and closing them here would end the parent's sessions.
+    """
+    global _db_pool, _db_pool_slots
+    with _db_pool_lock:
+        _db_pool = None
+        _db_pool_slots = BoundedSemaphore(Config.DB_POOL_MAX_CONNECTIONS)
+
+@contextmanager
+def pooled_db_connection():
+    """Borrow a connection from the pool for the duration of the block"""
+    pool = get_db_pool()
+    with _db_pool_slots:
+        conn = pool.getconn()
+        try:
+            yield conn
+        finally:
+            # The pool rolls back open transactions and discards broken connections
+            pool.putconn(conn, close=conn.closed != 0)
+
 class DatabaseSchema:
     """Database schema information"""
     
-    SCHEMA_CONTEXT = """
-    Database Schema:
-    
-    Table: students
-    - roll_no (TEXT PRIMARY KEY) - Student roll number like 'AM.AR.U316BCA001'
-    - name (TEXT) - Student full name
-    - batch (TEXT) - Academic program/batch like 'BCA2016'
-    - branch (TEXT) - Branch like 'Bachelor of Computer Applications'
-    - cgpa_s1 (FLOAT) - Semester 1 CGPA
-    - cgpa_s2 (FLOAT) - Semester 2 CGPA
+    # Table definitions used to build the (optionally pruned) schema context.
+    # Columns with keywords are only sent when the question mentions one of
+    # them; for non-anchor tables all columns are sent when none match.
+    TABLES = {
+        'students': {
+            'alias': 's',
+            'description': '',
+            'keywords': [],
+            'anchor': True,
+            'columns': [
+                ('roll_no', 'TEXT PRIMARY KEY', "Student roll number like 'AM.AR.U316BCA001'", []),
+                ('name', 'TEXT', 'Student full name', []),
+                ('batch', 'TEXT', "Academic program/batch like 'BCA2016'", ['batch', 'program', 'year']),
+                ('branch', 'TEXT', "Branch like 'Bachelor of Computer Applications'", ['branch', 'department', 'bca', 'course']),
+                ('cgpa_s1', 'FLOAT', 'Semester 1 CGPA (shortcut for semester_cgpa where semester = 1)', ['cgpa', 'gpa', 'performance', 'topper', 'rank']),
+                ('cgpa_s2', 'FLOAT', 'Semester 2 CGPA (shortcut for semester_cgpa where semester = 2)', ['cgpa', 'gpa', 'performance', 'topper', 'rank'])
+            ],
+            'notes': []
+        },
+        'semester_cgpa': {
+            'alias': 'sc',
+            'description': 'CGPA for every semester',
+            'keywords': ['cgpa', 'gpa', 'semester', 'sem ', 's1', 's2', 's3', 'progress', 'improve', 'decline', 'trend', 'compare'],
+            'columns': [
+                ('roll_no', 'TEXT', 'References students(roll_no)', []),
+                ('semester', 'INTEGER', 'Semester number (1, 2, 3, ...)', []),
+                ('cgpa', 'FLOAT', 'CGPA for that semester', [])
+            ],
+            'notes': []
+        },
+        'attendance_and_marks': {
+            'alias': 'am',
+            'description': 'Subject data for every semester',
+            'keywords': [
+                'attendance', 'attended', 'present', 'absent', 'classes', 'held', 'subject', 'course', 'paper',
+                'grade', 'marks', 'score', 'pass', 'fail', 'status', 'rating', 'outstanding', 'excellent',
+                'english', 'education', 'communication', 'lab', 'programming', 'mathematics', 'dbms'
+            ],
+            'columns': [
+                ('id', 'SERIAL PRIMARY KEY', '', ['id']),
+                ('roll_no', 'TEXT', 'References students(roll_no)', []),
+                ('semester', 'INTEGER', 'Semester number (1, 2, 3, ...)', []),
+                ('subject', 'TEXT', 'Subject name (Cultural Education I, Communicative English, Professional Communication, etc.)', []),
+                ('attended', 'INTEGER', 'Classes attended', ['attend', 'present', 'absent', 'classes']),
+                ('held', 'INTEGER', 'Total classes held', ['attend', 'present', 'absent', 'classes', 'held']),
+                ('attendance_percentage', 'FLOAT', 'Attendance percentage', ['attend', 'present', 'absent', '%']),
+                ('grade', 'TEXT', 'Grade obtained (A, B, C, etc.)', ['grade', 'marks', 'score', 'outstanding', 'excellent', 'best', 'worst', 'top', 'perform']),
+                ('grade_point', 'INTEGER', 'Numeric value of grade (O=10, A+=9, A=8, B+=7, B=6, C+=5, C=4, D+=3, D=2, F=0)', ['grade', 'marks', 'score', 'outstanding', 'excellent', 'best', 'worst', 'top', 'rank', 'perform']),
+                ('ratings', 'TEXT', 'Performance ratings (Good, Average, Poor, etc.)', ['rating', 'perform']),
+                ('status', 'TEXT', 'Pass/Fail status', ['pass', 'fail', 'status', 'backlog', 'clear'])
+            ],
+            'notes': [
+                'attendance_and_marks is indexed on (roll_no, semester) and (semester, grade_point)',
+                'Rank or compare grades with am.grade_point (e.g. ORDER BY am.grade_point DESC), never CASE on grade'
+            ]
+        }
+    }
     
-    Table: attendance_and_marks_s1 (Semester 1 Data)
-    - id (SERIAL PRIMARY KEY)
-    - roll_no (TEXT) - References students(roll_no)
-    - subject (TEXT) - Subject name (Cultural Education I, Communicative English, etc.)
-    - attended (INTEGER) - Classes attended
-    - held (INTEGER) - Total classes held
-    - attendance_percentage (FLOAT) - Attendance percentage
-    - grade (TEXT) - Grade obtained (A, B, C, etc.)
-    - ratings (TEXT) - Performance ratings (Good, Average, Poor, etc.)
-    - status (TEXT) - Pass/Fail status
+    SCHEMA_NOTES = [
+        'Filter a single semester with am.semester = N or sc.semester = N',
+        'For questions spanning semesters, query attendance_and_marks or semester_cgpa once and\n      GROUP BY or ORDER BY the semester column; never UNION per-semester queries'
+    ]
     
-    Table: attendance_and_marks_s2 (Semester 2 Data)
-    - id (SERIAL PRIMARY KEY)
-    - roll_no (TEXT) - References students(roll_no)
-    - subject (TEXT) - Subject name (Cultural Education II, Professional Communication, etc.)
-    - attended (INTEGER) - Classes attended
-    - held (INTEGER) - Total classes held
-    - attendance_percentage (FLOAT) - Attendance percentage
-    - grade (TEXT) - Grade obtained (A, B, C, etc.)
-    - ratings (TEXT) - Performance ratings (Good, Average, Poor, etc.)
-    - status (TEXT) - Pass/Fail status
-    
-    Important Notes:
-    - Use 's' for students table alias
-    - Use 'am_s1' for attendance_and_marks_s1 table alias
-    - Use 'am_s2' for attendance_and_marks_s2 table alias
-    - Students have separate CGPA for each semester (cgpa_s1, cgpa_s2)
-    - Attendance and marks are stored separately for S1 and S2
-    - When querying both semesters, use UNION or separate joins
-    """
+    # Tables carrying a roll_no column that parent restrictions can be applied to
+    STUDENT_SCOPED_TABLES = (
+        'students', 'student_details', 'semester_cgpa', 'attendance_and_marks',
+        'attendance_and_marks_s1', 'attendance_and_marks_s2'
+    )
     
     GRADE_HIERARCHY = ['O', 'A+', 'A', 'B+', 'B', 'C+', 'C', 'D+', 'D', 'F']
+    GRADE_POINTS = {'O': 10, 'A+': 9, 'A': 8, 'B+': 7, 'B': 6, 'C+': 5, 'C': 4, 'D+': 3, 'D': 2, 'F': 0}
     GRADE_COLORS = ['#10b981', '#059669', '#0d9488', '#0891b2', '#0284c7', '#3b82f6', '#6366f1', '#8b5cf6', '#a855f7', '#ef4444']
     
+    @staticmethod
+    def build_schema_context(tables=None, question=None):
+        """Schema description for the given tables (all by default).
+        
+        With ``question``, columns guarded by keywords are dropped unless
+        the question mentions them.
+        """
+        tables = tables or list(DatabaseSchema.TABLES)
+        question_lower = question.lower() if question else None
+        
+        sections = ["Database Schema:"]
+        aliases = []
+        notes = []
+        for table_name in DatabaseSchema.TABLES:
+            if table_name not in tables:
+                continue
+            table = DatabaseSchema.TABLES[table_name]
+            columns = table['columns']
+            if question_lower is not None:
+                matched = [c for c in columns if c[3] and any(k in question_lower for k in c[3])]
+                if matched or table.get('anchor'):
+                    columns = [c for c in columns if not c[3] or c in matched]
+            
+            title = f"Table: {table_name}" + (f" ({table['description']})" if table['description'] else "")
+            lines = [title]
+            for column, column_type, description, _ in columns:
+                lines.append(f"- {column} ({column_type})" + (f" - {description}" if description else ""))
+            sections.append("\n    ".join(lines))
+            aliases.append(f"- Use '{table['alias']}' for {table_name} table alias")
+            notes.extend(f"- {note}" for note in table['notes'])
+        
+        notes = aliases + [f"- {note}" for note in DatabaseSchema.SCHEMA_NOTES] + notes
+        sections.append("Important Notes:\n    " + "\n    ".join(notes))
+        return "\n    " + "\n    \n    ".join(sections) + "\n    "
+    
+    @staticmethod
+    def prune_tables(question):
+        """Tables relevant to a question by keyword matching, or None when nothing matched"""
+        question_lower = question.lower()
+        tables = ['students']
+        for table_name, table in DatabaseSchema.TABLES.items():
+            if table['keywords'] and any(k in question_lower for k in table['keywords']):
+                tables.append(table_name)
+        
+        student_keywords = ['name', 'roll', 'student'] + [
+            k for _, _, _, keywords in DatabaseSchema.TABLES['students']['columns'] for k in keywords
+        ]
+        if len(tables) == 1 and not any(k in question_lower for k in student_keywords):
+            return None
+        return tables
+    
+    @staticmethod
+    def get_pruned_schema_context(question):
+        """Schema context limited to the tables and columns a question needs"""
+        tables = DatabaseSchema.prune_tables(question)
+        if tables is None:
+            # Nothing recognisable: send the full schema rather than guess
+            return DatabaseSchema.SCHEMA_CONTEXT
+        return DatabaseSchema.build_schema_context(tables, question)
+    
+    @staticmethod
+    def get_grade_point(grade):
+        """Numeric grade point for a grade, or None for unknown grades"""
+        if not grade:
+            return None
+        return DatabaseSchema.GRADE_POINTS.get(grade.strip().upper())
+    
     @staticmethod
     def get_grade_hierarchy_context():
         return """
@@ -75,4 +216,7 @@ class DatabaseSchema:
         - D+ (Poor) - (3 points)
         - D (Poor) - (2 points)
         - F (Fail) - (0 points)
-        """
\ No newline at end of file
+        """
+
+# Full (unpruned) schema description
+DatabaseSchema.SCHEMA_CONTEXT = DatabaseSchema.build_schema_context()
@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from threading import Lock
+from config import Config
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class QueryResultCache:
+    """Thread-safe LRU cache of query results with a TTL, keyed by canonical SQL"""
+
+    def __init__(self, max_entries=Config.QUERY_CACHE_MAX_ENTRIES, ttl_seconds=Config.QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, rows = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # Hand out copies so callers cannot mutate cached rows
+            return [dict(row) for row in rows]
+
+    def set(self, key, rows):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), [dict(row) for row in rows])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+def conversation_result_key(conversation_id, message_id):
+    return f"{conversation_id}:{message_id}"
+
+# Shared across requests in this process
+query_result_cache = QueryResultCache()
+# Rows behind each bot message, keyed by conversation_result_key (the SQL and metadata are in chat_store)
+conversation_results = QueryResultCache(Config.CONVERSATION_RESULT_MAX_ENTRIES, Config.CONVERSATION_RESULT_TTL_SECONDS)
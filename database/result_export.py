@@ -0,0 +1,114 @@
+from database.db_connection import pooled_db_connection
+from config import Config
+import csv
+import datetime
+import decimal
+import io
+import uuid
+import logging
+import psycopg2.extensions
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional; only Parquet export needs it
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+def iter_query_batches(parsed_query, batch_size=Config.EXPORT_BATCH_SIZE):
+    """Yield (columns, rows) per batch of at most ``batch_size`` tuples from a server-side cursor.
+
+    A named cursor keeps the result set in Postgres, so only one batch is
+    ever held here whatever the result size. An empty result still yields
+    one batch with the column names. The pooled connection is held until
+    the generator is exhausted or closed.
+    """
+    with pooled_db_connection() as conn:
+        cursor = conn.cursor(name=f"export_{uuid.uuid4().hex}", cursor_factory=psycopg2.extensions.cursor)
+        try:
+            cursor.itersize = batch_size
+            cursor.execute(parsed_query.sql)
+            rows = cursor.fetchmany(batch_size)
+            columns = [column.name for column in cursor.description]
+            yield columns, rows
+            while len(rows) == batch_size:
+                rows = cursor.fetchmany(batch_size)
+                if rows:
+                    yield columns, rows
+        finally:
+            cursor.close()
+
+def stream_csv(parsed_query):
+    """CSV text of the full result, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    total_rows = 0
+
+    for index, (columns, rows) in enumerate(iter_query_batches(parsed_query)):
+        if index == 0:
+            writer.writerow(columns)
+        writer.writerows(rows)
+        total_rows += len(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+
+    logger.info("CSV export finished: %d rows", total_rows)
+
+def _arrow_type(value):
+    if isinstance(value, bool):
+        return pa.bool_()
+    if isinstance(value, int):
+        return pa.int64()
+    if isinstance(value, (float, decimal.Decimal)):
+        return pa.float64()
+    if isinstance(value, datetime.datetime):
+        return pa.timestamp("us", tz="UTC" if value.tzinfo else None)
+    if isinstance(value, datetime.date):
+        return pa.date32()
+    return pa.string()
+
+def _arrow_value(value, arrow_type):
+    if value is None:
+        return None
+    if pa.types.is_string(arrow_type):
+        return str(value)
+    if pa.types.is_floating(arrow_type):
+        return float(value)
+    return value
+
+def write_parquet(parsed_query, sink):
+    """Write the full result as Parquet to ``sink`` (a path or binary file), one row group per batch.
+
+    Column types come from the first non-null value seen in each column
+    (unknown types are stored as strings), so every batch shares one schema
+    without reading the whole result first. Returns the row count.
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+
+    writer = None
+    total_rows = 0
+    try:
+        for columns, rows in iter_query_batches(parsed_query):
+            if writer is None:
+                types = []
+                for position, name in enumerate(columns):
+                    sample = next((row[position] for row in rows if row[position] is not None), None)
+                    types.append(_arrow_type(sample))
+                schema = pa.schema(list(zip(columns, types)))
+                writer = pq.ParquetWriter(sink, schema)
+
+            arrays = [
+                pa.array([_arrow_value(row[position], field.type) for row in rows], type=field.type)
+                for position, field in enumerate(writer.schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=writer.schema))
+            total_rows += len(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    logger.info("Parquet export finished: %d rows", total_rows)
+    return total_rows
@@ -0,0 +1,116 @@
+from threading import Lock
+from database.db_connection import pooled_db_connection, DatabaseSchema
+from config import Config
+import os
+import time
+import logging
+
+try:
+    import duckdb
+    import pandas as pd
+except ImportError:  # optional; queries then always go to Postgres
+    duckdb = None
+
+logger = logging.getLogger(__name__)
+
+class SnapshotStore:
+    """Read-only DuckDB copy of the student tables for in-process query execution.
+
+    ``refresh`` copies every relation in DatabaseSchema.STUDENT_SCOPED_TABLES
+    (base tables and compatibility views alike, materialized as tables) into
+    a new file and swaps it in atomically. Readers notice the new file by
+    its modification time and reopen, so every process picks up a refresh;
+    queries already running finish on the snapshot they started with.
+    """
+
+    def __init__(self, path=Config.SNAPSHOT_PATH):
+        self.path = path
+        self._lock = Lock()
+        self._connection = None
+        self._loaded_mtime = None
+
+    def is_available(self):
+        return duckdb is not None and os.path.exists(self.path)
+
+    def refresh(self):
+        """Rebuild the snapshot from Postgres; returns row counts per relation"""
+        if duckdb is None:
+            raise RuntimeError("duckdb is not installed")
+
+        started_at = time.monotonic()
+        temp_path = f"{self.path}.tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+        counts = {}
+        target = duckdb.connect(temp_path)
+        try:
+            with pooled_db_connection() as conn, conn.cursor() as cur:
+                for relation in DatabaseSchema.STUDENT_SCOPED_TABLES:
+                    cur.execute(f"SELECT * FROM {relation}")
+                    columns = [column.name for column in cur.description]
+                    frame = pd.DataFrame.from_records(cur.fetchall(), columns=columns).convert_dtypes()
+                    target.register("snapshot_frame", frame)
+                    target.execute(f"CREATE TABLE {relation} AS SELECT * FROM snapshot_frame")
+                    target.unregister("snapshot_frame")
+                    counts[relation] = len(frame)
+        finally:
+            target.close()
+
+        os.replace(temp_path, self.path)
+        logger.info("Snapshot refreshed in %.2fs: %s", time.monotonic() - started_at, counts)
+        return counts
+
+    def _current_connection(self):
+        mtime = os.path.getmtime(self.path)
+        with self._lock:
+            if self._connection is None or mtime != self._loaded_mtime:
+                # The old connection is not closed: queries running on its cursors keep it
+                # (and the replaced file) alive and it is released once the last one finishes.
+                # Each open gets its own in-memory database with the file attached, because
+                # duckdb.connect(path) would hand back the still-open instance of the old file.
+                # Postgres semantics for "/": integer operands divide to an integer, so both
+                # backends return the same rows for the same SQL (and may share cache entries)
+                quoted_path = self.path.replace("'", "''")
+                connection = duckdb.connect(":memory:", config={"integer_division": True})
+                connection.execute(f"ATTACH '{quoted_path}' AS snapshot (READ_ONLY)")
+                self._connection = connection
+                self._loaded_mtime = mtime
+                logger.info("Opened query snapshot %s", self.path)
+            return self._connection
+
+    def execute(self, sql):
+        """Run ``sql`` (DuckDB dialect) and return rows as dictionaries"""
+        # One cursor per call: DuckDB connections are not shared across threads
+        cursor = self._current_connection().cursor()
+        try:
+            cursor.execute("USE snapshot")
+            cursor.execute(sql)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    def reset(self):
+        """Forget a connection inherited across fork; the next query reopens the file"""
+        with self._lock:
+            self._connection = None
+            self._loaded_mtime = None
+
+    def stats(self):
+        if not self.is_available():
+            return {"available": False, "path": self.path}
+        return {
+            "available": True,
+            "path": self.path,
+            "age_seconds": round(time.time() - os.path.getmtime(self.path), 1)
+        }
+
+# Shared across requests in this process
+snapshot_store = SnapshotStore()
+
+if __name__ == "__main__":
+    # Manual refresh: python -m database.snapshot
+    logging.basicConfig(level=logging.INFO)
+    print(snapshot_store.refresh())
@@ -0,0 +1,132 @@
+from collections import OrderedDict
+from threading import Lock
+from database.db_connection import pooled_db_connection
+from config import Config
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CREATE_PROFILES_TABLE = """
+    CREATE TABLE IF NOT EXISTS student_profiles (
+        roll_no TEXT PRIMARY KEY REFERENCES student_details(roll_no) ON DELETE CASCADE,
+        profile JSONB NOT NULL,
+        built_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+# One document per student: details plus, per semester, CGPA, attendance, grade points and subject rows
+BUILD_PROFILES = """
+    INSERT INTO student_profiles (roll_no, profile, built_at)
+    SELECT d.roll_no, jsonb_build_object(
+        'roll_no', d.roll_no,
+        'name', d.name,
+        'batch', d.batch,
+        'branch', d.branch,
+        'semesters', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'semester', sem.semester,
+                'cgpa', c.cgpa,
+                'average_attendance', (
+                    SELECT round(avg(am.attendance_percentage)::numeric, 1)
+                    FROM attendance_and_marks am
+                    WHERE am.roll_no = d.roll_no AND am.semester = sem.semester
+                ),
+                'total_grade_points', (
+                    SELECT sum(am.grade_point)
+                    FROM attendance_and_marks am
+                    WHERE am.roll_no = d.roll_no AND am.semester = sem.semester
+                ),
+                'subjects', COALESCE((
+                    SELECT jsonb_agg(jsonb_build_object(
+                        'subject', am.subject,
+                        'attended', am.attended,
+                        'held', am.held,
+                        'attendance_percentage', am.attendance_percentage,
+                        'grade', am.grade,
+                        'grade_point', am.grade_point,
+                        'ratings', am.ratings,
+                        'status', am.status
+                    ) ORDER BY am.subject)
+                    FROM attendance_and_marks am
+                    WHERE am.roll_no = d.roll_no AND am.semester = sem.semester
+                ), '[]'::jsonb)
+            ) ORDER BY sem.semester)
+            FROM (
+                SELECT semester FROM semester_cgpa WHERE roll_no = d.roll_no
+                UNION
+                SELECT semester FROM attendance_and_marks WHERE roll_no = d.roll_no
+            ) sem
+            LEFT JOIN semester_cgpa c ON c.roll_no = d.roll_no AND c.semester = sem.semester
+        ), '[]'::jsonb)
+    ), now()
+    FROM student_details d
+    ON CONFLICT (roll_no) DO UPDATE SET profile = EXCLUDED.profile, built_at = EXCLUDED.built_at;
+"""
+
+class StudentProfileStore:
+    """Per-student profile documents in the student_profiles JSONB table, cached in memory.
+
+    ``rebuild`` runs at ingestion time. Cached documents are shared between
+    callers and must be treated as read-only; other processes see a rebuild
+    once their cached copy expires.
+    """
+
+    def __init__(self, max_entries=Config.PROFILE_CACHE_MAX_ENTRIES, ttl_seconds=Config.PROFILE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def rebuild(self):
+        """Recompute every student's document from the normalized tables; returns the count"""
+        started_at = time.monotonic()
+        with pooled_db_connection() as conn, conn.cursor() as cur:
+            cur.execute(CREATE_PROFILES_TABLE)
+            cur.execute(BUILD_PROFILES)
+            count = cur.rowcount
+            conn.commit()
+        self.clear()
+        logger.info("Rebuilt %d student profiles in %.2fs", count, time.monotonic() - started_at)
+        return count
+
+    def get(self, roll_no):
+        """The profile document for ``roll_no``, or None when it has not been built"""
+        with self._lock:
+            entry = self._entries.get(roll_no)
+            if entry is not None and time.monotonic() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(roll_no)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        with pooled_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT profile FROM student_profiles WHERE roll_no = %s", (roll_no,))
+            row = cur.fetchone()
+        if row is None:
+            return None
+
+        with self._lock:
+            self._entries[roll_no] = (time.monotonic(), row["profile"])
+            self._entries.move_to_end(roll_no)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return row["profile"]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+# Shared across requests in this process
+student_profiles = StudentProfileStore()
+
+if __name__ == "__main__":
+    # Manual rebuild: python -m database.student_profiles
+    logging.basicConfig(level=logging.INFO)
+    print(student_profiles.rebuild())
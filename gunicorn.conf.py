@@ -0,0 +1,46 @@
+"""Gunicorn settings for production.
+
+Run with ``gunicorn -c gunicorn.conf.py wsgi:app``. Every setting can be
+overridden through the SERVER_* environment variables read by Config.
+"""
+from config import Config
+import multiprocessing
+import os
+
+bind = Config.SERVER_BIND
+
+# Requests mostly wait on the LLM and the database, so threads per worker go further than more processes
+worker_class = "gthread"
+threads = Config.SERVER_THREADS
+workers = Config.SERVER_WORKERS or min(multiprocessing.cpu_count() * 2 + 1, Config.SERVER_MAX_WORKERS)
+
+# Preloading compiles the graph once in the master and shares it copy-on-write;
+# pools, clients and threads are rebuilt in post_fork
+preload_app = Config.SERVER_PRELOAD
+if preload_app:
+    # Read by app.py: threads started in the master would not survive the fork
+    os.environ["WARMUP_IN_POST_FORK"] = "true"
+
+# Worker recycling (0 disables); jitter keeps workers from restarting together
+max_requests = Config.SERVER_MAX_REQUESTS
+max_requests_jitter = Config.SERVER_MAX_REQUESTS_JITTER
+
+# A chat turn may use the whole LLM latency budget
+timeout = int(Config.REQUEST_LATENCY_BUDGET_SECONDS) + 30
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+def post_fork(server, worker):
+    from utils.fork_safety import reinitialize_after_fork
+    reinitialize_after_fork(workers)
+
+    # Under preload the app skipped warm-up at import; each worker warms its own pools
+    if preload_app and Config.WARMUP_ON_STARTUP:
+        from workflows.warmup import start_warmup
+        start_warmup()
+
+def on_starting(server):
+    server.log.info(f"Starting {workers} workers x {threads} threads (preload={preload_app}, max_requests={max_requests})")
@@ -1,17 +1,67 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify
-from workflows.multi_agent_workflow import create_multi_agent_workflow
+from flask import Blueprint, render_template, request, session, redirect, url_for, flash, jsonify, Response, stream_with_context, send_file
+from workflows.multi_agent_workflow import get_compiled_workflow, build_initial_state, execute_batch
+from agents.data_executor import fetch_result_page, prepare_stored_query
+from database.chat_store import chat_store
+from database.query_cache import conversation_results, conversation_result_key
+from database.result_export import stream_csv, write_parquet
+from utils.llm_client import llm_user_context, llm_request_budget
+from utils.logging_setup import payload_logging_enabled
+from utils.sql_canonicalizer import SQLParseError, SQLRewriteError
 from config import Config
 import datetime
+import json
 import logging
 import re
+import tempfile
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
 # Create blueprint
 chat_bp = Blueprint('chat', __name__)
 
-# Create the multi-agent workflow
-multi_agent_graph = create_multi_agent_workflow()
+# Compiled once per process and shared with the warm-up
+multi_agent_graph = get_compiled_workflow()
+
+def format_suggestions(suggested_questions):
+    """Split the numbered suggestion list into individual questions"""
+    formatted_suggestions = []
+    if suggested_questions:
+        questions = re.findall(r'\d+\.\s*(.*?)(?=\d+\.|\Z)', suggested_questions + "0. ", re.DOTALL)
+        for q in questions:
+            q = q.strip()
+            if q and len(q) > 3:
+                formatted_suggestions.append(q)
+    return formatted_suggestions[:Config.MAX_SUGGESTIONS]
+
+def append_chat_message(message):
+    """Store ``message`` in the conversation's history with the next message id"""
+    message_id = session.get("chat_message_seq", 0) + 1
+    session["chat_message_seq"] = message_id
+    message["id"] = message_id
+    stored = {key: value for key, value in message.items() if key != "executed_sql"}
+    chat_store.append(session["conversation_id"], message_id, stored, message.get("executed_sql"))
+    return message
+
+def client_message(message):
+    """``message`` as sent to the browser; the executed SQL stays in chat_store"""
+    return {key: value for key, value in message.items() if key != "executed_sql"}
+
+def chat_history():
+    """The current conversation's stored messages (with their executed SQL), oldest first"""
+    if "conversation_id" not in session:
+        return []
+    return chat_store.messages(session["conversation_id"])
+
+def messages_since(last_message_id):
+    """Messages the client has not seen yet"""
+    return [client_message(message) for message in chat_store.messages(session["conversation_id"], last_message_id)]
+
+def find_chat_message(message_id):
+    if "conversation_id" not in session:
+        return None
+    return chat_store.message(session["conversation_id"], message_id)
 
 @chat_bp.route("/ai-chat", methods=["GET", "POST"])
 def ai_chat():
@@ -25,12 +75,14 @@ def ai_chat():
     student_id = session.get("student_id", None)
     student_name = session.get("student_name", "Student")
     
-    logger.info(f"=== CHAT SESSION ===")
-    logger.info(f"User Type: {user_type}, Student ID: {student_id}")
+    logger.info("=== CHAT SESSION ===")
+    logger.info("User Type: %s, Student ID: %s", user_type, student_id)
     
-    # Initialize chat history
-    if "chat_history" not in session:
-        session["chat_history"] = []
+    # Messages live in chat_store; the cookie only keeps the conversation id and the last message id
+    session.pop("chat_history", None)
+    if "conversation_id" not in session:
+        session["conversation_id"] = uuid.uuid4().hex
+        session["chat_message_seq"] = 0
 
     if request.method == "POST" and "question" in request.form:
         question = request.form.get("question")
@@ -41,83 +93,85 @@ def ai_chat():
             or request.accept_mimetypes['application/json'] > request.accept_mimetypes['text/html']
         )
         
+        # Clients using the delta protocol send the id of the last message they have rendered
+        last_message_id = request.form.get("last_message_id", type=int)
+        
+        # History before this question, so the workflow does not see it twice
+        previous_chat_history = chat_history()
+        
         # Add user message to history BEFORE processing
         user_message = {
             "type": "user",
             "content": question,
             "timestamp": current_time
         }
-        session["chat_history"].append(user_message)
-        session.modified = True
+        append_chat_message(user_message)
         
         # Log chat history for debugging
-        logger.info(f"Chat history before workflow: {len(session['chat_history'])} messages")
-        for i, msg in enumerate(session["chat_history"][-4:]):  # Show last 4 messages
-            logger.info(f"  Message {i}: {msg.get('type')} - {msg.get('content', '')[:50]}...")
+        logger.info("Chat history before workflow: %d messages", len(previous_chat_history))
+        if payload_logging_enabled(logger):
+            for i, msg in enumerate(previous_chat_history[-4:]):  # Show last 4 messages
+                logger.debug("  Message %d: %s - %s...", i, msg.get('type'), msg.get('content', '')[:50])
         
         try:
             # Prepare state for multi-agent workflow with chat history
-            # Get chat history excluding the current user message to avoid circular reference
-            previous_chat_history = session["chat_history"][:-1] if session.get("chat_history") else []
-            
-            workflow_state = {
-                "question": question,
-                "chat_history": previous_chat_history,
-                "generated_prompt": "",
-                "user_type": user_type,
-                "parent_student_id": student_id if user_type == "parent" else None,
-                "sql_query": "",
-                "retrieved_data": [],
-                "formatted_context": "",
-                "answer": "",
-                "suggested_questions": "",
-                "access_denied": False,
-                "chart_data": None
-            }
+            workflow_state = build_initial_state(question, user_type, student_id, previous_chat_history, session["conversation_id"])
             
-            logger.info(f"=== STARTING MULTI-AGENT WORKFLOW WITH CONTEXT ===")
-            logger.info(f"Workflow state chat_history length: {len(workflow_state['chat_history'])}")
+            logger.info("=== STARTING MULTI-AGENT WORKFLOW WITH CONTEXT ===")
+            logger.info("Workflow state chat_history length: %d", len(workflow_state['chat_history']))
             
-            # Execute the multi-agent workflow
-            result = multi_agent_graph.invoke(workflow_state)
+            # Execute the multi-agent workflow; LLM calls are queued per user and bounded by the turn's budget
+            with llm_user_context(session["user"]), llm_request_budget():
+                result = multi_agent_graph.invoke(workflow_state)
             
-            logger.info(f"=== WORKFLOW COMPLETED ===")
+            logger.info("=== WORKFLOW COMPLETED ===")
             
             response = result.get("answer", "I encountered an issue processing your request.")
             suggested_questions = result.get("suggested_questions", "")
             chart_data = result.get("chart_data", None)
             
             # Format suggested questions
-            formatted_suggestions = []
-            if suggested_questions:
-                questions = re.findall(r'\d+\.\s*(.*?)(?=\d+\.|\Z)', suggested_questions + "0. ", re.DOTALL)
-                for q in questions:
-                    q = q.strip()
-                    if q and len(q) > 3:
-                        formatted_suggestions.append(q)
+            formatted_suggestions = format_suggestions(suggested_questions)
             
             # Create bot response
             bot_message = {
                 "type": "bot",
                 "content": response,
                 "timestamp": current_time,
-                "suggestions": formatted_suggestions[:Config.MAX_SUGGESTIONS],
+                "suggestions": formatted_suggestions,
                 "chart_data": chart_data
             }
             
-            session["chat_history"].append(bot_message)
+            # The SQL that produced the rows is stored with the message (never sent to the client)
+            # so paging, export and result reuse can read the rows again by message id
+            retrieved_data = result.get("retrieved_data") or []
+            has_rows = bool(result.get("executed_sql") and retrieved_data and not result.get("access_denied"))
+            if has_rows:
+                bot_message["executed_sql"] = result["executed_sql"]
+                bot_message["result"] = {
+                    "row_count": len(retrieved_data),
+                    "truncated": len(retrieved_data) >= Config.MAX_QUERY_ROWS,
+                    "columns": list(retrieved_data[0].keys())
+                }
             
-            # Manage chat history length
-            if len(session["chat_history"]) > Config.MAX_CHAT_HISTORY:
-                session["chat_history"] = session["chat_history"][-Config.MAX_CHAT_HISTORY:]
-            
-            session.modified = True
+            # The store keeps only the newest MAX_CHAT_HISTORY messages
+            append_chat_message(bot_message)
+            if has_rows:
+                # Follow-ups that only reshape these rows are answered from here without new SQL
+                conversation_results.set(conversation_result_key(session["conversation_id"], bot_message["id"]), retrieved_data)
             
             if is_ajax_request:
+                if last_message_id is not None:
+                    # Only what the client is missing, so the response size does not grow with the conversation
+                    return jsonify({
+                        "success": True,
+                        "messages": messages_since(last_message_id),
+                        "last_message_id": session["chat_message_seq"]
+                    })
                 return jsonify({
                     "success": True,
-                    "message": bot_message,
-                    "chat_history": session["chat_history"]
+                    "message": client_message(bot_message),
+                    "chat_history": [client_message(message) for message in chat_history()]
                 })
             else:
                 return redirect(url_for('chat.ai_chat'))
@@ -134,7 +188,8 @@ def ai_chat():
     
     # GET request - render template
     template_data = {
-        "chat_history": session.get("chat_history", []),
+        "chat_history": [client_message(message) for message in chat_history()],
+        "last_message_id": session.get("chat_message_seq", 0),
         "user_type": user_type,
         "student_id": student_id,
         "student_name": student_name
@@ -142,11 +197,129 @@ def ai_chat():
     
     return render_template("chat.html", **template_data)
 
+@chat_bp.route("/ai-chat/messages/<int:message_id>/rows", methods=["GET"])
+def message_rows(message_id):
+    """A page of the rows behind a bot message, re-read with the SQL stored for that turn"""
+    if "user" not in session:
+        return jsonify({"error": "Authentication required"}), 401
+    
+    message = find_chat_message(message_id)
+    if message is None or not message.get("executed_sql"):
+        return jsonify({"error": "No query results for this message"}), 404
+    
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    page_size = min(max(request.args.get("limit", Config.RESULT_PAGE_SIZE, type=int), 1), Config.RESULT_PAGE_MAX_SIZE)
+    user_type = session.get("user_type", "faculty")
+    student_id = session.get("student_id", None)
+    
+    try:
+        rows, has_more = fetch_result_page(message["executed_sql"], user_type, student_id, offset, page_size)
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    except (SQLParseError, SQLRewriteError) as e:
+        logger.warning("Cannot page results of message %s: %s", message_id, e)
+        return jsonify({"error": "These results cannot be paged"}), 400
+    except Exception as e:
+        logger.error("Error fetching result page for message %s: %s", message_id, e)
+        return jsonify({"error": "Could not load more rows"}), 500
+    
+    return jsonify({
+        "message_id": message_id,
+        "offset": offset,
+        "columns": list(rows[0].keys()) if rows else [],
+        "rows": rows,
+        "has_more": has_more,
+        "next_offset": offset + len(rows)
+    })
+
+@chat_bp.route("/ai-chat/messages/<int:message_id>/export", methods=["GET"])
+def export_message_rows(message_id):
+    """Download every row behind a bot message as CSV (streamed) or Parquet"""
+    if "user" not in session:
+        return jsonify({"error": "Authentication required"}), 401
+    
+    message = find_chat_message(message_id)
+    if message is None or not message.get("executed_sql"):
+        return jsonify({"error": "No query results for this message"}), 404
+    
+    export_format = request.args.get("format", "csv")
+    if export_format not in ("csv", "parquet"):
+        return jsonify({"error": "Format must be 'csv' or 'parquet'"}), 400
+    
+    try:
+        parsed_query = prepare_stored_query(message["executed_sql"], session.get("user_type", "faculty"), session.get("student_id", None))
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    except SQLParseError as e:
+        logger.warning("Cannot export results of message %s: %s", message_id, e)
+        return jsonify({"error": "These results cannot be exported"}), 400
+    
+    filename = f"results-{message_id}.{export_format}"
+    logger.info("Exporting message %s as %s for %s", message_id, export_format, session['user'])
+    
+    if export_format == "csv":
+        return Response(
+            stream_with_context(stream_csv(parsed_query)),
+            mimetype="text/csv",
+            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        )
+    
+    # Parquet needs its footer written last, so it is built in a temporary file and streamed from there
+    export_file = tempfile.TemporaryFile(suffix=".parquet")
+    try:
+        write_parquet(parsed_query, export_file)
+    except Exception as e:
+        export_file.close()
+        logger.error("Parquet export of message %s failed: %s", message_id, e)
+        return jsonify({"error": "Could not export these results"}), 500
+    export_file.seek(0)
+    return send_file(export_file, mimetype="application/vnd.apache.parquet", as_attachment=True, download_name=filename)
+
+@chat_bp.route("/ai-chat/batch", methods=["POST"])
+def ai_chat_batch():
+    """Answer a list of independent questions, streaming one NDJSON line per answer as it finishes"""
+    if "user" not in session:
+        return jsonify({"error": "Authentication required"}), 401
+    
+    payload = request.get_json(silent=True) or {}
+    questions = payload.get("questions")
+    if not isinstance(questions, list) or not questions:
+        return jsonify({"error": "Provide a non-empty 'questions' list"}), 400
+    questions = [str(q).strip() for q in questions if str(q).strip()]
+    if not questions or len(questions) > Config.BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"A batch must contain between 1 and {Config.BATCH_MAX_QUESTIONS} questions"}), 400
+    
+    user_id = session["user"]
+    user_type = session.get("user_type", "faculty")
+    student_id = session.get("student_id", None)
+    logger.info("=== BATCH REQUEST: %d questions from %s (%s) ===", len(questions), user_id, user_type)
+    
+    def generate():
+        started_at = time.monotonic()
+        errors = 0
+        for item in execute_batch(multi_agent_graph, questions, user_id, user_type, student_id):
+            if "error" in item:
+                errors += 1
+            else:
+                item["suggestions"] = format_suggestions(item.pop("suggested_questions"))
+            yield json.dumps(item, default=str) + "\n"
+        yield json.dumps({
+            "done": True,
+            "count": len(questions),
+            "errors": errors,
+            "total_ms": round((time.monotonic() - started_at) * 1000, 1)
+        }) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 @chat_bp.route("/clear-chat", methods=["POST"])
 def clear_chat():
     """Clear all chat history and context"""
-    if "chat_history" in session:
-        session["chat_history"] = []
+    conversation_id = session.pop("conversation_id", None)
+    if conversation_id:
+        chat_store.clear(conversation_id)
+    session.pop("chat_message_seq", None)
+    session.pop("chat_history", None)
     if "chat_context" in session:
         session["chat_context"] = ""
     
@@ -155,7 +328,6 @@ def clear_chat():
     
     # Log the chat history clearing for debugging
     logger.info("=== CHAT HISTORY CLEARED ===")
-    logger.info(f"Session chat_history length after clear: {len(session.get('chat_history', []))}")
     
     return redirect(url_for('chat.ai_chat'))
 
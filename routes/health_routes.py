@@ -0,0 +1,33 @@
+from flask import Blueprint, jsonify, request, session
+from workflows.warmup import warmup_status
+from agents.speculative_planner import speculation_stats
+from utils.llm_client import get_llm_stats
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Create blueprint
+health_bp = Blueprint('health', __name__)
+
+@health_bp.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is serving; includes warm-up progress per component"""
+    return jsonify({"status": "alive", **warmup_status.snapshot()})
+
+@health_bp.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: 200 only once warm-up has finished and every required component is hot"""
+    snapshot = warmup_status.snapshot()
+    snapshot["llm"] = get_llm_stats()["scheduler"]
+    return jsonify(snapshot), 200 if snapshot["ready"] else 503
+
+@health_bp.route("/stats", methods=["GET"])
+def stats():
+    """LLM traffic counters (scheduler, coalesced calls, per-agent and per-tier p50/p95/p99, tokens, cost) and speculation win rate"""
+    if request.remote_addr not in Config.STATS_ALLOWED_IPS:
+        if "user" not in session:
+            return jsonify({"error": "Authentication required"}), 401
+        if session.get("user_type", "faculty") != "faculty":
+            return jsonify({"error": "Faculty access required"}), 403
+    return jsonify({**get_llm_stats(), "speculation": speculation_stats.snapshot()})
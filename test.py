@@ -3,6 +3,10 @@ import re
 import psycopg2
 from pathlib import Path
 from dotenv import load_dotenv
+from database.db_connection import DatabaseSchema
+from database.snapshot import snapshot_store
+from database.student_profiles import student_profiles
+from config import Config
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -11,62 +15,100 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 def connect_db():
     return psycopg2.connect(DATABASE_URL)
 
+# Semesters that keep their legacy attendance_and_marks_s<N> view / students.cgpa_s<N> column
+LEGACY_SEMESTERS = (1, 2)
+
+# === Drop a table or view, whichever the name currently refers to ===
+def drop_relation(cur, name):
+    cur.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relkind IN ('r', 'v');", (name,))
+    row = cur.fetchone()
+    if row is None:
+        return
+    kind = "VIEW" if row[0] == 'v' else "TABLE"
+    cur.execute(f"DROP {kind} IF EXISTS {name} CASCADE;")
+
 # === Drop old tables and recreate with new structure ===
 def recreate_tables(conn):
     with conn.cursor() as cur:
-        # Drop ALL related tables to start fresh
-        cur.execute("DROP TABLE IF EXISTS attendance_and_marks CASCADE;")
-        cur.execute("DROP TABLE IF EXISTS attendance_and_marks_s1 CASCADE;")
-        cur.execute("DROP TABLE IF EXISTS attendance_and_marks_s2 CASCADE;")
-        cur.execute("DROP TABLE IF EXISTS students CASCADE;")
+        # Drop ALL related tables and views to start fresh
+        for name in ("student_profiles", "attendance_and_marks_s1", "attendance_and_marks_s2", "students",
+                     "attendance_and_marks", "semester_cgpa", "student_details"):
+            drop_relation(cur, name)
         
         print("🗑️ All old tables dropped successfully!")
         
-        # Create students table with S1 and S2 CGPA columns
+        # Create student details table (one row per student)
         cur.execute("""
-            CREATE TABLE students (
+            CREATE TABLE student_details (
                 roll_no TEXT PRIMARY KEY,
                 name TEXT NOT NULL,
                 batch TEXT,
-                branch TEXT,
-                cgpa_s1 FLOAT,
-                cgpa_s2 FLOAT
+                branch TEXT
             );
         """)
         
-        # Create S1 attendance and marks table
+        # Create per-semester CGPA table (one row per student per semester)
         cur.execute("""
-            CREATE TABLE attendance_and_marks_s1 (
-                id SERIAL PRIMARY KEY,
-                roll_no TEXT REFERENCES students(roll_no) ON DELETE CASCADE,
-                subject TEXT NOT NULL,
-                attended INTEGER,
-                held INTEGER,
-                attendance_percentage FLOAT,
-                grade TEXT,
-                ratings TEXT,
-                status TEXT
+            CREATE TABLE semester_cgpa (
+                roll_no TEXT REFERENCES student_details(roll_no) ON DELETE CASCADE,
+                semester INTEGER NOT NULL,
+                cgpa FLOAT,
+                PRIMARY KEY (roll_no, semester)
             );
         """)
         
-        # Create S2 attendance and marks table
+        # Create unified attendance and marks table for all semesters
         cur.execute("""
-            CREATE TABLE attendance_and_marks_s2 (
+            CREATE TABLE attendance_and_marks (
                 id SERIAL PRIMARY KEY,
-                roll_no TEXT REFERENCES students(roll_no) ON DELETE CASCADE,
+                roll_no TEXT REFERENCES student_details(roll_no) ON DELETE CASCADE,
+                semester INTEGER NOT NULL,
                 subject TEXT NOT NULL,
                 attended INTEGER,
                 held INTEGER,
                 attendance_percentage FLOAT,
                 grade TEXT,
+                grade_point INTEGER,
                 ratings TEXT,
                 status TEXT
             );
         """)
+        cur.execute("CREATE INDEX idx_attendance_and_marks_roll_no_semester ON attendance_and_marks (roll_no, semester);")
+        cur.execute("CREATE INDEX idx_attendance_and_marks_semester_grade_point ON attendance_and_marks (semester, grade_point DESC);")
+        # Rankings across all semesters (ORDER BY grade_point without a semester filter)
+        cur.execute("CREATE INDEX idx_attendance_and_marks_grade_point ON attendance_and_marks (grade_point DESC);")
+        
+        create_compatibility_views(cur)
         
         print("✅ New tables created successfully!")
     conn.commit()
 
+# === Compatibility views for the old per-semester table and column names ===
+def create_compatibility_views(cur):
+    cgpa_columns = ",\n".join(
+        f"                   c{n}.cgpa AS cgpa_s{n}" for n in LEGACY_SEMESTERS
+    )
+    cgpa_joins = "\n".join(
+        f"            LEFT JOIN semester_cgpa c{n} ON c{n}.roll_no = d.roll_no AND c{n}.semester = {n}"
+        for n in LEGACY_SEMESTERS
+    )
+    cur.execute(f"""
+        CREATE VIEW students AS
+            SELECT d.roll_no, d.name, d.batch, d.branch,
+{cgpa_columns}
+            FROM student_details d
+{cgpa_joins};
+    """)
+    
+    for n in LEGACY_SEMESTERS:
+        cur.execute(f"""
+            CREATE VIEW attendance_and_marks_s{n} AS
+                SELECT id, roll_no, subject, attended, held,
+                       attendance_percentage, grade, ratings, status, grade_point
+                FROM attendance_and_marks
+                WHERE semester = {n};
+        """)
+
 # === Extract the Subject Table from Markdown ===
 def extract_subject_table(content):
     lines = content.splitlines()
@@ -113,8 +155,12 @@ def parse_markdown_file(file_path):
     batch = re.search(r"\*\*Academic Program\*\*: (.+)", content).group(1).strip()
     branch = re.search(r"\*\*Branch\*\*: (.+)", content).group(1).strip()
 
-    # Determine semester from file name or content
-    semester = "S2" if "Even Semester" in content or file_path.name.startswith("s2_") else "S1"
+    # Determine semester from file name (s<N>_*.md) or content
+    semester_match = re.match(r"s(\d+)_", file_path.name)
+    if semester_match:
+        semester = int(semester_match.group(1))
+    else:
+        semester = 2 if "Even Semester" in content else 1
 
     subjects = extract_subject_table(content)
 
@@ -132,68 +178,40 @@ def parse_markdown_file(file_path):
 def insert_student_data(conn, student):
     try:
         with conn.cursor() as cur:
-            # Check if student exists
-            cur.execute("SELECT roll_no FROM students WHERE roll_no = %s;", (student['roll_no'],))
-            student_exists = cur.fetchone() is not None
+            # Insert new student or update existing one
+            cur.execute("""
+                INSERT INTO student_details (roll_no, name, batch, branch)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (roll_no) DO UPDATE
+                SET name = EXCLUDED.name, batch = EXCLUDED.batch, branch = EXCLUDED.branch;
+            """, (student['roll_no'], student['name'], student['batch'], student['branch']))
+            
+            cur.execute("""
+                INSERT INTO semester_cgpa (roll_no, semester, cgpa)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (roll_no, semester) DO UPDATE SET cgpa = EXCLUDED.cgpa;
+            """, (student['roll_no'], student['semester'], student['cgpa']))
             
-            if not student_exists:
-                # Insert new student
-                if student['semester'] == "S1":
-                    cur.execute("""
-                        INSERT INTO students (roll_no, name, batch, branch, cgpa_s1)
-                        VALUES (%s, %s, %s, %s, %s);
-                    """, (student['roll_no'], student['name'], student['batch'], student['branch'], student['cgpa']))
-                else:  # S2
-                    cur.execute("""
-                        INSERT INTO students (roll_no, name, batch, branch, cgpa_s2)
-                        VALUES (%s, %s, %s, %s, %s);
-                    """, (student['roll_no'], student['name'], student['batch'], student['branch'], student['cgpa']))
-            else:
-                # Update existing student
-                if student['semester'] == "S1":
-                    cur.execute("""
-                        UPDATE students SET cgpa_s1 = %s WHERE roll_no = %s;
-                    """, (student['cgpa'], student['roll_no']))
-                else:  # S2
-                    cur.execute("""
-                        UPDATE students SET cgpa_s2 = %s WHERE roll_no = %s;
-                    """, (student['cgpa'], student['roll_no']))
+            # Clear existing subjects for this student and semester
+            cur.execute("DELETE FROM attendance_and_marks WHERE roll_no = %s AND semester = %s;",
+                        (student['roll_no'], student['semester']))
             
-            # Insert subjects based on semester
-            if student['semester'] == "S1":
-                # Clear existing S1 subjects for this student
-                cur.execute("DELETE FROM attendance_and_marks_s1 WHERE roll_no = %s;", (student['roll_no'],))
-                
-                # Insert S1 subjects
-                for subj in student['subjects']:
-                    cur.execute("""
-                        INSERT INTO attendance_and_marks_s1 (
-                            roll_no, subject, attended, held,
-                            attendance_percentage, grade, ratings, status
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
-                    """, (
-                        student['roll_no'],
-                        subj['subject'], subj['attended'], subj['held'],
-                        subj['percentage'], subj['grade'],
-                        subj['ratings'], subj['status']
-                    ))
-            else:  # S2
-                # Clear existing S2 subjects for this student
-                cur.execute("DELETE FROM attendance_and_marks_s2 WHERE roll_no = %s;", (student['roll_no'],))
-                
-                # Insert S2 subjects
-                for subj in student['subjects']:
-                    cur.execute("""
-                        INSERT INTO attendance_and_marks_s2 (
-                            roll_no, subject, attended, held,
-                            attendance_percentage, grade, ratings, status
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s);
-                    """, (
-                        student['roll_no'],
-                        subj['subject'], subj['attended'], subj['held'],
-                        subj['percentage'], subj['grade'],
-                        subj['ratings'], subj['status']
-                    ))
+            # Insert subjects
+            cur.executemany("""
+                INSERT INTO attendance_and_marks (
+                    roll_no, semester, subject, attended, held,
+                    attendance_percentage, grade, grade_point, ratings, status
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s);
+            """, [
+                (
+                    student['roll_no'], student['semester'],
+                    subj['subject'], subj['attended'], subj['held'],
+                    subj['percentage'], subj['grade'],
+                    DatabaseSchema.get_grade_point(subj['grade']),
+                    subj['ratings'], subj['status']
+                )
+                for subj in student['subjects']
+            ])
         conn.commit()
         return True
     except Exception as e:
@@ -210,65 +228,72 @@ def main():
 
     markdown_dir = Path("markdownfiles")
     
-    processed_s1 = 0
-    processed_s2 = 0
+    processed = {}
     
-    print("🔄 Processing S1 files...")
-    # Process S1 files first
-    for file in markdown_dir.glob("*.md"):
-        if not file.name.startswith("s2_"):
-            try:
-                student_data = parse_markdown_file(file)
-                print(f"📚 Parsed {len(student_data['subjects'])} S1 subjects for {student_data['name']}")
-                if insert_student_data(conn, student_data):
-                    print(f"✅ Inserted S1: {student_data['name']} ({student_data['roll_no']})")
-                    processed_s1 += 1
-            except Exception as e:
-                print(f"❌ Error processing {file.name}: {e}")
-    
-    print(f"\n🔄 Processing S2 files...")
-    # Process S2 files
-    for file in markdown_dir.glob("s2_*.md"):
+    print("🔄 Processing semester files...")
+    for file in sorted(markdown_dir.glob("*.md")):
         try:
             student_data = parse_markdown_file(file)
-            print(f"📚 Parsed {len(student_data['subjects'])} S2 subjects for {student_data['name']}")
+            semester = student_data['semester']
+            print(f"📚 Parsed {len(student_data['subjects'])} S{semester} subjects for {student_data['name']}")
             if insert_student_data(conn, student_data):
-                print(f"✅ Inserted S2: {student_data['name']} ({student_data['roll_no']})")
-                processed_s2 += 1
+                print(f"✅ Inserted S{semester}: {student_data['name']} ({student_data['roll_no']})")
+                processed[semester] = processed.get(semester, 0) + 1
         except Exception as e:
             print(f"❌ Error processing {file.name}: {e}")
 
     # Display summary
     try:
         with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM students;")
+            cur.execute("SELECT COUNT(*) FROM student_details;")
             student_count = cur.fetchone()[0]
             
-            cur.execute("SELECT COUNT(*) FROM attendance_and_marks_s1;")
-            s1_records = cur.fetchone()[0]
-            
-            cur.execute("SELECT COUNT(*) FROM attendance_and_marks_s2;")
-            s2_records = cur.fetchone()[0]
+            cur.execute("SELECT semester, COUNT(*) FROM attendance_and_marks GROUP BY semester ORDER BY semester;")
+            semester_records = cur.fetchall()
             
-            cur.execute("SELECT roll_no, name, cgpa_s1, cgpa_s2 FROM students ORDER BY roll_no;")
-            students = cur.fetchall()
+            cur.execute("""
+                SELECT d.roll_no, d.name, c.semester, c.cgpa
+                FROM student_details d
+                LEFT JOIN semester_cgpa c ON c.roll_no = d.roll_no
+                ORDER BY d.roll_no, c.semester;
+            """)
+            cgpa_rows = cur.fetchall()
             
             print(f"\n📊 Database Summary:")
             print(f"📈 Total Students: {student_count}")
-            print(f"📚 S1 Subject Records: {s1_records}")
-            print(f"📚 S2 Subject Records: {s2_records}")
-            print(f"🔄 Successfully processed: {processed_s1} S1 files, {processed_s2} S2 files")
+            for semester, count in semester_records:
+                print(f"📚 S{semester} Subject Records: {count}")
+            processed_summary = ", ".join(f"{count} S{semester}" for semester, count in sorted(processed.items()))
+            print(f"🔄 Successfully processed: {processed_summary or 'no'} files")
             
             print(f"\n👥 Student CGPA Overview:")
-            for roll_no, name, cgpa_s1, cgpa_s2 in students:
-                s1_cgpa = f"{cgpa_s1:.2f}" if cgpa_s1 else "N/A"
-                s2_cgpa = f"{cgpa_s2:.2f}" if cgpa_s2 else "N/A"
-                print(f"   {roll_no} - {name}: S1={s1_cgpa}, S2={s2_cgpa}")
+            students = {}
+            for roll_no, name, semester, cgpa in cgpa_rows:
+                entry = students.setdefault(roll_no, {"name": name, "cgpa": []})
+                if semester is not None:
+                    entry["cgpa"].append(f"S{semester}={cgpa:.2f}" if cgpa else f"S{semester}=N/A")
+            for roll_no, entry in students.items():
+                print(f"   {roll_no} - {entry['name']}: {', '.join(entry['cgpa']) or 'N/A'}")
     except Exception as e:
         print(f"❌ Error generating summary: {e}")
 
     conn.close()
     print("\n🎉 Database migration completed successfully!")
+    
+    # Rebuild the per-student profile documents parent questions are answered from
+    try:
+        profile_count = student_profiles.rebuild()
+        print(f"🧾 Student profiles rebuilt: {profile_count}")
+    except Exception as e:
+        print(f"❌ Error rebuilding student profiles: {e}")
+    
+    # Rebuild the local query snapshot from the freshly ingested data
+    if Config.QUERY_BACKEND == "duckdb":
+        try:
+            counts = snapshot_store.refresh()
+            print(f"🦆 Query snapshot refreshed: {sum(counts.values())} rows in {len(counts)} relations")
+        except Exception as e:
+            print(f"❌ Error refreshing query snapshot: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
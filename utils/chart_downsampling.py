@@ -0,0 +1,86 @@
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+def lttb_indices(xs, series, threshold):
+    """Largest-Triangle-Three-Buckets: indices of at most ``threshold`` points that keep the shape.
+
+    ``xs`` must be sorted ascending. ``series`` is a list of y-value lists
+    sharing those x positions; the triangle areas of all series are added so
+    one selection serves every dataset of a multi-line chart. The first and
+    last points are always kept.
+    """
+    count = len(xs)
+    if threshold >= count:
+        return list(range(count))
+    if threshold < 3:
+        return [0, count - 1][:max(threshold, 0)]
+
+    selected = [0]
+    bucket_size = (count - 2) / (threshold - 2)
+    previous = 0
+
+    for bucket in range(threshold - 2):
+        start = int(math.floor(bucket * bucket_size)) + 1
+        end = int(math.floor((bucket + 1) * bucket_size)) + 1
+
+        # Average of the next bucket is the third triangle vertex
+        next_start = end
+        next_end = min(int(math.floor((bucket + 2) * bucket_size)) + 1, count)
+        if next_start >= next_end:
+            next_start, next_end = count - 1, count
+        next_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        next_ys = [sum(ys[next_start:next_end]) / (next_end - next_start) for ys in series]
+
+        best_index, best_area = start, -1.0
+        for index in range(start, min(end, count - 1)):
+            area = sum(
+                abs((xs[previous] - next_x) * (ys[index] - ys[previous]) - (xs[previous] - xs[index]) * (next_y - ys[previous]))
+                for ys, next_y in zip(series, next_ys)
+            )
+            if area > best_area:
+                best_index, best_area = index, area
+
+        selected.append(best_index)
+        previous = best_index
+
+    selected.append(count - 1)
+    return selected
+
+def top_k_with_others(labels, values, k, others_label="Others"):
+    """Keep the first ``k - 1`` bars in their given order and fold the rest into one averaged bar.
+
+    The query's ORDER BY decides which rows lead ("lowest attendance",
+    "alphabetically"), so rows are never re-ranked here. Returns (labels,
+    values, others_count); values are averaged rather than summed because
+    the charted metrics (CGPA, attendance) are not additive.
+    """
+    if len(values) <= k:
+        return list(labels), list(values), 0
+
+    rows = list(zip(labels, values))
+    kept, rest = rows[:k - 1], rows[k - 1:]
+    rest_average = round(sum(value for _, value in rest) / len(rest), 2)
+
+    return (
+        [label for label, _ in kept] + [f"{others_label} ({len(rest)}, avg)"],
+        [value for _, value in kept] + [rest_average],
+        len(rest)
+    )
+
+def histogram_bins(values, low, high, bin_width):
+    """Bucket ``values`` into fixed-width bins over [low, high]; returns (labels, counts)"""
+    bin_count = max(1, int(math.ceil((high - low) / bin_width)))
+    counts = [0] * bin_count
+
+    for value in values:
+        index = int((value - low) // bin_width)
+        counts[min(max(index, 0), bin_count - 1)] += 1
+
+    labels = []
+    for index in range(bin_count):
+        start = low + index * bin_width
+        end = min(start + bin_width, high)
+        labels.append(f"{start:g}–{end:g}")
+    return labels, counts
@@ -1,4 +1,6 @@
 from database.db_connection import DatabaseSchema
+from utils.chart_downsampling import lttb_indices, top_k_with_others, histogram_bins
+from config import Config
 import logging
 import json
 
@@ -52,6 +54,8 @@ def generate_chart_data(question, chart_type, data):
             return generate_pie_chart(data, chart_type)
         
         elif chart_type == 'bar':
+            if is_distribution_request(question):
+                return generate_histogram_chart(data) or generate_bar_chart(data)
             return generate_bar_chart(data)
         
         elif chart_type == 'line':
@@ -219,10 +223,10 @@ def generate_bar_chart(data):
             logger.warning("No suitable data found for bar chart")
             return None
         
-        # Limit to top 15 records for readability
-        if len(students) > 15:
-            students = students[:15]
-            values = values[:15]
+        # Keep the leading rows in query order and fold the rest into an "Others" average so every row is represented
+        total_students = len(students)
+        students, values, others_count = top_k_with_others(students, values, Config.CHART_MAX_BARS)
+        title = f"{chart_label} - First {len(students) - 1} of {total_students} Students" if others_count else f"{chart_label} - Top {len(students)} Students"
         
         return {
             "type": "bar",
@@ -242,7 +246,7 @@ def generate_bar_chart(data):
                 "plugins": {
                     "title": {
                         "display": True,
-                        "text": f"{chart_label} - Top {len(students)} Students",
+                        "text": title,
                         "font": {"size": 16, "weight": "bold"}
                     },
                     "legend": {
@@ -295,11 +299,13 @@ def generate_line_chart(data):
             logger.warning("No semester progression data found for line chart")
             return None
         
-        # Limit to 12 students for readability
-        if len(students_with_both) > 12:
-            students_with_both = students_with_both[:12]
-            s1_values = s1_values[:12]
-            s2_values = s2_values[:12]
+        # Downsample with LTTB so peaks and dips across all students survive
+        total_students = len(students_with_both)
+        if total_students > Config.CHART_MAX_LINE_POINTS:
+            keep = lttb_indices(list(range(total_students)), [s1_values, s2_values], Config.CHART_MAX_LINE_POINTS)
+            students_with_both = [students_with_both[i] for i in keep]
+            s1_values = [s1_values[i] for i in keep]
+            s2_values = [s2_values[i] for i in keep]
         
         return {
             "type": "line",
@@ -334,7 +340,7 @@ def generate_line_chart(data):
                 "plugins": {
                     "title": {
                         "display": True,
-                        "text": f"CGPA Progression (S1 → S2) - {len(students_with_both)} Students",
+                        "text": f"CGPA Progression (S1 → S2) - {total_students} Students" + (f" ({len(students_with_both)} shown)" if total_students > len(students_with_both) else ""),
                         "font": {"size": 16, "weight": "bold"}
                     },
                     "legend": {
@@ -385,6 +391,12 @@ def generate_scatter_chart(data):
             logger.warning("Insufficient data for scatter plot")
             return None
         
+        total_points = len(scatter_data)
+        if total_points > Config.CHART_MAX_SCATTER_POINTS:
+            scatter_data.sort(key=lambda point: point["x"])
+            keep = lttb_indices([p["x"] for p in scatter_data], [[p["y"] for p in scatter_data]], Config.CHART_MAX_SCATTER_POINTS)
+            scatter_data = [scatter_data[i] for i in keep]
+        
         return {
             "type": "scatter",
             "data": {
@@ -402,7 +414,7 @@ def generate_scatter_chart(data):
                 "plugins": {
                     "title": {
                         "display": True,
-                        "text": f"Attendance vs CGPA Correlation ({len(scatter_data)} students)",
+                        "text": f"Attendance vs CGPA Correlation ({total_points} students)",
                         "font": {"size": 16, "weight": "bold"}
                     }
                 },
@@ -431,6 +443,87 @@ def generate_scatter_chart(data):
         logger.error(f"Error generating scatter chart: {e}")
         return None
 
+def is_distribution_request(question):
+    """True when the user asks how values are spread rather than for per-student bars"""
+    question_lower = question.lower()
+    return any(keyword in question_lower for keyword in ['distribution', 'histogram', 'spread', 'how many students'])
+
+def generate_histogram_chart(data):
+    """Generate a histogram of CGPA or attendance over all rows"""
+    
+    try:
+        sample = data[0]
+        
+        # (field, label, low, high, bin width)
+        for field, label, low, high, bin_width in [
+            ('cgpa_s2', 'Semester 2 CGPA', 0, 10, Config.CHART_CGPA_BIN_WIDTH),
+            ('cgpa_s1', 'Semester 1 CGPA', 0, 10, Config.CHART_CGPA_BIN_WIDTH),
+            ('cgpa', 'CGPA', 0, 10, Config.CHART_CGPA_BIN_WIDTH),
+            ('attendance_percentage', 'Attendance %', 0, 100, Config.CHART_ATTENDANCE_BIN_WIDTH)
+        ]:
+            if field in sample:
+                break
+        else:
+            logger.warning("No numeric column found for histogram")
+            return None
+        
+        values = [float(record[field]) for record in data if record.get(field) is not None]
+        if not values:
+            return None
+        
+        labels, counts = histogram_bins(values, low, high, bin_width)
+        
+        # Drop empty bins at either end (e.g. CGPA below 4)
+        filled = [i for i, count in enumerate(counts) if count]
+        labels, counts = labels[filled[0]:filled[-1] + 1], counts[filled[0]:filled[-1] + 1]
+        
+        return {
+            "type": "bar",
+            "data": {
+                "labels": labels,
+                "datasets": [{
+                    "label": "Students",
+                    "data": counts,
+                    "backgroundColor": generate_gradient_colors(len(counts)),
+                    "borderColor": '#4f46e5',
+                    "borderWidth": 1
+                }]
+            },
+            "options": {
+                "responsive": True,
+                "maintainAspectRatio": False,
+                "plugins": {
+                    "title": {
+                        "display": True,
+                        "text": f"{label} Distribution ({len(values)} records)",
+                        "font": {"size": 16, "weight": "bold"}
+                    },
+                    "legend": {
+                        "display": False
+                    }
+                },
+                "scales": {
+                    "y": {
+                        "beginAtZero": True,
+                        "title": {
+                            "display": True,
+                            "text": "Number of records"
+                        }
+                    },
+                    "x": {
+                        "title": {
+                            "display": True,
+                            "text": label
+                        }
+                    }
+                }
+            }
+        }
+        
+    except Exception as e:
+        logger.error(f"Error generating histogram chart: {e}")
+        return None
+
 def generate_auto_chart(data):
     """Auto-detect best chart type based on data structure"""
     
@@ -11,7 +11,8 @@ def analyze_retrieved_data(retrieved_data):
     # Check what type of data we have - updated for new schema
     has_cgpa_s1 = 'cgpa_s1' in sample_record
     has_cgpa_s2 = 'cgpa_s2' in sample_record
-    has_cgpa = 'cgpa' in sample_record  # For backward compatibility
+    has_cgpa = 'cgpa' in sample_record  # semester_cgpa rows or backward compatibility
+    has_semester = 'semester' in sample_record
     has_attendance = 'attendance_percentage' in sample_record
     has_grades = 'grade' in sample_record
     has_subjects = 'subject' in sample_record
@@ -32,8 +33,18 @@ def analyze_retrieved_data(retrieved_data):
             avg_cgpa_s2 = sum(cgpa_s2_values) / len(cgpa_s2_values)
             analysis.append(f"S2 CGPA data: {len(cgpa_s2_values)} students, average S2 CGPA: {avg_cgpa_s2:.2f}")
     
+    # Per-semester CGPA rows from semester_cgpa
+    if has_cgpa and has_semester:
+        semester_cgpa = {}
+        for r in retrieved_data:
+            if r.get('cgpa') and r.get('semester') is not None:
+                semester_cgpa.setdefault(r['semester'], []).append(float(r['cgpa']))
+        for semester in sorted(semester_cgpa):
+            values = semester_cgpa[semester]
+            analysis.append(f"S{semester} CGPA data: {len(values)} students, average S{semester} CGPA: {sum(values) / len(values):.2f}")
+    
     # Legacy CGPA field (for backward compatibility)
-    if has_cgpa and not has_cgpa_s1 and not has_cgpa_s2:
+    elif has_cgpa and not has_cgpa_s1 and not has_cgpa_s2:
         cgpa_values = [float(r.get('cgpa', 0)) for r in retrieved_data if r.get('cgpa')]
         if cgpa_values:
             avg_cgpa = sum(cgpa_values) / len(cgpa_values)
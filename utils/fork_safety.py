@@ -0,0 +1,34 @@
+from database.db_connection import reset_db_pool
+from database.snapshot import snapshot_store
+from utils.llm_client import reset_llm_clients
+from utils.llm_scheduler import llm_scheduler
+from utils.logging_setup import restart_logging_after_fork
+from config import Config
+import logging
+
+logger = logging.getLogger(__name__)
+
+def reinitialize_after_fork(worker_count=1):
+    """Rebuild per-process resources in a freshly forked worker.
+
+    Connection pools, HTTP clients and background threads created before
+    the fork must not be shared with the parent. The compiled graph, schema
+    context and other pure-Python state are kept; that is what preloading
+    is for. The LLM rate limits are split evenly across workers so the
+    account-wide limits hold.
+    """
+    restart_logging_after_fork()
+    reset_db_pool()
+    snapshot_store.reset()
+    reset_llm_clients()
+
+    # Imported here: auth pulls in Flask views, only needed once the app is loaded
+    from auth import reset_mongo_client
+    reset_mongo_client()
+
+    workers = max(worker_count, 1)
+    llm_scheduler.set_limits(
+        Config.LLM_REQUESTS_PER_MINUTE / workers,
+        Config.LLM_TOKENS_PER_MINUTE / workers
+    )
+    logger.info("Worker resources reinitialized (1/%d of the LLM rate limits)", workers)
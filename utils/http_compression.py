@@ -0,0 +1,53 @@
+from config import Config
+import gzip
+import logging
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is used when it is not installed
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/html"}
+
+def choose_encoding(accept_encoding):
+    """Best encoding the client accepts: br (when available), then gzip, else None"""
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+def compress_response(response, accept_encoding):
+    """Compress a large JSON/HTML response in place; streamed and small responses pass through"""
+    if (
+        response.direct_passthrough
+        or response.is_streamed
+        or response.status_code < 200
+        or response.status_code >= 300
+        or "Content-Encoding" in response.headers
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+    ):
+        return response
+
+    body = response.get_data()
+    if len(body) < Config.RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return response
+
+    if encoding == "br":
+        compressed = brotli.compress(body, quality=Config.RESPONSE_BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=Config.RESPONSE_GZIP_LEVEL)
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    response.headers["Content-Length"] = str(len(compressed))
+    response.vary.add("Accept-Encoding")
+    logger.debug("Compressed %s response %d -> %d bytes (%s)", response.mimetype, len(body), len(compressed), encoding)
+    return response
@@ -0,0 +1,48 @@
+from collections import deque
+from threading import Lock
+
+class LatencyTracker:
+    """Rolling latency samples and event counters, grouped by name"""
+
+    def __init__(self, max_samples=200):
+        self.max_samples = max_samples
+        self._samples = {}
+        self._counters = {}
+        self._lock = Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            samples = self._samples.setdefault(name, deque(maxlen=self.max_samples))
+            samples.append(seconds)
+
+    def increment(self, name, counter, amount=1):
+        with self._lock:
+            counters = self._counters.setdefault(name, {})
+            counters[counter] = counters.get(counter, 0) + amount
+
+    def percentile(self, name, pct, min_samples=1):
+        """Latency percentile in seconds, or None with fewer than ``min_samples`` samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if len(samples) < max(min_samples, 1):
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self):
+        with self._lock:
+            names = set(self._samples) | set(self._counters)
+            counters = {name: dict(self._counters.get(name, {})) for name in names}
+            counts = {name: len(self._samples.get(name, ())) for name in names}
+
+        summary = {}
+        for name in sorted(names):
+            p50, p95, p99 = (self.percentile(name, pct) for pct in (50, 95, 99))
+            summary[name] = {
+                "samples": counts[name],
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+                **counters[name]
+            }
+        return summary
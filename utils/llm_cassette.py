@@ -0,0 +1,135 @@
+from threading import Lock
+from langchain_core.messages import AIMessage, HumanMessage
+from config import Config
+import hashlib
+import json
+import os
+import tempfile
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when a call was never recorded"""
+
+def cassette_key(model, messages, **params):
+    """Stable hash of the model, messages and call parameters"""
+    payload = {
+        "model": model,
+        "messages": [{"type": message.type, "content": message.content} for message in messages],
+        "params": params
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class LLMCassette:
+    """On-disk store of LLM responses, one JSON file per request key"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = Lock()
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def load(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, key, entry):
+        path = self._path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # A unique temp file per write, so concurrent recordings of the same call cannot interleave
+        fd, temp_path = tempfile.mkstemp(prefix=f".{key}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, indent=1, default=str)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+class CassetteChatModel:
+    """Chat model stand-in that records real responses or replays recorded ones.
+
+    ``mode`` is "record" (always call the model and store the response),
+    "replay" (only recorded responses; no network, raises CassetteMiss
+    otherwise) or "auto" (replay when recorded, else call and record).
+    Replays sleep for the recorded latency times
+    Config.LLM_CASSETTE_LATENCY_SCALE plus Config.LLM_CASSETTE_LATENCY_SECONDS,
+    which is zero by default so CI runs at full speed.
+    """
+
+    def __init__(self, model, client, cassette, mode):
+        self.model = model
+        self.client = client
+        self.cassette = cassette
+        self.mode = mode
+
+    def invoke(self, messages, timeout=None, **params):
+        if isinstance(messages, str):
+            messages = [HumanMessage(content=messages)]
+        key = cassette_key(self.model, messages, **params)
+
+        if self.mode in ("replay", "auto"):
+            entry = self.cassette.load(key)
+            if entry is not None:
+                return self._replay(entry)
+            if self.mode == "replay":
+                self.cassette.count("misses")
+                raise CassetteMiss(f"No cassette entry for {self.model} request {key[:12]}")
+
+        return self._record(key, messages, params, timeout)
+
+    def _replay(self, entry):
+        delay = entry.get("latency_seconds", 0.0) * Config.LLM_CASSETTE_LATENCY_SCALE + Config.LLM_CASSETTE_LATENCY_SECONDS
+        if delay > 0:
+            time.sleep(delay)
+        self.cassette.count("replayed")
+        return AIMessage(content=entry["content"], usage_metadata=entry.get("usage_metadata"))
+
+    def _record(self, key, messages, params, timeout):
+        if self.client is None:
+            raise CassetteMiss(f"No model client available to record {self.model}")
+        started_at = time.monotonic()
+        # The timeout bounds this call only; it is not part of the request key
+        response = self.client.invoke(messages, **params, **({"timeout": timeout} if timeout is not None else {}))
+        self.cassette.save(key, {
+            "model": self.model,
+            "messages": [{"type": message.type, "content": message.content} for message in messages],
+            "params": params,
+            "content": response.content,
+            "usage_metadata": getattr(response, "usage_metadata", None),
+            "latency_seconds": round(time.monotonic() - started_at, 4),
+            "recorded_at": time.time()
+        })
+        self.cassette.count("recorded")
+        return response
+
+# Shared by every model client in the process
+llm_cassette = LLMCassette(Config.LLM_CASSETTE_DIR)
+
+def cassette_replaying():
+    """True when calls are answered from the cassette only, so rate limiting can be skipped"""
+    return Config.LLM_CASSETTE_MODE == "replay"
+
+def wrap_with_cassette(model, client_factory):
+    """Return the client for ``model``, wrapped in the cassette when LLM_CASSETTE_MODE is set"""
+    mode = Config.LLM_CASSETTE_MODE
+    if mode == "off":
+        return client_factory()
+    if mode not in ("record", "replay", "auto"):
+        raise ValueError(f"Unknown LLM cassette mode: {mode}")
+    logger.info("LLM cassette %s mode for %s (%s)", mode, model, Config.LLM_CASSETTE_DIR)
+    # Replay never needs the real client, so no API key or network is required
+    client = None if mode == "replay" else client_factory()
+    return CassetteChatModel(model, client, llm_cassette, mode)
@@ -0,0 +1,265 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from langchain.chat_models import init_chat_model
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from utils.latency_tracker import LatencyTracker
+from utils.llm_cassette import wrap_with_cassette, cassette_key, cassette_replaying, llm_cassette
+from utils.llm_scheduler import llm_scheduler
+from utils.single_flight import SingleFlight
+from config import Config
+import random
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LLMDeadlineExceeded(TimeoutError):
+    """Raised when an LLM call cannot finish within its latency budget"""
+
+# User on whose behalf LLM calls are made; set once per request by the route
+current_llm_user = ContextVar("current_llm_user", default=None)
+
+# Absolute time.monotonic() by which the current request must finish
+current_request_deadline = ContextVar("current_request_deadline", default=None)
+
+# Canned response text per agent for synthetic (warm-up) requests; None for real traffic
+current_fake_responses = ContextVar("current_fake_responses", default=None)
+
+_models = {}
+_models_lock = Lock()
+
+# Concurrent identical prompts share one upstream call
+llm_single_flight = SingleFlight()
+
+# Upstream calls run here so they can be timed out and hedged
+_llm_executor = ThreadPoolExecutor(max_workers=Config.LLM_EXECUTOR_WORKERS, thread_name_prefix="llm")
+
+# Per-agent call latency, timeouts, retries and hedges
+llm_latency = LatencyTracker()
+
+def get_llm(model=None):
+    """Return the shared chat model client for ``model`` (created on first use)"""
+    model = model or Config.LLM_MODEL
+    with _models_lock:
+        if model not in _models:
+            # Retries are ours (_invoke_with_retries); the SDK's own would outlive the per-call timeout
+            _models[model] = wrap_with_cassette(
+                model, lambda: init_chat_model(model, model_provider=Config.LLM_PROVIDER, max_retries=0)
+            )
+        return _models[model]
+
+def reset_llm_clients():
+    """Drop clients (and their HTTP connection pools) inherited across fork"""
+    with _models_lock:
+        _models.clear()
+
+@contextmanager
+def llm_user_context(user_id):
+    """Attribute LLM calls made inside the block to ``user_id``"""
+    token = current_llm_user.set(user_id)
+    try:
+        yield
+    finally:
+        current_llm_user.reset(token)
+
+@contextmanager
+def llm_request_budget(seconds=None):
+    """Bound the total LLM time of everything inside the block (one chat turn)"""
+    seconds = seconds if seconds is not None else Config.REQUEST_LATENCY_BUDGET_SECONDS
+    token = current_request_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        current_request_deadline.reset(token)
+
+@contextmanager
+def fake_llm_context(responses):
+    """Answer LLM calls inside the block from ``responses`` (agent -> text) via a fake chat model.
+
+    Used by the warm-up request: agents build and parse prompts as usual,
+    but nothing reaches the provider, the rate limiter or the caches.
+    """
+    token = current_fake_responses.set(responses)
+    try:
+        yield
+    finally:
+        current_fake_responses.reset(token)
+
+def is_synthetic_request():
+    """True inside fake_llm_context, so side effects like example recording can be skipped"""
+    return current_fake_responses.get() is not None
+
+def estimate_tokens(messages):
+    """Rough prompt size in tokens (~4 characters per token)"""
+    return sum(len(message.content) for message in messages) // 4 + 1
+
+def request_key(model, messages, **params):
+    """Stable hash of everything that determines an LLM response"""
+    return cassette_key(model, messages, **params)
+
+def invoke_llm(messages, agent, validate=None):
+    """Invoke the LLM for ``agent`` within its latency budget.
+
+    The agent's model tiers (Config.LLM_AGENT_TIERS) are tried in order:
+    when ``validate`` rejects a response the next, larger tier is asked.
+    Identical concurrent calls are coalesced, each upstream attempt goes
+    through the shared rate-limit scheduler, failures are retried with
+    jittered backoff and slow attempts may be hedged. Raises
+    LLMDeadlineExceeded when the budget runs out so the calling agent can
+    return its fallback.
+    """
+    fake_responses = current_fake_responses.get()
+    if fake_responses is not None:
+        return FakeListChatModel(responses=[fake_responses.get(agent, "")]).invoke(messages)
+
+    tiers = Config.LLM_AGENT_TIERS.get(agent, Config.LLM_DEFAULT_TIERS)
+    deadline = _call_deadline(agent)
+    user_id = current_llm_user.get()
+    response = None
+
+    for index, tier in enumerate(tiers):
+        model = Config.LLM_TIERS[tier]["model"]
+        key = request_key(model, messages)
+        response = llm_single_flight.do(
+            key, lambda: _invoke_tier(tier, model, messages, agent, deadline, user_id), deadline=deadline
+        )
+
+        if validate is None or validate(response):
+            return response
+
+        if index < len(tiers) - 1:
+            logger.info("%s: %s tier output failed validation, escalating to %s", agent, tier, tiers[index + 1])
+            llm_latency.increment(f"tier:{tier}", "escalations")
+
+    return response
+
+def _invoke_tier(tier, model, messages, agent, deadline, user_id):
+    started_at = time.monotonic()
+    response = _invoke_with_retries(model, messages, agent, deadline, user_id)
+    elapsed = time.monotonic() - started_at
+
+    usage = getattr(response, "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens", 0)
+    output_tokens = usage.get("output_tokens", 0)
+    pricing = Config.LLM_TIERS[tier]
+    cost = (input_tokens * pricing["input_cost_per_million"] + output_tokens * pricing["output_cost_per_million"]) / 1_000_000
+
+    llm_latency.record(f"tier:{tier}", elapsed)
+    llm_latency.increment(f"tier:{tier}", "calls")
+    llm_latency.increment(f"tier:{tier}", "tokens", input_tokens + output_tokens)
+    llm_latency.increment(f"tier:{tier}", "cost_micro_usd", round(cost * 1_000_000))
+    logger.info("LLM %s [%s: %s] %.2fs, %s+%s tokens, $%.6f", agent, tier, model, elapsed, input_tokens, output_tokens, cost)
+
+    return response
+
+def _call_deadline(agent):
+    share = Config.LLM_AGENT_BUDGET_SHARES.get(agent, Config.LLM_DEFAULT_BUDGET_SHARE)
+    deadline = time.monotonic() + Config.REQUEST_LATENCY_BUDGET_SECONDS * share
+    request_deadline = current_request_deadline.get()
+    if request_deadline is not None:
+        deadline = min(deadline, request_deadline)
+    return deadline
+
+def _invoke_with_retries(model, messages, agent, deadline, user_id):
+    last_error = None
+
+    for attempt in range(Config.LLM_MAX_RETRIES + 1):
+        if time.monotonic() >= deadline:
+            break
+        try:
+            return _hedged_attempt(model, messages, agent, deadline, user_id)
+        except LLMDeadlineExceeded:
+            llm_latency.increment(agent, "timeouts")
+            raise
+        except Exception as e:
+            last_error = e
+            if attempt == Config.LLM_MAX_RETRIES:
+                break
+            # Full jitter backoff, never sleeping past the deadline
+            delay = random.uniform(0, Config.LLM_RETRY_BASE_DELAY_SECONDS * (2 ** attempt))
+            if time.monotonic() + delay >= deadline:
+                break
+            logger.warning("LLM call for %s failed (%s); retrying in %.2fs", agent, e, delay)
+            llm_latency.increment(agent, "retries")
+            time.sleep(delay)
+
+    if last_error is not None:
+        llm_latency.increment(agent, "errors")
+        raise last_error
+    llm_latency.increment(agent, "timeouts")
+    raise LLMDeadlineExceeded(f"LLM budget for {agent} exhausted")
+
+def _hedged_attempt(model, messages, agent, deadline, user_id):
+    priority = Config.LLM_AGENT_PRIORITIES.get(agent, Config.LLM_DEFAULT_PRIORITY)
+    estimated_tokens = estimate_tokens(messages) + Config.LLM_EXPECTED_OUTPUT_TOKENS
+    started_at = time.monotonic()
+
+    def remaining():
+        return max(0.0, deadline - time.monotonic())
+
+    primary = _llm_executor.submit(
+        _invoke_in_slot, model, messages, priority, estimated_tokens, user_id,
+        min(remaining(), Config.LLM_QUEUE_TIMEOUT_SECONDS), deadline
+    )
+    pending = {primary}
+
+    hedge_after = None
+    if Config.LLM_HEDGING_ENABLED:
+        hedge_after = llm_latency.percentile(f"{agent}/{model}", 95, min_samples=Config.LLM_HEDGE_MIN_SAMPLES)
+
+    if hedge_after is not None and hedge_after < remaining():
+        done, _ = wait(pending, timeout=hedge_after)
+        if not done:
+            # Only hedge with spare capacity: a zero queue timeout never waits for a slot
+            logger.info("LLM call for %s exceeded p95 (%.2fs); sending hedged request", agent, hedge_after)
+            llm_latency.increment(agent, "hedges")
+            pending.add(_llm_executor.submit(
+                _invoke_in_slot, model, messages, priority, estimated_tokens, user_id, 0, deadline
+            ))
+
+    first_error = None
+    while pending:
+        done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            raise LLMDeadlineExceeded(f"LLM call for {agent} timed out after {time.monotonic() - started_at:.2f}s")
+
+        for future in done:
+            error = future.exception()
+            if error is None:
+                llm_latency.record(f"{agent}/{model}", time.monotonic() - started_at)
+                if future is not primary:
+                    llm_latency.increment(agent, "hedge_wins")
+                return future.result()
+            if future is primary or first_error is None:
+                first_error = error
+
+    raise first_error
+
+def _invoke_in_slot(model, messages, priority, estimated_tokens, user_id, queue_timeout, deadline):
+    # Cassette replays touch no provider, so they skip rate limiting and run at full speed
+    if cassette_replaying():
+        return get_llm(model).invoke(messages)
+
+    with llm_scheduler.slot(priority, estimated_tokens, user_id=user_id, timeout=queue_timeout) as ticket:
+        # The provider request ends with the caller's deadline, so a call the caller
+        # has given up on frees its slot and executor thread instead of running on
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMDeadlineExceeded("LLM deadline passed while waiting for a slot")
+        response = get_llm(model).invoke(messages, timeout=remaining)
+
+        usage = getattr(response, "usage_metadata", None) or {}
+        llm_scheduler.record_usage(ticket, usage.get("total_tokens"))
+
+    return response
+
+def get_llm_stats():
+    """Counters for monitoring LLM traffic shaping and tail latency"""
+    return {
+        "scheduler": llm_scheduler.snapshot(),
+        "single_flight": llm_single_flight.stats(),
+        "latency": llm_latency.snapshot(),
+        "cassette": {"mode": Config.LLM_CASSETTE_MODE, **llm_cassette.stats}
+    }
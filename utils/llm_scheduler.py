@@ -0,0 +1,181 @@
+from contextlib import contextmanager
+from threading import Condition
+from config import Config
+import itertools
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class LLMSchedulerTimeout(TimeoutError):
+    """Raised when an LLM call waits in the queue longer than allowed"""
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``capacity`` per minute"""
+
+    def __init__(self, capacity_per_minute):
+        self.capacity = float(capacity_per_minute)
+        self.refill_per_second = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now):
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = now
+
+    def seconds_until(self, amount):
+        """Seconds until ``amount`` tokens are available (0 if available now)"""
+        # Requests larger than the bucket only wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.refill_per_second
+
+    def consume(self, amount):
+        # May go negative when actual usage exceeds the estimate; later calls wait it off
+        self.tokens -= amount
+
+class _Ticket:
+    def __init__(self, priority, sequence, estimated_tokens, user_id):
+        self.priority = priority
+        self.sequence = sequence
+        self.estimated_tokens = estimated_tokens
+        self.user_id = user_id
+        self.enqueued_at = time.monotonic()
+        self.queue_seconds = 0.0
+
+    @property
+    def sort_key(self):
+        return (self.priority, self.sequence)
+
+class LLMScheduler:
+    """Admission control for LLM calls shared by every agent in the process.
+
+    Calls are admitted in priority order (lower value first, FIFO within a
+    priority) once the requests-per-minute and tokens-per-minute buckets
+    have room and the calling user is below their in-flight limit. A call
+    whose user is at the limit does not block other users behind it.
+    """
+
+    def __init__(self, requests_per_minute=Config.LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=Config.LLM_TOKENS_PER_MINUTE,
+                 max_in_flight_per_user=Config.LLM_MAX_IN_FLIGHT_PER_USER):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_in_flight_per_user = max_in_flight_per_user
+        self._condition = Condition()
+        self._waiting = []
+        self._in_flight = {}
+        self._sequence = itertools.count()
+        self.stats = {"admitted": 0, "timeouts": 0, "total_queue_seconds": 0.0}
+
+    def set_limits(self, requests_per_minute, tokens_per_minute):
+        """Replace the rate limits (e.g. a worker's share of the account limits)"""
+        with self._condition:
+            self.request_bucket = TokenBucket(requests_per_minute)
+            self.token_bucket = TokenBucket(tokens_per_minute)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, priority, estimated_tokens, user_id=None, timeout=Config.LLM_QUEUE_TIMEOUT_SECONDS):
+        """Block until the call may run; yields a ticket for usage reconciliation"""
+        ticket = self._acquire(priority, estimated_tokens, user_id, timeout)
+        try:
+            yield ticket
+        finally:
+            self._release(ticket)
+
+    def record_usage(self, ticket, actual_tokens):
+        """Correct the token bucket once the provider reports real usage"""
+        if not actual_tokens:
+            return
+        with self._condition:
+            self.token_bucket.consume(actual_tokens - ticket.estimated_tokens)
+            self._condition.notify_all()
+
+    def _acquire(self, priority, estimated_tokens, user_id, timeout):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        with self._condition:
+            ticket = _Ticket(priority, next(self._sequence), estimated_tokens, user_id)
+            self._waiting.append(ticket)
+            self._waiting.sort(key=lambda t: t.sort_key)
+
+            while True:
+                now = time.monotonic()
+                wait_seconds = self._admission_wait(ticket, now)
+                if wait_seconds == 0.0:
+                    break
+
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._waiting.remove(ticket)
+                        self.stats["timeouts"] += 1
+                        self._condition.notify_all()
+                        raise LLMSchedulerTimeout(f"LLM call waited more than {timeout:.1f}s for a slot")
+                    wait_seconds = remaining if wait_seconds is None else min(wait_seconds, remaining)
+
+                self._condition.wait(wait_seconds)
+
+            self._waiting.remove(ticket)
+            self.request_bucket.consume(1)
+            self.token_bucket.consume(estimated_tokens)
+            self._in_flight[user_id] = self._in_flight.get(user_id, 0) + 1
+
+            ticket.queue_seconds = time.monotonic() - ticket.enqueued_at
+            self.stats["admitted"] += 1
+            self.stats["total_queue_seconds"] += ticket.queue_seconds
+            if ticket.queue_seconds > 0.5:
+                logger.info("LLM call (priority %s) queued for %.2fs", priority, ticket.queue_seconds)
+
+            # Others may now be eligible (e.g. a different user behind a blocked one)
+            self._condition.notify_all()
+            return ticket
+
+    def _admission_wait(self, ticket, now):
+        """0.0 if the ticket may run now, seconds to wait for refill, or None to wait for a release"""
+        for candidate in self._waiting:
+            if self._user_at_limit(candidate.user_id):
+                continue
+            if candidate is not ticket:
+                # A higher-priority eligible call goes first
+                return None
+
+            self.request_bucket.refill(now)
+            self.token_bucket.refill(now)
+            refill_wait = max(
+                self.request_bucket.seconds_until(1),
+                self.token_bucket.seconds_until(ticket.estimated_tokens)
+            )
+            return refill_wait
+        # This ticket's user is at their in-flight limit
+        return None
+
+    def _user_at_limit(self, user_id):
+        if user_id is None:
+            return False
+        return self._in_flight.get(user_id, 0) >= self.max_in_flight_per_user
+
+    def _release(self, ticket):
+        with self._condition:
+            count = self._in_flight.get(ticket.user_id, 0) - 1
+            if count > 0:
+                self._in_flight[ticket.user_id] = count
+            else:
+                self._in_flight.pop(ticket.user_id, None)
+            self._condition.notify_all()
+
+    def snapshot(self):
+        with self._condition:
+            return {
+                **self.stats,
+                "waiting": len(self._waiting),
+                "in_flight": sum(self._in_flight.values()),
+                "request_tokens_available": round(self.request_bucket.tokens, 1),
+                "llm_tokens_available": round(self.token_bucket.tokens, 1)
+            }
+
+# Shared by every agent in this process
+llm_scheduler = LLMScheduler()
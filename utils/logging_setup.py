@@ -0,0 +1,114 @@
+from logging.handlers import QueueHandler, QueueListener
+from config import Config
+import atexit
+import datetime
+import json
+import queue
+import random
+import sys
+import logging
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, extra fields and exception"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of INFO/DEBUG records per component; warnings and errors always pass.
+
+    ``rates`` maps logger name prefixes to the fraction kept; the longest
+    matching prefix wins and unlisted loggers keep everything.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return rate >= 1 or random.random() < rate
+        return True
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves message formatting to the background listener.
+
+    The stock handler renders ``msg % args`` on the calling thread; here only
+    exception text is captured eagerly (the traceback is gone later), so
+    callers pay for a queue put and nothing else. Arguments are therefore
+    formatted later and must not be mutated after the logging call.
+    """
+
+    def prepare(self, record):
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def payload_logging_enabled(logger):
+    """Whether large payloads (prompts, contexts, sample rows) should be logged"""
+    return Config.LOG_DEBUG_PAYLOADS and logger.isEnabledFor(logging.DEBUG)
+
+def configure_logging():
+    """Route all logging through a queue to a background writer thread (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    if Config.LOG_FORMAT == "json":
+        output.setFormatter(JSONFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(Config.LOG_SAMPLE_RATES))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(Config.LOG_LEVEL)
+
+    for name, level in Config.LOG_COMPONENT_LEVELS.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def restart_logging_after_fork():
+    """Start a writer thread in a forked worker (threads do not survive fork)"""
+    global _listener
+    _listener = None
+    configure_logging()
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
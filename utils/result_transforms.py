@@ -0,0 +1,234 @@
+import decimal
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Explicit anaphors in a follow-up that point back at the previous answer's rows
+_REFERENCE_PATTERN = re.compile(r"\b(these|those|them|the (?:list|results?))\b")
+_LEADING_VERB_PATTERN = re.compile(r"^(?:now\s+|please\s+|can you\s+|could you\s+|also\s+|give me\s+|show(?: me)?\s+)*(sort|order|rank|arrange|filter|only|just|show only|include|along with)\b")
+
+_COMPARATORS = {
+    "<": ["below", "under", "less than", "lower than", "fewer than", "<"],
+    "<=": ["at most", "no more than", "up to", "<="],
+    ">": ["above", "over", "more than", "greater than", "higher than", ">"],
+    ">=": ["at least", "no less than", ">="],
+    "=": ["equal to", "exactly", "equals", "="]
+}
+_COMPARISON_PATTERN = re.compile(
+    r"(?P<op>" + "|".join(sorted((re.escape(word) for words in _COMPARATORS.values() for word in words), key=len, reverse=True)) + r")"
+    r"\s*(?P<value>\d+(?:\.\d+)?)\s*%?"
+)
+_SORT_PATTERN = re.compile(r"\b(?:sort|order|rank|arrange)(?:ed|ing)?\b.*?\bby\s+(?P<column>[a-z0-9_% ]+)")
+_TOP_K_PATTERN = re.compile(r"\b(?P<which>top|highest|best|bottom|lowest|worst|first)\s+(?P<count>\d+)\b(?P<rest>[a-z0-9_% ]*)")
+_PROJECTION_PATTERN = re.compile(r"\b(?:only|just)\s+(?:show\s+|give\s+(?:me\s+)?|list\s+)?(?:me\s+)?(?:the\s+|their\s+)?(?P<columns>[a-z0-9_%, ]+?)(?:\s+columns?)?$")
+_INCLUDE_PATTERN = re.compile(r"\b(?:along with|together with|with their|including|include)\s+(?:the\s+|their\s+)?(?P<columns>[a-z0-9_%, ]+)")
+
+_DESCENDING_WORDS = re.compile(r"\b(desc\w*|highest|high to low|largest|best|decreasing|top)\b")
+_ASCENDING_WORDS = re.compile(r"\b(asc\w*|lowest|low to high|smallest|worst|increasing|bottom)\b")
+
+# Question words that name a column differently than the schema does
+_COLUMN_SYNONYMS = {
+    "gpa": "cgpa",
+    "names": "name",
+    "roll": "roll_no",
+    "marks": "grade_point",
+    "score": "grade_point",
+    "scores": "grade_point",
+    "points": "grade_point",
+    "percentage": "attendance",
+    "%": "attendance"
+}
+_FILLER_WORDS = {"the", "their", "a", "an", "of", "in", "by", "for", "and", "with", "students", "student", "ones", "wise", "order", "me", "show", "list", "give", "please", "too", "also", "as", "well"}
+
+def _words(text):
+    return re.findall(r"[a-z0-9_%]+", text.lower())
+
+def _word_matches_column(word, column):
+    word = _COLUMN_SYNONYMS.get(word, word)
+    singular = word[:-1] if len(word) > 3 and word.endswith("s") else word
+    column = column.lower()
+    return (
+        column in (word, singular)
+        or singular in column.split("_")
+        or (len(singular) >= 4 and singular in column)
+    )
+
+def match_column(text, columns):
+    """The one result column ``text`` refers to, or None when there is none or it is ambiguous"""
+    words = [word for word in _words(text) if word not in _FILLER_WORDS and not _DESCENDING_WORDS.match(word) and not _ASCENDING_WORDS.match(word)]
+    if not words:
+        return None
+    candidates = [column for column in columns if any(_word_matches_column(word, column) for word in words)]
+    if len(candidates) == 1:
+        return candidates[0]
+    exact = [column for column in candidates if column.lower() in words]
+    return exact[0] if len(exact) == 1 else None
+
+def _match_column_list(text, columns):
+    """Columns for a list like "name and cgpa", or None if any item is not a result column"""
+    matched = []
+    for item in re.split(r",|\band\b", text):
+        if not _words(item) or all(word in _FILLER_WORDS for word in _words(item)):
+            continue
+        column = match_column(item, columns)
+        if column is None:
+            return None
+        if column not in matched:
+            matched.append(column)
+    return matched or None
+
+def _nearest_column(words, columns, window=3):
+    """The column named by the first one to ``window`` words of ``words``"""
+    for count in range(1, min(window, len(words)) + 1):
+        column = match_column(" ".join(words[:count]), columns)
+        if column is not None:
+            return column
+    return None
+
+def _comparison_op(phrase):
+    for op, words in _COMPARATORS.items():
+        if phrase in words:
+            return op
+    return None
+
+def detect_result_transform(question, columns):
+    """Parse a follow-up into a transformation of the previous result, or None.
+
+    Recognizes filters ("only those below 75% attendance"), sorting ("sort
+    these by CGPA descending"), top-k ("top 5 of them by cgpa"), projection ("just
+    the names and cgpa") and requests for columns the result already has
+    ("give me along with names"). Only questions with an explicit anaphor
+    ("these", "those", "them", "the list") or a leading transform verb
+    ("sort", "filter", "only show") qualify. Every column mentioned must be
+    in ``columns``; anything unrecognized returns None so the question takes
+    the normal SQL path.
+    """
+    text = question.lower().strip().rstrip("?.! ")
+    if not columns or not (_REFERENCE_PATTERN.search(text) or _LEADING_VERB_PATTERN.match(text)):
+        return None
+
+    transform = {"filters": [], "order_by": None, "descending": False, "limit": None, "columns": None, "include": []}
+
+    comparisons = list(_COMPARISON_PATTERN.finditer(text))
+    for index, match in enumerate(comparisons):
+        # The column is named right after the number ("75% attendance") or before the comparator ("cgpa above 8")
+        after_end = comparisons[index + 1].start() if index + 1 < len(comparisons) else len(text)
+        after = re.split(r"\b(?:and|or|but)\b|,", text[match.end():after_end])[0]
+        before_start = comparisons[index - 1].end() if index > 0 else 0
+        before = re.split(r"\b(?:and|or|but|with|where|having|whose)\b|,", text[before_start:match.start()])[-1]
+        column = _nearest_column(_words(after), columns) or _nearest_column(_words(before)[::-1], columns)
+        if column is None:
+            return None
+        transform["filters"].append((column, _comparison_op(match.group("op")), float(match.group("value"))))
+
+    sort_match = _SORT_PATTERN.search(text)
+    if sort_match:
+        column = match_column(sort_match.group("column"), columns)
+        if column is None:
+            return None
+        transform["order_by"] = column
+        transform["descending"] = bool(_DESCENDING_WORDS.search(text)) or (text.startswith("rank") and not _ASCENDING_WORDS.search(text))
+
+    top_k_match = _TOP_K_PATTERN.search(text)
+    if top_k_match:
+        transform["limit"] = int(top_k_match.group("count"))
+        which = top_k_match.group("which")
+        if which != "first" and transform["order_by"] is None:
+            column = match_column(top_k_match.group("rest"), columns)
+            if column is None:
+                return None
+            transform["order_by"] = column
+            transform["descending"] = which in ("top", "highest", "best")
+
+    include_match = _INCLUDE_PATTERN.search(text)
+    if include_match:
+        included = _match_column_list(include_match.group("columns"), columns)
+        if included is None:
+            return None
+        transform["include"] = included
+
+    projection_match = _PROJECTION_PATTERN.search(text)
+    if projection_match and not comparisons and not sort_match and not top_k_match:
+        projected = _match_column_list(projection_match.group("columns"), columns)
+        if projected is None:
+            return None
+        transform["columns"] = projected
+
+    # A number the patterns did not consume ("in semester 3") is a condition we cannot apply locally
+    consumed = [match.span() for match in comparisons] + ([top_k_match.span()] if top_k_match else [])
+    for number in re.finditer(r"\d+(?:\.\d+)?", text):
+        if not any(start <= number.start() < end for start, end in consumed):
+            return None
+
+    if not (transform["filters"] or transform["order_by"] or transform["limit"] or transform["columns"] or transform["include"]):
+        return None
+    return transform
+
+def describe_transform(transform):
+    parts = [f"{column} {op} {value:g}" for column, op, value in transform["filters"]]
+    if transform["order_by"]:
+        parts.append(f"sorted by {transform['order_by']} {'desc' if transform['descending'] else 'asc'}")
+    if transform["limit"]:
+        parts.append(f"first {transform['limit']}")
+    if transform["columns"]:
+        parts.append(f"columns {', '.join(transform['columns'])}")
+    if transform["include"]:
+        parts.append(f"including {', '.join(transform['include'])}")
+    return "; ".join(parts)
+
+def _as_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return float(value)
+    try:
+        return float(str(value).strip().rstrip("%"))
+    except (TypeError, ValueError):
+        return None
+
+def _matches(value, op, target):
+    number = _as_number(value)
+    if number is None:
+        return False
+    if op == "<":
+        return number < target
+    if op == "<=":
+        return number <= target
+    if op == ">":
+        return number > target
+    if op == ">=":
+        return number >= target
+    return number == target
+
+def _sort_key(value):
+    number = _as_number(value)
+    return (0, number, "") if number is not None else (1, 0.0, str(value).lower())
+
+def apply_transform(rows, transform):
+    """Filter, sort, limit and project ``rows``; rows with NULLs in the sort column go last"""
+    result = [row for row in rows if all(_matches(row.get(column), op, value) for column, op, value in transform["filters"])]
+
+    order_by = transform["order_by"]
+    if order_by:
+        present = [row for row in result if row.get(order_by) is not None]
+        missing = [row for row in result if row.get(order_by) is None]
+        present.sort(key=lambda row: _sort_key(row[order_by]), reverse=transform["descending"])
+        result = present + missing
+
+    if transform["limit"] is not None:
+        result = result[:transform["limit"]]
+
+    if transform["columns"]:
+        result = [{column: row.get(column) for column in transform["columns"]} for row in result]
+    return result
+
+def transform_sql(parsed_query, transform, columns):
+    """The previous query wrapped so that it returns the transformed rows (for paging and export)"""
+    return parsed_query.wrapped(
+        transform["columns"] or columns,
+        filters=transform["filters"],
+        order_by=transform["order_by"],
+        descending=transform["descending"],
+        limit=transform["limit"]
+    )
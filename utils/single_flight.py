@@ -0,0 +1,74 @@
+from threading import Event, Lock
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class _Call:
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is still running wait and receive the same result or
+    exception. Nothing is cached once the leader finishes. A follower with a
+    ``deadline`` (absolute time.monotonic()) stops waiting at that deadline
+    with TimeoutError; the leader carries on for the others.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def do(self, key, fn, deadline=None):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError("Gave up waiting for a coalesced call at the caller's deadline")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.info("Single-flight: %s identical call(s) shared one upstream result", call.waiters)
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "follower_timeouts": self.timeouts,
+                "in_flight": len(self._calls)
+            }
@@ -0,0 +1,499 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from threading import Lock
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+from sqlglot.optimizer.normalize_identifiers import normalize_identifiers
+
+from database.db_connection import DatabaseSchema
+
+logger = logging.getLogger(__name__)
+
+SQL_DIALECT = "postgres"
+_PARSE_CACHE_SIZE = 256
+
+
+class SQLParseError(ValueError):
+    """Raised when generated SQL cannot be parsed into a single statement"""
+
+
+class SQLRewriteError(ValueError):
+    """Raised when a rewrite (e.g. a parent restriction) cannot be applied safely"""
+
+
+class ParsedQuery:
+    """A parsed, canonicalized SQL query.
+
+    The SQL text is parsed exactly once; every inspection (tables, columns,
+    aggregation) and rewrite (LIMIT, parent restriction) works on the AST.
+    Rewrites return a new ParsedQuery built from a copy of the tree.
+    """
+
+    def __init__(self, expression, original_sql=None):
+        self.expression = expression
+        self.original_sql = original_sql if original_sql is not None else expression.sql(dialect=SQL_DIALECT)
+        self.sql = expression.sql(dialect=SQL_DIALECT)
+        self.cache_key = hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+
+        self.aliases = {}
+        for table in expression.find_all(exp.Table):
+            self.aliases[table.alias_or_name] = table.name
+        self.tables = frozenset(self.aliases.values())
+
+        columns = set()
+        for column in expression.find_all(exp.Column):
+            table_name = self.aliases.get(column.table, column.table)
+            columns.add(f"{table_name}.{column.name}" if table_name else column.name)
+        self.columns = frozenset(columns)
+
+    @classmethod
+    def parse(cls, sql):
+        """Parse and canonicalize raw SQL text"""
+        try:
+            statements = [s for s in sqlglot.parse(sql, read=SQL_DIALECT) if s is not None]
+        except ParseError as e:
+            raise SQLParseError(f"Could not parse SQL: {e}") from e
+
+        if len(statements) != 1:
+            raise SQLParseError(f"Expected exactly one SQL statement, found {len(statements)}")
+
+        expression = statements[0]
+        if not isinstance(expression, exp.Query):
+            raise SQLParseError(f"Only read-only SELECT queries are allowed, got {expression.key.upper()}")
+
+        return cls(_canonicalize(expression), original_sql=sql)
+
+    @property
+    def selects(self):
+        """Top-level SELECT branches (more than one for UNION queries)"""
+        if isinstance(self.expression, exp.SetOperation):
+            return [select for select in _iter_set_operands(self.expression)]
+        return [self.expression]
+
+    @property
+    def has_aggregates(self):
+        """True when a top-level SELECT aggregates its rows (window functions and subqueries do not count)"""
+        return any(_select_aggregates(select) for select in self.selects)
+
+    @property
+    def is_grouped(self):
+        return any(select.args.get("group") is not None for select in self.selects)
+
+    @property
+    def is_aggregate(self):
+        return self.has_aggregates or self.is_grouped
+
+    @property
+    def groups_by_student(self):
+        """True when any SELECT groups by a student's name or roll number, i.e. returns a row per student"""
+        return any(_select_groups_by_student(select) for select in self.selects)
+
+    @property
+    def selects_student_identifiers(self):
+        """True when any projection exposes a student's name or roll number.
+
+        Counting students (``COUNT(DISTINCT roll_no)``) does not expose them;
+        any other aggregate over an identifier (``STRING_AGG(name, ',')``,
+        ``MAX(name)``) does.
+        """
+        for select in self.selects:
+            for projection in select.expressions:
+                if isinstance(projection, exp.Star):
+                    return True
+                for column in projection.find_all(exp.Column):
+                    if isinstance(column.this, exp.Star):
+                        return True
+                    if column.name in ("name", "roll_no") and not isinstance(column.find_ancestor(exp.AggFunc), exp.Count):
+                        return True
+        return False
+
+    @property
+    def has_unique_output_names(self):
+        """False when two result columns may share a name, so they cannot be referenced from a wrapping query.
+
+        Column names come from the first SELECT branch. Unnamed expressions
+        (several may all be called ``count``) and stars over more than one
+        source count as possibly duplicated.
+        """
+        select = self.selects[0]
+        names = select.named_selects
+        named = [name for name in names if name and name != "*"]
+        if len(set(named)) != len(named) or names.count("") > 1:
+            return False
+        return "*" not in names or len(_select_sources(select)) <= 1
+
+    def restricts_to_student(self, roll_no):
+        """True when every student-scoped source of every SELECT branch is restricted to ``roll_no``.
+
+        A source counts as restricted through its own ``roll_no = '<roll_no>'``
+        predicate, through a ``roll_no`` equality with a restricted source, or
+        (for subqueries) when the subquery itself is restricted. Scalar, IN
+        and EXISTS subqueries must be restricted as well.
+        """
+        return all(_select_restricts_to_student(select, roll_no) for select in self.selects) and self.subqueries_restrict_to_student(roll_no)
+
+    def subqueries_restrict_to_student(self, roll_no):
+        """True when every scalar, IN and EXISTS subquery that reads a student-scoped table is restricted to ``roll_no``.
+
+        Such subqueries are never rewritten, so they need their own
+        ``roll_no`` predicate or a correlation with a restricted source of an
+        enclosing SELECT.
+        """
+        return all(_subqueries_restrict_to_student(select, roll_no) for select in self.selects)
+
+    def with_limit(self, max_rows):
+        """Return a copy whose LIMIT is at most ``max_rows``"""
+        current = _limit_value(self.expression)
+        if current is not None and current <= max_rows:
+            return self
+        return ParsedQuery(self.expression.limit(max_rows, copy=True), self.original_sql)
+
+    def with_page(self, offset, page_size):
+        """Return a copy fetching ``page_size`` rows starting ``offset`` rows into this query's result.
+
+        Any LIMIT/OFFSET already on the query bounds the window, so paging
+        never returns rows the original query would not have. Pages follow
+        the query's own ORDER BY.
+        """
+        current_offset = _offset_value(self.expression)
+        if current_offset is None:
+            raise SQLRewriteError("Query has an OFFSET that is not a constant")
+        current_limit = _limit_value(self.expression)
+        if current_limit is not None:
+            page_size = max(0, min(page_size, current_limit - offset))
+        elif self.expression.args.get("limit") is not None:
+            raise SQLRewriteError("Query has a LIMIT that is not a constant")
+
+        expression = self.expression.limit(page_size, copy=True)
+        expression = expression.offset(current_offset + offset, copy=False)
+        return ParsedQuery(expression, self.original_sql)
+
+    def wrapped(self, columns, filters=(), order_by=None, descending=False, limit=None):
+        """Return a query selecting ``columns`` from this one as a subquery.
+
+        ``filters`` are (column, operator, number) triples ANDed in the WHERE
+        clause; NULLs sort last in either direction. Raises SQLRewriteError
+        when the query's output column names are not unique.
+        """
+        if not self.has_unique_output_names:
+            raise SQLRewriteError("Query has duplicate output column names")
+        operators = {"<": exp.LT, "<=": exp.LTE, ">": exp.GT, ">=": exp.GTE, "=": exp.EQ}
+        source = "previous_result"
+
+        def column(name):
+            return exp.column(exp.to_identifier(name, quoted=True), table=source)
+
+        select = exp.select(*[column(name) for name in columns]).from_(self.expression.copy().subquery(source))
+        for name, operator, value in filters:
+            select = select.where(operators[operator](this=column(name), expression=exp.Literal.number(value)), copy=False)
+        if order_by:
+            select = select.order_by(exp.Ordered(this=column(order_by), desc=descending, nulls_first=False), copy=False)
+        if limit is not None:
+            select = select.limit(limit, copy=False)
+        return ParsedQuery(_canonicalize(select), self.original_sql)
+
+    def with_student_restriction(self, roll_no):
+        """Return a copy where every SELECT branch is restricted to one student"""
+        expression = self.expression.copy()
+        branches = list(_iter_set_operands(expression)) if isinstance(expression, exp.SetOperation) else [expression]
+
+        for select in branches:
+            aliases = [
+                alias for alias, source in _select_sources(select)
+                if isinstance(source, exp.Table) and _cte_query(source) is None and _is_student_scoped(source)
+            ]
+            if not aliases:
+                raise SQLRewriteError("Query does not reference a student table that can be restricted")
+            for alias in aliases:
+                condition = exp.column("roll_no", table=alias).eq(exp.Literal.string(roll_no))
+                select.where(condition, append=True, copy=False)
+            if not _select_restricts_to_student(select, roll_no):
+                raise SQLRewriteError("Query reads from a subquery that cannot be restricted")
+            if not _subqueries_restrict_to_student(select, roll_no):
+                raise SQLRewriteError("Query has a nested subquery that is not restricted to the student")
+
+        return ParsedQuery(expression, self.original_sql)
+
+    def sql_for(self, dialect):
+        """The query rendered for another engine, e.g. "duckdb" for the local snapshot"""
+        return self.expression.sql(dialect=dialect)
+
+    def __repr__(self):
+        return f"ParsedQuery({self.sql!r})"
+
+
+_parse_cache = OrderedDict()
+_parse_cache_lock = Lock()
+
+
+def parse_sql(sql):
+    """Parse SQL into a ParsedQuery, reusing earlier parses of identical text"""
+    with _parse_cache_lock:
+        parsed = _parse_cache.get(sql)
+        if parsed is not None:
+            _parse_cache.move_to_end(sql)
+            return parsed
+
+    parsed = ParsedQuery.parse(sql)
+
+    with _parse_cache_lock:
+        _parse_cache[sql] = parsed
+        if len(_parse_cache) > _PARSE_CACHE_SIZE:
+            _parse_cache.popitem(last=False)
+    return parsed
+
+
+def canonicalize_sql(sql):
+    """Return the canonical form of a SQL query"""
+    return parse_sql(sql).sql
+
+
+def _canonicalize(expression):
+    """Normalize identifier case, predicate order and literal order"""
+    expression = normalize_identifiers(expression, dialect=SQL_DIALECT)
+
+    def transform(node):
+        # 'x' = col -> col = 'x'
+        if isinstance(node, exp.EQ) and isinstance(node.this, exp.Literal) and not isinstance(node.expression, exp.Literal):
+            return exp.EQ(this=node.expression, expression=node.this)
+        # col IN ('b', 'a') -> col IN ('a', 'b')
+        if isinstance(node, exp.In) and node.expressions and all(isinstance(e, exp.Literal) for e in node.expressions):
+            node.set("expressions", sorted(node.expressions, key=lambda e: e.sql(dialect=SQL_DIALECT)))
+            return node
+        return node
+
+    expression = expression.transform(transform)
+
+    # a AND b in any order -> sorted conjuncts
+    for clause in list(expression.find_all(exp.Where, exp.Having)):
+        if isinstance(clause.this, exp.And):
+            conjuncts = sorted(clause.this.flatten(), key=lambda e: e.sql(dialect=SQL_DIALECT))
+            clause.set("this", exp.and_(*conjuncts, copy=False))
+
+    return expression
+
+
+def _iter_set_operands(expression):
+    for side in (expression.this, expression.expression):
+        if isinstance(side, exp.SetOperation):
+            yield from _iter_set_operands(side)
+        elif isinstance(side, exp.Subquery):
+            yield side.this
+        else:
+            yield side
+
+
+def _limit_value(expression):
+    limit = expression.args.get("limit")
+    if limit is None:
+        return None
+    value = limit.expression
+    if isinstance(value, exp.Literal) and value.is_int:
+        return int(value.this)
+    return None
+
+
+def _offset_value(expression):
+    """Constant OFFSET of the query, 0 without one, None when it is not a constant"""
+    offset = expression.args.get("offset")
+    if offset is None:
+        return 0
+    value = offset.expression
+    if isinstance(value, exp.Literal) and value.is_int:
+        return int(value.this)
+    return None
+
+
+def _select_sources(select):
+    """(alias, source) for every FROM and JOIN source of ``select``"""
+    from_clause = select.args.get("from") or select.args.get("from_")
+    sources = [from_clause.this] if from_clause is not None else []
+    sources += [join.this for join in select.args.get("joins") or []]
+    return [(source.alias_or_name, source) for source in sources]
+
+
+def _is_student_scoped(source):
+    if isinstance(source, exp.Subquery):
+        return True
+    query = _cte_query(source)
+    if query is not None:
+        return any(table.name in DatabaseSchema.STUDENT_SCOPED_TABLES for table in query.find_all(exp.Table))
+    return isinstance(source, exp.Table) and source.name in DatabaseSchema.STUDENT_SCOPED_TABLES
+
+
+def _cte_query(source):
+    """Query of the CTE a table source refers to, or None for real tables"""
+    if not isinstance(source, exp.Table) or source.db:
+        return None
+    for cte in source.root().find_all(exp.CTE):
+        if cte.alias_or_name == source.name:
+            return cte.this
+    return None
+
+
+def _source_query(source):
+    """Query a derived-table or CTE source reads from, or None for real tables"""
+    return source.this if isinstance(source, exp.Subquery) else _cte_query(source)
+
+
+def _branches(query):
+    return list(_iter_set_operands(query)) if isinstance(query, exp.SetOperation) else [query]
+
+
+def _only_subquery_source(select):
+    """Branches of the subquery ``select`` reads from when it is the only source (see ParsedQuery.wrapped)"""
+    sources = _select_sources(select)
+    if len(sources) == 1 and isinstance(sources[0][1], exp.Subquery):
+        return _branches(sources[0][1].this)
+    return None
+
+
+def _select_aggregates(select):
+    for projection in select.expressions:
+        for aggregate in projection.find_all(exp.AggFunc):
+            # Skip window functions and aggregates that belong to a nested SELECT
+            if aggregate.find_ancestor(exp.Window, exp.Select) is select:
+                return True
+    inner = _only_subquery_source(select)
+    return inner is not None and all(_select_aggregates(branch) for branch in inner)
+
+
+def _group_terms(select):
+    """GROUP BY expressions of ``select``, plus the projections that ordinals (``GROUP BY 1``) and output aliases refer to"""
+    group = select.args.get("group")
+    if group is None:
+        return []
+    projections = select.expressions
+    aliases = {projection.alias: projection.this for projection in projections if isinstance(projection, exp.Alias)}
+    terms = [group]
+    for term in group.expressions:
+        if isinstance(term, exp.Literal) and term.is_int and 1 <= int(term.this) <= len(projections):
+            terms.append(projections[int(term.this) - 1].unalias())
+        elif isinstance(term, exp.Column) and not term.table and term.name in aliases:
+            terms.append(aliases[term.name])
+    return terms
+
+
+def _select_groups_by_student(select):
+    if any(column.name in ("name", "roll_no") for term in _group_terms(select) for column in term.find_all(exp.Column)):
+        return True
+    inner = _only_subquery_source(select)
+    return inner is not None and any(_select_groups_by_student(branch) for branch in inner)
+
+
+def _conjuncts(condition):
+    if condition is None:
+        return []
+    return list(condition.flatten()) if isinstance(condition, exp.And) else [condition]
+
+
+def _select_restricts_to_student(select, roll_no):
+    scoped, restricted = _restricted_sources(select, roll_no)
+    return bool(scoped) and scoped <= restricted
+
+
+def _restricted_sources(select, roll_no, outer=frozenset()):
+    """(student-scoped sources, sources restricted to ``roll_no``) of ``select``.
+
+    ``outer`` holds the restricted sources of enclosing SELECTs, which a
+    correlated subquery may link to.
+    """
+    sources = _select_sources(select)
+    scoped = {alias for alias, source in sources if _is_student_scoped(source)}
+
+    restricted = set(outer) | {
+        alias for alias, source in sources
+        if _source_query(source) is not None and all(_select_restricts_to_student(branch, roll_no) for branch in _branches(_source_query(source)))
+    }
+
+    def source_of(column):
+        if column.table:
+            return column.table
+        # An unqualified roll_no only names a source when there is a single one
+        return next(iter(scoped)) if len(scoped) == 1 else None
+
+    # (condition, sources it may restrict): WHERE and inner-join ON restrict every source,
+    # an outer join's ON only the joined side
+    conditions = [(conjunct, None) for conjunct in _conjuncts(select.args.get("where") and select.args["where"].this)]
+    for join in select.args.get("joins") or []:
+        side = (join.args.get("side") or "").upper()
+        if side == "FULL":
+            continue
+        allowed = {join.this.alias_or_name} if side in ("LEFT", "RIGHT") else None
+        if side == "RIGHT":
+            allowed = {alias for alias, _ in sources} - {join.this.alias_or_name}
+        conditions += [(conjunct, allowed) for conjunct in _conjuncts(join.args.get("on"))]
+
+    links = []
+    for condition, allowed in conditions:
+        if _is_roll_no_predicate(condition, roll_no):
+            column = condition.this if isinstance(condition.this, exp.Column) else condition.expression
+            alias = source_of(column)
+            if alias is not None and (allowed is None or alias in allowed):
+                restricted.add(alias)
+        elif (
+            isinstance(condition, exp.EQ)
+            and all(isinstance(side, exp.Column) and side.name == "roll_no" and side.table for side in (condition.this, condition.expression))
+        ):
+            links.append((condition.this.table, condition.expression.table, allowed))
+
+    # roll_no equalities carry the restriction between joined sources
+    changed = True
+    while changed:
+        changed = False
+        for left, right, allowed in links:
+            for source, target in ((left, right), (right, left)):
+                if source in restricted and target not in restricted and (allowed is None or target in allowed):
+                    restricted.add(target)
+                    changed = True
+
+    return scoped, restricted
+
+
+def _nested_selects(select):
+    """(SELECT, the FROM/JOIN subquery or CTE holding it or None) for every SELECT nested directly in ``select``"""
+    containers = [source for _, source in _select_sources(select) if isinstance(source, exp.Subquery)]
+    for node in select.find_all(exp.Select):
+        if node is select or node.parent_select is not select:
+            continue
+        container = node.parent
+        while container is not select and not isinstance(container, exp.CTE) and not any(container is c for c in containers):
+            container = container.parent
+        yield node, (None if container is select else container)
+
+
+def _subqueries_restrict_to_student(select, roll_no, outer=frozenset()):
+    """True when every scalar, IN and EXISTS subquery under ``select`` that reads a student-scoped table is restricted"""
+    _, restricted = _restricted_sources(select, roll_no, outer)
+    for nested, container in _nested_selects(select):
+        if container is None:
+            scoped, nested_restricted = _restricted_sources(nested, roll_no, restricted)
+            if not scoped <= nested_restricted:
+                return False
+            nested_outer = restricted
+        elif isinstance(container, exp.Subquery) and container.alias_or_name in restricted:
+            # Rows of a restricted derived table all belong to the student
+            nested_outer = {alias for alias, _ in _select_sources(nested)}
+        else:
+            nested_outer = frozenset()
+        if not _subqueries_restrict_to_student(nested, roll_no, nested_outer):
+            return False
+    return True
+
+
+def _is_roll_no_predicate(node, roll_no):
+    if not isinstance(node, exp.EQ):
+        return False
+    column, literal = node.this, node.expression
+    if isinstance(column, exp.Literal):
+        column, literal = literal, column
+    return (
+        isinstance(column, exp.Column)
+        and column.name == "roll_no"
+        and isinstance(literal, exp.Literal)
+        and literal.is_string
+        and literal.this == roll_no
+    )
@@ -0,0 +1,207 @@
+from collections import Counter
+from threading import Lock, Timer
+from config import Config
+import atexit
+import json
+import math
+import os
+import re
+import tempfile
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Dropped from BM25 scoring only; near-exact matching compares every token
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "for", "to", "and", "or", "is", "are", "me", "show", "give",
+    "list", "what", "which", "who", "get", "find", "all", "with", "by", "on", "their", "please"
+}
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9+.]+", text.lower())
+
+class SQLExampleIndex:
+    """BM25 index over validated question -> SQL pairs, persisted as JSON.
+
+    Pairs are added as they succeed in production, so the index grows
+    incrementally; term statistics are updated in place and changes are
+    written to the file in the background, at most once per
+    SQL_EXAMPLE_SAVE_DELAY_SECONDS (and at exit). Each process writes its
+    own temporary file and renames it into place, so concurrent workers
+    never corrupt the file; the last writer wins. ``search`` returns the nearest examples for
+    few-shot prompting and ``find_reusable`` returns stored SQL for a
+    question identical (after normalization) to one already answered.
+    """
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, path=Config.SQL_EXAMPLE_INDEX_PATH, max_entries=Config.SQL_EXAMPLE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._examples = {}
+        self._doc_freq = Counter()
+        self._total_length = 0
+        self._loaded = False
+        self._dirty = False
+        self._save_timer = None
+        self._save_lock = Lock()
+
+    def _key(self, question):
+        return " ".join(tokenize(question))
+
+    def _terms(self, question):
+        return [token for token in tokenize(question) if token not in STOPWORDS]
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error("Could not load SQL example index from %s: %s", self.path, e)
+            return
+        for example in stored.get("examples", []):
+            self._insert(example)
+        logger.info("Loaded %d SQL examples from %s", len(self._examples), self.path)
+
+    def _insert(self, example):
+        terms = Counter(self._terms(example["question"]))
+        self._examples[self._key(example["question"])] = {**example, "terms": terms}
+        self._doc_freq.update(terms.keys())
+        self._total_length += sum(terms.values())
+
+    def _remove(self, key):
+        example = self._examples.pop(key)
+        self._doc_freq.subtract(example["terms"].keys())
+        self._doc_freq += Counter()
+        self._total_length -= sum(example["terms"].values())
+
+    def _save_later(self):
+        # Called with self._lock held; a timer inherited across fork is not alive in the child
+        self._dirty = True
+        if self.path and (self._save_timer is None or not self._save_timer.is_alive()):
+            self._save_timer = Timer(Config.SQL_EXAMPLE_SAVE_DELAY_SECONDS, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def flush(self):
+        """Write pending changes to the index file"""
+        with self._save_lock:
+            with self._lock:
+                self._save_timer = None
+                if not self._dirty or not self.path:
+                    return
+                self._dirty = False
+                examples = [
+                    {name: value for name, value in example.items() if name != "terms"}
+                    for example in self._examples.values()
+                ]
+
+            directory = os.path.dirname(os.path.abspath(self.path))
+            temp_path = None
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, temp_path = tempfile.mkstemp(prefix=".sql_examples.", suffix=".tmp", dir=directory)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump({"version": 1, "examples": examples}, f, indent=1)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                logger.error("Could not save SQL example index to %s: %s", self.path, e)
+                if temp_path and os.path.exists(temp_path):
+                    os.remove(temp_path)
+
+    def add(self, question, sql):
+        """Record a question whose SQL executed successfully; the latest SQL wins"""
+        key = self._key(question)
+        if not key or not sql:
+            return
+        with self._lock:
+            self._ensure_loaded()
+            existing = self._examples.get(key)
+            if existing is not None:
+                if existing["sql"] == sql:
+                    existing["uses"] += 1
+                    self._save_later()
+                    return
+                self._remove(key)
+
+            self._insert({
+                "question": question.strip(),
+                "sql": sql.strip(),
+                "uses": existing["uses"] + 1 if existing else 1,
+                "added_at": time.time()
+            })
+
+            # Evict the least used, oldest examples
+            while len(self._examples) > self.max_entries:
+                victim = min(self._examples, key=lambda k: (self._examples[k]["uses"], self._examples[k]["added_at"]))
+                self._remove(victim)
+
+            self._save_later()
+
+    def search(self, question, k=Config.SQL_EXAMPLE_TOP_K):
+        """Top ``k`` (score, example) pairs by BM25 over the stored questions"""
+        query_terms = set(self._terms(question))
+        with self._lock:
+            self._ensure_loaded()
+            count = len(self._examples)
+            if not count or not query_terms:
+                return []
+            average_length = self._total_length / count or 1
+
+            scored = []
+            for example in self._examples.values():
+                terms = example["terms"]
+                length = sum(terms.values())
+                score = 0.0
+                for term in query_terms:
+                    frequency = terms.get(term, 0)
+                    if not frequency:
+                        continue
+                    idf = math.log(1 + (count - self._doc_freq[term] + 0.5) / (self._doc_freq[term] + 0.5))
+                    score += idf * frequency * (self.K1 + 1) / (
+                        frequency + self.K1 * (1 - self.B + self.B * length / average_length)
+                    )
+                if score > 0:
+                    scored.append((score, {"question": example["question"], "sql": example["sql"]}))
+
+        scored.sort(key=lambda item: -item[0])
+        return scored[:k]
+
+    def find_reusable(self, question):
+        """Stored SQL for the same normalized question (case, punctuation, spacing), else None.
+
+        Only exact matches qualify: one swapped word ("highest"/"lowest",
+        "above"/"below", "S1"/"S2") changes the answer, so similar questions
+        go to the LLM with the stored pairs as few-shot examples instead.
+        """
+        key = self._key(question)
+        with self._lock:
+            self._ensure_loaded()
+            example = self._examples.get(key)
+            return example["sql"] if example is not None else None
+
+    def stats(self):
+        with self._lock:
+            self._ensure_loaded()
+            return {"examples": len(self._examples), "vocabulary": len(self._doc_freq), "path": self.path}
+
+def format_examples(examples):
+    """Prompt section listing retrieved examples, or "" when there are none"""
+    if not examples:
+        return ""
+    lines = ["Similar Questions Answered Before (verified SQL):"]
+    for _, example in examples:
+        lines.append(f'- Question: "{example["question"]}"\n      SQL: {example["sql"]}')
+    return "\n    ".join(lines)
+
+# Shared across requests in this process
+sql_example_index = SQLExampleIndex()
+atexit.register(sql_example_index.flush)
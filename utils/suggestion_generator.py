@@ -1,17 +1,25 @@
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain.chat_models import init_chat_model
 from utils.data_analyzer import analyze_retrieved_data
+from utils.llm_client import invoke_llm
+from utils.suggestion_templates import generate_rule_based_suggestions
 from config import Config
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize LLM
-llm = init_chat_model(Config.LLM_MODEL, model_provider=Config.LLM_PROVIDER)
-
 def generate_smart_suggestions(question, retrieved_data, user_type, conversation_context, parent_student_id=None):
     """Generate intelligent, context-aware suggested questions - updated for new schema"""
     
+    # Deterministic template engine unless the LLM is explicitly configured
+    if Config.SUGGESTION_MODE != "llm":
+        try:
+            suggestions = generate_rule_based_suggestions(question, retrieved_data, user_type, parent_student_id, Config.MAX_SUGGESTIONS)
+            if suggestions:
+                return suggestions
+        except Exception as e:
+            logger.error(f"Error generating rule-based suggestions: {e}")
+        return generate_fallback_suggestions_updated(question, user_type, parent_student_id)
+    
     try:
         # Analyze the retrieved data to understand what information is available
         data_analysis = analyze_retrieved_data(retrieved_data)
@@ -44,7 +52,7 @@ def generate_smart_suggestions(question, retrieved_data, user_type, conversation
         
         Database Structure Notes:
         - Students have separate CGPA for Semester 1 (cgpa_s1) and Semester 2 (cgpa_s2)
-        - Attendance and marks are stored in separate tables for S1 and S2
+        - Attendance and marks for all semesters are stored in one table with a semester column
         - Each semester has different subjects and performance metrics
         - Grade O is the highest performance indicator
         
@@ -78,7 +86,7 @@ def generate_smart_suggestions(question, retrieved_data, user_type, conversation
             HumanMessage(content=suggestions_prompt)
         ]
         
-        response = llm.invoke(messages)
+        response = invoke_llm(messages, agent="suggestion_generator")
         suggested_questions = response.content.strip()
         
         # Add user-type specific suggestions if LLM suggestions are too generic
@@ -0,0 +1,160 @@
+from collections import Counter, namedtuple
+import logging
+import string
+
+logger = logging.getLogger(__name__)
+
+# What a turn looked like: the data shape, who asked and what they were after
+SuggestionSignature = namedtuple("SuggestionSignature", ["shape", "user_type", "intent"])
+
+# Checked in order; the first match becomes the signature's shape
+SHAPE_COLUMNS = [
+    ("cgpa", ("cgpa_s1", "cgpa_s2", "cgpa")),
+    ("attendance", ("attendance_percentage", "attended", "held")),
+    ("grades", ("grade", "grade_point")),
+    ("student_info", ("name", "roll_no"))
+]
+
+INTENT_KEYWORDS = [
+    ("compare", ["compare", "comparison", " vs", "versus", "difference", "improve", "decline", "progress"]),
+    ("rank", ["top", "best", "highest", "lowest", "worst", "rank", "most", "least"]),
+    ("aggregate", ["average", "avg", "mean", "count", "how many", "total", "distribution", "statistics"]),
+    ("chart", ["chart", "graph", "plot", "visual"])
+]
+
+class SuggestionTemplate:
+    """A follow-up question template with the signatures it applies to.
+
+    ``shapes``, ``user_types`` and ``intents`` restrict where the template is
+    used (None means any). Templates whose placeholders cannot be filled from
+    the current turn are skipped.
+    """
+
+    def __init__(self, text, shapes=None, user_types=None, intents=None, weight=1.0):
+        self.text = text
+        self.shapes = set(shapes) if shapes else None
+        self.user_types = set(user_types) if user_types else None
+        self.intents = set(intents) if intents else None
+        self.weight = weight
+        self.fields = {name for _, name, _, _ in string.Formatter().parse(text) if name}
+
+    def score(self, signature):
+        """0 if the template does not apply, otherwise higher is more specific"""
+        if self.shapes is not None and signature.shape not in self.shapes:
+            return 0
+        if self.user_types is not None and signature.user_type not in self.user_types:
+            return 0
+        if self.intents is not None and signature.intent not in self.intents:
+            return 0
+        specificity = sum(1 for restriction in (self.shapes, self.user_types, self.intents) if restriction is not None)
+        return self.weight * (1 + specificity)
+
+    def render(self, params):
+        if any(params.get(field) is None for field in self.fields):
+            return None
+        return self.text.format(**params)
+
+TEMPLATE_LIBRARY = []
+
+def register_template(text, shapes=None, user_types=None, intents=None, weight=1.0):
+    """Add a template to the library used by generate_rule_based_suggestions"""
+    template = SuggestionTemplate(text, shapes, user_types, intents, weight)
+    TEMPLATE_LIBRARY.append(template)
+    return template
+
+# --- CGPA ---
+register_template("Compare my child's CGPA improvement from Semester {first_semester} to Semester {last_semester}", ["cgpa"], ["parent"])
+register_template("Which subjects are affecting my child's overall CGPA the most?", ["cgpa"], ["parent"])
+register_template("Show me my child's detailed subject-wise performance and grade breakdown (O=Outstanding, A+=Excellent)", ["cgpa", "student_info"], ["parent"])
+register_template("Show me students with declining CGPA from S{first_semester} to S{last_semester} who need attention", ["cgpa"], ["faculty"])
+register_template("Compare average class CGPA between Semester {first_semester} and Semester {last_semester}", ["cgpa"], ["faculty"], weight=1.2)
+register_template("Show the top {top_n} students by CGPA improvement from S{first_semester} to S{last_semester}", ["cgpa"], ["faculty"], ["rank", "compare"])
+register_template("What is the CGPA distribution across the class?", ["cgpa"], ["faculty"], ["rank", "lookup"])
+register_template("Identify students with O grades (Outstanding) and those needing improvement", ["cgpa"], ["faculty"])
+register_template("Show a line chart of CGPA progression from S{first_semester} to S{last_semester}", ["cgpa"], None, ["compare", "chart"])
+
+# --- Attendance ---
+register_template("Compare my child's attendance between Semester {first_semester} and Semester {last_semester}", ["attendance"], ["parent"])
+register_template("Which subjects does my child have the lowest attendance in?", ["attendance"], ["parent"], weight=1.2)
+register_template("Show me how my child's attendance correlates with their grades", ["attendance"], ["parent"])
+register_template("Which students have attendance below 75% across all semesters?", ["attendance"], ["faculty"], weight=1.2)
+register_template("Compare attendance patterns between S{first_semester} and S{last_semester} subjects", ["attendance"], ["faculty"])
+register_template("Which students have the lowest attendance in {subject}?", ["attendance"], ["faculty"], ["lookup", "rank", "aggregate"])
+register_template("Identify the correlation between attendance and grade performance (O, A+, etc.)", ["attendance"], ["faculty"])
+register_template("Show a scatter plot of attendance vs CGPA", ["attendance"], ["faculty"], ["aggregate", "chart"])
+
+# --- Grades ---
+register_template("Show me grade distribution comparison between Semester {first_semester} and {last_semester} (O=Outstanding to F=Fail)", ["grades"], None, weight=1.2)
+register_template("Which subjects have the most students achieving O (Outstanding) grades?", ["grades"], ["faculty"])
+register_template("Identify students with significant grade improvements from S{first_semester} to S{last_semester}", ["grades"], ["faculty"])
+register_template("Which students scored below C in {subject}?", ["grades"], ["faculty"], ["lookup", "rank"])
+register_template("Show a pie chart of the grade distribution in {subject}", ["grades"], None, ["lookup", "aggregate"])
+register_template("In which subjects did my child get their best and worst grades?", ["grades"], ["parent"])
+register_template("How do my child's grades compare with the class average grade points?", ["grades", "cgpa"], ["parent"])
+
+# --- Student info ---
+register_template("Sort these students by their CGPA improvement from S{first_semester} to S{last_semester}", ["student_info"], ["faculty"])
+register_template("Show me detailed semester-wise performance for students with O grades (Outstanding)", ["student_info"], ["faculty"])
+register_template("Which of these students show declining performance and need intervention?", ["student_info"], ["faculty"])
+
+# --- General (no recognisable data) ---
+register_template("Show me detailed semester-wise performance analysis for student {student_id}", None, ["parent"], weight=0.5)
+register_template("How does my child's performance compare with class averages (using O=Outstanding scale)?", None, ["parent"], weight=0.5)
+register_template("What subjects need immediate attention across all semesters for my child?", None, ["parent"], weight=0.5)
+register_template("Show me overall semester-wise class performance statistics with grade breakdown", None, ["faculty"], weight=0.5)
+register_template("Identify students who need academic support across all semesters", None, ["faculty"], weight=0.5)
+register_template("Compare performance trends between Semester {first_semester} and Semester {last_semester} using the grade scale", None, ["faculty"], weight=0.5)
+
+def compute_signature(question, retrieved_data, user_type):
+    """Derive the suggestion signature from result columns, user type and question intent"""
+    columns = set(retrieved_data[0].keys()) if retrieved_data else set()
+
+    shape = "general"
+    for candidate, shape_columns in SHAPE_COLUMNS:
+        if columns.intersection(shape_columns):
+            shape = candidate
+            break
+
+    question_lower = f" {question.lower()}"
+    intent = "lookup"
+    for candidate, keywords in INTENT_KEYWORDS:
+        if any(keyword in question_lower for keyword in keywords):
+            intent = candidate
+            break
+
+    return SuggestionSignature(shape, user_type if user_type == "parent" else "faculty", intent)
+
+def extract_template_params(retrieved_data, parent_student_id):
+    """Values used to parameterize templates, taken from the current result set"""
+    semesters = sorted({r.get("semester") for r in retrieved_data if r.get("semester") is not None})
+    subjects = Counter(r.get("subject") for r in retrieved_data if r.get("subject"))
+
+    return {
+        "first_semester": semesters[0] if len(semesters) > 1 else 1,
+        "last_semester": semesters[-1] if len(semesters) > 1 else 2,
+        "subject": subjects.most_common(1)[0][0] if subjects else None,
+        "student_id": parent_student_id,
+        "top_n": 10
+    }
+
+def generate_rule_based_suggestions(question, retrieved_data, user_type, parent_student_id=None, count=3):
+    """Pick and fill the best matching templates; returns the numbered-list format the LLM produces"""
+    signature = compute_signature(question, retrieved_data or [], user_type)
+    params = extract_template_params(retrieved_data or [], parent_student_id)
+    question_lower = question.strip().lower()
+
+    ranked = sorted(
+        ((template.score(signature), index, template) for index, template in enumerate(TEMPLATE_LIBRARY)),
+        key=lambda item: (-item[0], item[1])
+    )
+
+    suggestions = []
+    for score, _, template in ranked:
+        if score <= 0 or len(suggestions) >= count:
+            break
+        text = template.render(params)
+        if text and text.lower() != question_lower and text not in suggestions:
+            suggestions.append(text)
+
+    logger.info("Rule-based suggestions for signature %s: %d selected", tuple(signature), len(suggestions))
+    return "\n".join(f"{i}. {text}" for i, text in enumerate(suggestions, 1))
@@ -0,0 +1,261 @@
+"""Bulk semester report generation for every student (and so every parent).
+
+Student data is fetched with three set-based queries and grouped in memory;
+narratives are then written with bounded parallel LLM calls. Finished
+reports are checkpointed one by one, so an interrupted run resumes where it
+stopped. Run with ``python -m workflows.report_pipeline --help``.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import copy_context
+from langchain_core.messages import HumanMessage, SystemMessage
+from psycopg2.extras import Json
+from database.db_connection import pooled_db_connection, DatabaseSchema
+from utils.llm_client import invoke_llm
+from utils.logging_setup import configure_logging
+from config import Config
+import argparse
+import datetime
+import json
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+def fetch_student_data(semesters=None, roll_nos=None):
+    """All students' details, CGPA and subject rows, grouped by roll_no.
+
+    With ``semesters``, students without CGPA or subject rows in those
+    semesters are left out.
+    """
+    filters, params = [], []
+    if semesters:
+        filters.append("semester = ANY(%s)")
+        params.append(list(semesters))
+    if roll_nos is not None:
+        filters.append("roll_no = ANY(%s)")
+        params.append(list(roll_nos))
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+
+    students = {}
+    with pooled_db_connection() as conn, conn.cursor() as cur:
+        if roll_nos is not None:
+            cur.execute("SELECT roll_no, name, batch, branch FROM student_details WHERE roll_no = ANY(%s) ORDER BY roll_no", (list(roll_nos),))
+        else:
+            cur.execute("SELECT roll_no, name, batch, branch FROM student_details ORDER BY roll_no")
+        for row in cur.fetchall():
+            students[row["roll_no"]] = {**dict(row), "cgpa": {}, "subjects": {}}
+
+        cur.execute(f"SELECT roll_no, semester, cgpa FROM semester_cgpa {where} ORDER BY roll_no, semester", params)
+        for row in cur.fetchall():
+            if row["roll_no"] in students:
+                students[row["roll_no"]]["cgpa"][row["semester"]] = row["cgpa"]
+
+        cur.execute(f"""
+            SELECT roll_no, semester, subject, attended, held, attendance_percentage, grade, grade_point, status
+            FROM attendance_and_marks {where}
+            ORDER BY roll_no, semester, subject
+        """, params)
+        for row in cur.fetchall():
+            student = students.get(row["roll_no"])
+            if student is not None:
+                student["subjects"].setdefault(row["semester"], []).append(dict(row))
+
+    if semesters:
+        # Students with no rows in the requested semesters have nothing to report on
+        students = {roll_no: student for roll_no, student in students.items() if student["cgpa"] or student["subjects"]}
+
+    logger.info("Fetched data for %d students", len(students))
+    return students
+
+def summarize_student(student):
+    """Per-semester figures the narrative is written from"""
+    semesters = {}
+    for semester in sorted(set(student["cgpa"]) | set(student["subjects"])):
+        subjects = student["subjects"].get(semester, [])
+        attendance = [s["attendance_percentage"] for s in subjects if s["attendance_percentage"] is not None]
+        # Grades without a known grade point (grade_point NULL) cannot be ranked
+        graded = sorted(
+            (s for s in subjects if s["grade"] and s["grade_point"] is not None),
+            key=lambda s: s["grade_point"],
+            reverse=True
+        )
+        semesters[semester] = {
+            "cgpa": student["cgpa"].get(semester),
+            "subject_count": len(subjects),
+            "average_attendance": round(sum(attendance) / len(attendance), 1) if attendance else None,
+            "best_subjects": [f"{s['subject']} ({s['grade']})" for s in graded[:2]],
+            "weakest_subjects": [f"{s['subject']} ({s['grade']})" for s in graded[-2:][::-1]] if len(graded) > 2 else [],
+            "low_attendance_subjects": [
+                s["subject"] for s in subjects
+                if s["attendance_percentage"] is not None and s["attendance_percentage"] < 75
+            ]
+        }
+    return semesters
+
+def generate_narrative(student, summary):
+    """LLM-written semester summary addressed to the student's parent"""
+    summary_lines = []
+    for semester, figures in summary.items():
+        summary_lines.append(
+            f"Semester {semester}: CGPA {figures['cgpa']}, {figures['subject_count']} subjects, "
+            f"average attendance {figures['average_attendance']}%, best: {', '.join(figures['best_subjects']) or 'n/a'}, "
+            f"weakest: {', '.join(figures['weakest_subjects']) or 'n/a'}, "
+            f"attendance below 75%: {', '.join(figures['low_attendance_subjects']) or 'none'}"
+        )
+    summary_text = "\n    ".join(summary_lines)
+
+    report_prompt = f"""
+    Write a semester progress summary for the parent of {student['name']} (roll no {student['roll_no']}).
+
+    {DatabaseSchema.get_grade_hierarchy_context()}
+
+    Semester Figures:
+    {summary_text}
+
+    Instructions:
+    1. Address the parent directly in a supportive, professional tone
+    2. Describe the CGPA trend across semesters and what it means
+    3. Highlight strengths, then subjects or attendance that need attention
+    4. End with one or two concrete suggestions
+    5. Keep it under 200 words and use only the figures given
+    """
+
+    messages = [
+        SystemMessage(content="You are an academic advisor writing concise, accurate progress reports for parents."),
+        HumanMessage(content=report_prompt)
+    ]
+    response = invoke_llm(messages, agent="report_generator")
+    return response.content.strip()
+
+class DiskReportStore:
+    """One JSON file per student; existing files mark finished reports"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def completed(self):
+        return {name[:-len(".json")] for name in os.listdir(self.directory) if name.endswith(".json")}
+
+    def save(self, report):
+        path = os.path.join(self.directory, f"{report['roll_no']}.json")
+        with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        os.replace(f"{path}.tmp", path)
+
+class DBReportStore:
+    """Rows in the student_reports table, keyed by (run_id, roll_no)"""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        with pooled_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS student_reports (
+                    run_id TEXT NOT NULL,
+                    roll_no TEXT NOT NULL,
+                    report JSONB NOT NULL,
+                    generated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (run_id, roll_no)
+                );
+            """)
+            conn.commit()
+
+    def completed(self):
+        with pooled_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT roll_no FROM student_reports WHERE run_id = %s", (self.run_id,))
+            return {row["roll_no"] for row in cur.fetchall()}
+
+    def save(self, report):
+        with pooled_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO student_reports (run_id, roll_no, report) VALUES (%s, %s, %s)
+                ON CONFLICT (run_id, roll_no) DO UPDATE SET report = EXCLUDED.report, generated_at = now()
+            """, (self.run_id, report["roll_no"], Json(report, dumps=lambda obj: json.dumps(obj, default=str))))
+            conn.commit()
+
+def parent_roll_nos():
+    """Roll numbers that have a registered parent account"""
+    # Imported here so the pipeline only needs MongoDB when filtering by parent
+    from auth import users_collection
+    return {user["student_id"] for user in users_collection.find({"user_type": "parent"}, {"student_id": 1}) if user.get("student_id")}
+
+def _build_report(student):
+    summary = summarize_student(student)
+    return {
+        "roll_no": student["roll_no"],
+        "name": student["name"],
+        "batch": student.get("batch"),
+        "branch": student.get("branch"),
+        "semesters": summary,
+        "narrative": generate_narrative(student, summary),
+        "generated_at": datetime.datetime.now().isoformat(timespec="seconds")
+    }
+
+def run_report_pipeline(store, semesters=None, workers=Config.REPORT_WORKERS, parents_only=False, limit=None):
+    """Generate and store a report for every student not yet in ``store``; returns run statistics"""
+    started_at = time.monotonic()
+    roll_nos = parent_roll_nos() if parents_only else None
+    students = fetch_student_data(semesters, roll_nos)
+
+    done = store.completed()
+    pending = [student for roll_no, student in students.items() if roll_no not in done]
+    already_done = len(students) - len(pending)
+    if limit is not None:
+        pending = pending[:limit]
+    logger.info("Reports: %d students, %d already done, %d to generate with %d workers", len(students), already_done, len(pending), workers)
+
+    generated, failed = 0, []
+    generation_started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report") as executor:
+        futures = {executor.submit(copy_context().run, _build_report, student): student["roll_no"] for student in pending}
+        for future in as_completed(futures):
+            roll_no = futures[future]
+            try:
+                store.save(future.result())
+                generated += 1
+            except Exception as e:
+                # Not checkpointed, so the next run retries it
+                logger.error("Report for %s failed: %s", roll_no, e)
+                failed.append(roll_no)
+
+            finished = generated + len(failed)
+            if finished % Config.REPORT_PROGRESS_EVERY == 0 or finished == len(pending):
+                elapsed = time.monotonic() - generation_started_at
+                logger.info("Reports: %d/%d done, %.1f reports/minute", finished, len(pending), generated / elapsed * 60)
+
+    generation_seconds = time.monotonic() - generation_started_at
+    stats = {
+        "students": len(students),
+        "skipped": already_done,
+        "generated": generated,
+        "failed": failed,
+        "elapsed_seconds": round(time.monotonic() - started_at, 1),
+        "reports_per_minute": round(generated / generation_seconds * 60, 1) if generated and generation_seconds else 0.0
+    }
+    logger.info("Report run finished: %s generated, %d failed, %s reports/minute", stats['generated'], len(failed), stats['reports_per_minute'])
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate semester reports for every student")
+    parser.add_argument("--output", default=Config.REPORT_OUTPUT_DIR, help="directory for per-student JSON reports")
+    parser.add_argument("--db-run", help="store reports in the student_reports table under this run id instead of on disk")
+    parser.add_argument("--semesters", type=int, nargs="+", help="semesters to include (default: all)")
+    parser.add_argument("--workers", type=int, default=Config.REPORT_WORKERS, help="parallel LLM calls")
+    parser.add_argument("--parents-only", action="store_true", help="only students with a registered parent account")
+    parser.add_argument("--limit", type=int, help="generate at most this many reports in this run")
+    args = parser.parse_args()
+
+    configure_logging()
+    store = DBReportStore(args.db_run) if args.db_run else DiskReportStore(args.output)
+    stats = run_report_pipeline(store, args.semesters, args.workers, args.parents_only, args.limit)
+
+    print("\n📊 Report Generation Summary:")
+    print(f"  Students: {stats['students']}, already done: {stats['skipped']}")
+    print(f"  Generated: {stats['generated']}, failed: {len(stats['failed'])}")
+    print(f"  Throughput: {stats['reports_per_minute']} reports/minute ({stats['elapsed_seconds']}s total)")
+    if stats["failed"]:
+        print(f"  ⚠️ Re-run to retry: {', '.join(stats['failed'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+from threading import Lock, Thread
+from database.db_connection import pooled_db_connection
+from database.snapshot import snapshot_store
+from utils.llm_client import get_llm
+from utils.sql_canonicalizer import parse_sql
+from utils.sql_example_index import sql_example_index
+from agents.sql_generator import FALLBACK_SQL_QUERY
+from workflows.multi_agent_workflow import get_compiled_workflow, run_synthetic_request, SYNTHETIC_SQL
+from config import Config
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class WarmupStatus:
+    """Per-component warm-up state: pending, running, ok, failed or skipped"""
+
+    def __init__(self, components):
+        self._lock = Lock()
+        self._components = {name: {"state": "pending"} for name in components}
+        self.started_at = None
+        self.finished_at = None
+
+    def update(self, name, state, duration_seconds=None, error=None, **details):
+        with self._lock:
+            entry = {"state": state, **details}
+            if duration_seconds is not None:
+                entry["duration_ms"] = round(duration_seconds * 1000, 1)
+            if error is not None:
+                entry["error"] = error
+            self._components[name] = entry
+
+    def is_ready(self):
+        """Ready once every required component is ok (optional ones may also be skipped or have failed)"""
+        with self._lock:
+            return self.finished_at is not None and all(
+                entry["state"] == "ok"
+                for name, entry in self._components.items() if name in Config.WARMUP_REQUIRED_COMPONENTS
+            )
+
+    def failed_required(self):
+        """Required components whose last warm-up attempt failed"""
+        with self._lock:
+            return [
+                name for name, entry in self._components.items()
+                if name in Config.WARMUP_REQUIRED_COMPONENTS and entry["state"] == "failed"
+            ]
+
+    def snapshot(self):
+        with self._lock:
+            components = {name: dict(entry) for name, entry in self._components.items()}
+            started_at, finished_at = self.started_at, self.finished_at
+        return {
+            "ready": self.is_ready(),
+            "warmup_ms": round((finished_at - started_at) * 1000, 1) if started_at and finished_at else None,
+            "components": components
+        }
+
+def _warm_graph():
+    get_compiled_workflow()
+    return {"mode": Config.WORKFLOW_MODE}
+
+def _warm_database():
+    with pooled_db_connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT 1 AS ok")
+        cur.fetchone()
+    return {}
+
+def _warm_llm_clients():
+    models = sorted({tier["model"] for tier in Config.LLM_TIERS.values()})
+    for model in models:
+        client = get_llm(model)
+        if Config.WARMUP_LLM_PING:
+            # Opens the provider's HTTP connection pool at the cost of a one-token call
+            client.invoke("ping", max_tokens=1)
+    return {"models": models, "pinged": Config.WARMUP_LLM_PING}
+
+def _warm_caches():
+    # Parsing the fixed queries also loads sqlglot's dialect tables
+    for sql in (FALLBACK_SQL_QUERY, SYNTHETIC_SQL):
+        parse_sql(sql)
+    if Config.QUERY_BACKEND == "duckdb" and snapshot_store.is_available():
+        snapshot_store.execute("SELECT 1")
+    return {"sql_examples": sql_example_index.stats()["examples"], "snapshot": snapshot_store.stats()}
+
+def _warm_synthetic_request():
+    result = run_synthetic_request()
+    if not result.get("retrieved_data"):
+        raise RuntimeError("synthetic request returned no data")
+    return {"answer_chars": len(result.get("answer", ""))}
+
+# Run in order; the synthetic request goes last so it exercises everything warmed above
+WARMUP_STEPS = [
+    ("graph", _warm_graph),
+    ("database", _warm_database),
+    ("llm_clients", _warm_llm_clients),
+    ("caches", _warm_caches),
+    ("synthetic_request", _warm_synthetic_request)
+]
+
+warmup_status = WarmupStatus([name for name, _ in WARMUP_STEPS])
+
+def _run_step(name, step, attempt=1):
+    warmup_status.update(name, "running", attempt=attempt)
+    started_at = time.monotonic()
+    try:
+        details = step() or {}
+        warmup_status.update(name, "ok", time.monotonic() - started_at, attempt=attempt, **details)
+    except Exception as e:
+        logger.error("Warm-up step %s failed (attempt %d): %s", name, attempt, e)
+        warmup_status.update(name, "failed", time.monotonic() - started_at, error=str(e), attempt=attempt)
+
+def run_warmup():
+    """Warm every component in turn, recording state and timing in ``warmup_status``.
+
+    Required components that fail are retried with exponential backoff
+    until they succeed, so a dependency that was down at startup does not
+    keep /readyz at 503 for the life of the process.
+    """
+    logger.info("=== WARM-UP STARTED ===")
+    warmup_status.started_at = time.monotonic()
+
+    for name, step in WARMUP_STEPS:
+        _run_step(name, step)
+    warmup_status.finished_at = time.monotonic()
+
+    attempt, delay = 1, Config.WARMUP_RETRY_INITIAL_SECONDS
+    while warmup_status.failed_required():
+        failed = warmup_status.failed_required()
+        logger.warning("Retrying warm-up of %s in %.0fs", ", ".join(failed), delay)
+        time.sleep(delay)
+        attempt += 1
+        # Steps keep their order, so a retried synthetic request runs after the database it needs
+        for name, step in WARMUP_STEPS:
+            if name in failed:
+                _run_step(name, step, attempt)
+        warmup_status.finished_at = time.monotonic()
+        delay = min(delay * 2, Config.WARMUP_RETRY_MAX_SECONDS)
+
+    snapshot = warmup_status.snapshot()
+    logger.info("=== WARM-UP FINISHED in %sms, ready: %s ===", snapshot['warmup_ms'], snapshot['ready'])
+    return snapshot
+
+def start_warmup():
+    """Run the warm-up in a background thread so liveness checks answer meanwhile"""
+    thread = Thread(target=run_warmup, name="warmup", daemon=True)
+    thread.start()
+    return thread